@@ -0,0 +1,223 @@
+# autosave.py
+"""
+Saving the level creator's map on a background thread.
+
+The UI thread only takes a snapshot: the grid is split into bands of
+BAND_ROWS rows, and only the bands edited since the previous snapshot are
+copied (the rest are shared with it as immutable bytes). A single worker
+thread then serializes the snapshot and writes it atomically: to a
+temporary file in the same directory, flushed to disk, then renamed over
+the target, so a crash mid-save never leaves a half-written map.
+
+Text levels are encoded band by band, and a band's text is reused until
+the band changes; their spawn point and exit target go to a sidecar
+(level_format.meta_path). If saves to one path pile up, only the newest is
+written.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fileio import atomic_write
+from level_format import (BINARY_EXTENSION, LevelData, encode_meta, encode_text,
+                          meta_path, write_binary)
+
+BAND_ROWS = 64  # rows per snapshot band
+
+
+class MapSnapshot:
+    """
+    An immutable copy of a (rows, cols) tile grid, as a tuple of bytes
+    bands of BAND_ROWS rows each (the last may be shorter).
+    """
+
+    def __init__(self, rows, cols, bands):
+        self.rows = rows
+        self.cols = cols
+        self.bands = bands
+
+    def tiles(self):
+        return b"".join(self.bands)
+
+
+class SaveResult:
+    """
+    Outcome of one background save: the path, the error raised while
+    writing (None on success), the seconds the write took, and whatever
+    the job's `then` returned, or the error it raised as then_error. A
+    failing `then` doesn't make the save itself fail.
+    """
+
+    def __init__(self, path, error=None, seconds=0.0, value=None, autosave=False,
+                 then_error=None):
+        self.path = path
+        self.error = error
+        self.seconds = seconds
+        self.value = value
+        self.autosave = autosave
+        self.then_error = then_error
+
+
+class _Job:
+    def __init__(self, snapshot, path, spawn_point, target_exits, layout, autosave, remove, then):
+        self.snapshot = snapshot
+        self.path = path
+        self.spawn_point = spawn_point
+        self.target_exits = target_exits
+        self.layout = layout
+        self.autosave = autosave
+        self.remove = remove
+        self.then = then
+
+
+class MapSaver:
+    """
+    Writes MapSnapshots on a background thread.
+
+    Call mark_rows() for every edit, snapshot() then save() to queue a
+    write, and results() every frame to collect finished saves. close()
+    waits for the queued saves and stops the thread.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._dirty = set()  # bands edited since the last snapshot
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()  # path -> newest _Job not started yet
+        self._busy = False
+        self._closing = False
+        self._results = []
+        self._thread = None
+        # Worker-only: band index -> (band bytes, encoded text), and the
+        # snapshot last written to each path
+        self._text_cache = {}
+        self._written = {}
+
+    def mark_rows(self, first, last):
+        """Note that rows first..last (inclusive) have been edited."""
+        self._dirty.update(range(first // BAND_ROWS, last // BAND_ROWS + 1))
+
+    def snapshot(self, grid):
+        """
+        An immutable MapSnapshot of grid, copying only the bands edited
+        since the previous snapshot. Returns the previous snapshot itself
+        if nothing changed.
+        """
+        rows, cols = grid.shape
+        previous = self._snapshot
+        if previous is not None and (previous.rows, previous.cols) == (rows, cols):
+            if not self._dirty:
+                return previous
+            bands = list(previous.bands)
+            stale = self._dirty
+        else:
+            bands = [None] * -(-rows // BAND_ROWS)
+            stale = range(len(bands))
+        for band in stale:
+            if band < len(bands):
+                bands[band] = grid[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes()
+        self._snapshot = MapSnapshot(rows, cols, tuple(bands))
+        self._dirty = set()
+        return self._snapshot
+
+    def save(self, snapshot, path, spawn_point=None, target_exits=None, layout="raw",
+             autosave=False, remove=None, then=None):
+        """
+        Queue snapshot to be written to path; returns at once. Binary
+        levels are written in the given layout ("raw", "rle" or
+        "chunked", see level_format.level_layout()). An
+        autosave of a snapshot already written there is skipped. After a
+        successful write the file `remove` (if given) is deleted and
+        then() is called, still on the worker thread; its return value
+        ends up in the SaveResult.
+        """
+        job = _Job(snapshot, path, spawn_point, target_exits, layout, autosave, remove, then)
+        with self._cond:
+            self._jobs.pop(path, None)
+            self._jobs[path] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="map-saver", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    @property
+    def pending(self):
+        """True while saves are queued or being written."""
+        with self._cond:
+            return bool(self._jobs) or self._busy
+
+    def results(self):
+        """SaveResults of the saves finished since the last call."""
+        with self._cond:
+            results = self._results
+            self._results = []
+        return results
+
+    def close(self):
+        """Wait for every queued save to be written, then stop the thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closing:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                _, job = self._jobs.popitem(last=False)
+                self._busy = True
+            result = self._write(job)
+            with self._cond:
+                self._busy = False
+                if result is not None:
+                    self._results.append(result)
+
+    def _write(self, job):
+        if job.autosave and self._written.get(job.path) is job.snapshot:
+            return None
+        start = time.perf_counter()
+        try:
+            atomic_write(job.path, lambda f: self._serialize(job, f))
+            if not job.path.endswith(BINARY_EXTENSION):
+                self._write_meta(job)
+            self._written[job.path] = job.snapshot
+            if job.remove is not None:
+                for path in (job.remove, meta_path(job.remove)):
+                    if os.path.exists(path):
+                        os.remove(path)
+        except Exception as exc:
+            return SaveResult(job.path, exc, time.perf_counter() - start, autosave=job.autosave)
+        result = SaveResult(job.path, None, time.perf_counter() - start, autosave=job.autosave)
+        if job.then is not None:
+            try:
+                result.value = job.then()
+            except Exception as exc:
+                result.then_error = exc
+        return result
+
+    def _write_meta(self, job):
+        """Write (or remove) the sidecar of a text map."""
+        meta = encode_meta(job.spawn_point, job.target_exits)
+        if meta is not None:
+            atomic_write(meta_path(job.path), lambda f: f.write(meta))
+        elif os.path.exists(meta_path(job.path)):
+            os.remove(meta_path(job.path))
+
+    def _serialize(self, job, f):
+        snapshot = job.snapshot
+        if job.path.endswith(BINARY_EXTENSION):
+            data = LevelData(snapshot.rows, snapshot.cols, snapshot.tiles(),
+                             job.spawn_point, job.target_exits)
+            write_binary(f, data, rle=job.layout == "rle", chunked=job.layout == "chunked")
+            return
+        for index, band in enumerate(snapshot.bands):
+            cached = self._text_cache.get(index)
+            if cached is None or cached[0] is not band:
+                cached = self._text_cache[index] = (band, encode_text(band, snapshot.cols))
+            f.write(cached[1])
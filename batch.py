@@ -0,0 +1,204 @@
+# batch.py
+"""
+Play many headless runs of levels in parallel and collect the results.
+
+A run is a map file plus a schedule of scripted skill assignments, each
+(tick, lemming id, skill): the skill is given to the lemming with that
+spawn-order id (0 = first spawned) once the level has taken `tick` steps,
+exactly as a click would. Runs are spread over a ProcessPoolExecutor with
+one worker per core.
+
+Maps are converted once, in the parent, to raw binary levels in a
+temporary directory. Every worker opens them through a copy-on-write mmap
+(see level_format.load_binary), so all runs share the same read-only pages
+in the OS page cache, tile edits made by diggers and builders stay private
+to their run, and no map is re-parsed or pickled per run.
+Chunked levels are used as they are: each run streams its own blocks
+(see chunked_tilemap).
+
+    python batch.py level1_map.txt other_map.txt --schedules schedules.json
+
+where schedules.json is either a list of schedules or an object mapping
+names to schedules, and each schedule is a list of [tick, lemming_id, skill].
+Every map is played with every schedule.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import json
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from level import Level
+from level_format import (
+    BINARY_EXTENSION, LevelData, is_chunked_level, load_level, save_binary,
+)
+
+MAX_TICKS = 60 * 60 * 5  # five minutes of game time at 60 ticks per second
+SCREEN_SIZE = (800, 600)  # camera size; nothing is drawn
+
+
+class RunSpec:
+    """
+    One run to play: the map file, the skill schedule, an optional exit
+    target (defaults to the level's own), the tick budget and the engine.
+    """
+
+    def __init__(self, map_file, schedule=(), target_exits=None,
+                 max_ticks=MAX_TICKS, engine="sprites", name=None):
+        self.map_file = map_file
+        self.schedule = sorted(tuple(action) for action in schedule)
+        self.target_exits = target_exits
+        self.max_ticks = max_ticks
+        self.engine = engine
+        self.name = name
+
+
+def play(level, schedule, max_ticks):
+    """
+    Step level until it is completed or failed, or max_ticks have passed,
+    applying the schedule's assignments on the way. Returns the number of
+    assignments whose lemming was not in play at that tick.
+    """
+    missed = 0
+    pending = iter(schedule)
+    action = next(pending, None)
+    while level.tick < max_ticks and not (level.completed or level.failed):
+        while action is not None and action[0] <= level.tick:
+            _, lemming_id, skill = action
+            if not level.assign_skill_to(lemming_id, skill):
+                missed += 1
+            action = next(pending, None)
+        # Run straight to the next assignment (or the budget) in one go
+        stop = max_ticks if action is None else min(max_ticks, max(action[0], level.tick + 1))
+        level.step(stop - level.tick)
+    return missed
+
+
+def run_one(spec, map_file=None):
+    """
+    Play one RunSpec headless and return its result dict. map_file, if
+    given, is loaded in place of spec.map_file (the shared binary copy).
+    """
+    result = {
+        "map": spec.map_file,
+        "name": spec.name,
+        "completed": False,
+        "exits": 0,
+        "score": 0,
+        "ticks": 0,
+        "missed_assignments": 0,
+        "failure": None,
+    }
+    try:
+        level = Level(map_file or spec.map_file, *SCREEN_SIZE,
+                      target_exits=spec.target_exits, engine=spec.engine,
+                      headless=True, fast_forward=spec.engine == "sprites", quiet=True)
+        result["missed_assignments"] = play(level, spec.schedule, spec.max_ticks)
+    except Exception as exc:
+        result["failure"] = f"error: {type(exc).__name__}: {exc}"
+        return result
+
+    result["completed"] = level.completed
+    result["exits"] = level.exit_count
+    result["score"] = level.get_score()
+    result["ticks"] = level.tick
+    if level.failed:
+        result["failure"] = "failed"
+    elif not level.completed:
+        result["failure"] = "timeout"
+    return result
+
+
+def _run_shared(args):
+    spec, shared_map = args
+    return run_one(spec, shared_map)
+
+
+def _share_maps(specs, directory):
+    """
+    Write a raw (mmap-able) binary copy of every distinct map into
+    directory. Returns {original path: binary path}.
+    """
+    shared = {}
+    for spec in specs:
+        if spec.map_file in shared:
+            continue
+        if is_chunked_level(spec.map_file):
+            shared[spec.map_file] = spec.map_file  # already streamed, never loaded whole
+            continue
+        data = load_level(spec.map_file)
+        path = os.path.join(directory, f"map{len(shared)}{BINARY_EXTENSION}")
+        save_binary(path, LevelData(data.rows, data.cols, bytes(data.tiles),
+                                    data.spawn_point, data.target_exits))
+        shared[spec.map_file] = path
+    return shared
+
+
+def run_batch(specs, workers=None):
+    """
+    Play every RunSpec across a process pool (one worker per core by
+    default) and return their result dicts in the same order.
+    """
+    specs = list(specs)
+    if not specs:
+        return []
+    workers = workers or os.cpu_count() or 1
+    directory = tempfile.mkdtemp(prefix="pplv_batch_")
+    try:
+        shared = _share_maps(specs, directory)
+        jobs = [(spec, shared[spec.map_file]) for spec in specs]
+        if workers == 1:
+            return [_run_shared(job) for job in jobs]
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            return list(pool.map(_run_shared, jobs))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _load_schedules(path):
+    """Read a schedules file into a list of (name, schedule)."""
+    with open(path) as f:
+        schedules = json.load(f)
+    if isinstance(schedules, dict):
+        return list(schedules.items())
+    return [(f"schedule{i}", schedule) for i, schedule in enumerate(schedules)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play PixelPioneers levels headless in parallel")
+    parser.add_argument("maps", nargs="+", help="level files to play")
+    parser.add_argument("--schedules", metavar="FILE",
+                        help="JSON skill schedules (default: one run with no skills)")
+    parser.add_argument("--target", type=int, help="exits needed to win (default: the level's)")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--engine", choices=("sprites", "swarm"), default="sprites")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--output", metavar="FILE", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    schedules = _load_schedules(args.schedules) if args.schedules else [("none", [])]
+    specs = [
+        RunSpec(map_file, schedule, target_exits=args.target,
+                max_ticks=args.max_ticks, engine=args.engine, name=name)
+        for map_file in args.maps
+        for name, schedule in schedules
+    ]
+    results = run_batch(specs, args.workers)
+
+    print(f"{'map':<24}{'schedule':<16}{'exits':>7}{'score':>8}{'ticks':>8}  result")
+    for r in results:
+        outcome = "completed" if r["completed"] else r["failure"]
+        print(f"{os.path.basename(r['map']):<24}{r['name']:<16}"
+              f"{r['exits']:>7}{int(r['score']):>8}{r['ticks']:>8}  {outcome}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+# benchmark.py
+"""
+Benchmarks for the simulation and rendering hot paths.
+
+Everything runs headless against offscreen Surfaces (SDL dummy video
+driver). Each case reports calls per second, per-call time percentiles and
+the peak memory traced by tracemalloc during setup plus a few calls
+(Python and NumPy allocations; SDL surface memory is not included).
+
+    python benchmark.py                      # full run, prints a table
+    python benchmark.py --quick              # smaller sizes for a fast check
+    python benchmark.py --only draw --output bench.json
+    python benchmark.py --compare old.json   # show speedups against a previous run
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pygame
+
+from tilemap import TileMap, TILE_SIZE, SOLID, EMPTY
+from level import Level
+from swarm import FALLING
+from ui import SkillToolbar
+from level_format import load_text, save_binary
+
+SCREEN_SIZE = (800, 600)
+LEMMING_COUNTS = (10, 100, 1000, 10000)
+MAP_SIZES = ((30, 15), (200, 100), (500, 500), (2000, 2000))
+QUICK_LEMMING_COUNTS = (10, 100, 1000)
+QUICK_MAP_SIZES = ((30, 15), (200, 100))
+
+
+def _write_map(directory, cols, rows, seed=0):
+    """
+    Write a synthetic cols × rows map: a floor every 8 rows with gaps and
+    walls, a few exits, and a solid bottom row. Returns the file path.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for row in range(rows):
+        if row == rows - 1:
+            line = ["#"] * cols
+        elif row % 8 == 7:
+            line = ["." if rng.random() < 0.05 else "#" for _ in range(cols)]
+        else:
+            line = ["#" if rng.random() < 0.01 else "." for _ in range(cols)]
+            if row % 8 == 6 and cols > 4:
+                line[rng.randrange(cols)] = "E"
+        lines.append("".join(line))
+    path = os.path.join(directory, f"bench_{cols}x{rows}.txt")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+class _LazyMaps:
+    """
+    Benchmark maps written to directory the first time a case asks for
+    them, so cases left out by --only never pay for building their maps.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._paths = {}
+
+    def text(self, cols, rows):
+        key = (cols, rows, "text")
+        if key not in self._paths:
+            self._paths[key] = _write_map(self.directory, cols, rows)
+        return self._paths[key]
+
+    def binary(self, cols, rows):
+        key = (cols, rows, "binary")
+        if key not in self._paths:
+            text_path = self.text(cols, rows)
+            path = text_path[:-len(".txt")] + ".pplv"
+            save_binary(path, load_text(text_path))
+            self._paths[key] = path
+        return self._paths[key]
+
+
+def _load_tilemap(path):
+    return TileMap(path, quiet=True)
+
+
+def _make_level(path, engine="sprites"):
+    level = Level(path, *SCREEN_SIZE, target_exits=10**9,
+                  engine=engine, headless=True, quiet=True)
+    level.spawn_interval = float("inf")  # populated up front instead
+    return level
+
+
+def _floor_positions(tilemap, count, seed=0):
+    """
+    Random midbottom positions standing on solid tiles with air above.
+    """
+    rng = random.Random(seed)
+    spots = [
+        (col, row)
+        for row in range(1, tilemap.rows)
+        for col in range(tilemap.cols)
+        if tilemap.get_tile(col, row) == SOLID and tilemap.get_tile(col, row - 1) == EMPTY
+    ]
+    return [
+        (col * TILE_SIZE + TILE_SIZE // 2, row * TILE_SIZE)
+        for col, row in (rng.choice(spots) for _ in range(count))
+    ]
+
+
+def _populate(level, count):
+    for i, pos in enumerate(_floor_positions(level.tilemap, count)):
+        if level.swarm is not None:
+            level.swarm.spawn(pos)
+        else:
+            level.lemmings.spawn(pos, i)
+
+
+# ----------------------------------------------------------------------
+# Cases: each setup returns a zero-argument callable timed per call
+# ----------------------------------------------------------------------
+
+def _setup_level_update(path, count, engine):
+    level = _make_level(path, engine)
+    _populate(level, count)
+    return level.update
+
+
+def _setup_lemming_update(path, count):
+    level = _make_level(path)
+    _populate(level, count)
+    lemmings = list(level.lemmings)
+    tilemap = level.tilemap
+    blockers = level.blockers
+
+    def run():
+        for lemming in lemmings:
+            lemming.update(tilemap, blockers)
+    return run
+
+
+def _setup_lemming_draw(path, count, engine):
+    level = _make_level(path, engine)
+    _populate(level, count)
+    # Every fourth lemming falls with its umbrella open
+    if level.swarm is not None:
+        slots = level.swarm.live_slots()[::4]
+        level.swarm.state[slots] = FALLING
+        level.swarm.umbrella[slots] = True
+    else:
+        for lemming in list(level.lemmings)[::4]:
+            lemming.state = "falling"
+            lemming.has_umbrella = True
+    surface = pygame.Surface(SCREEN_SIZE)
+    max_x = max(0, level.tilemap.width - SCREEN_SIZE[0])
+    frame = [0]
+
+    def run():
+        frame[0] += 1
+        level.camera.x = frame[0] * 5 % (max_x + 1)
+        level.draw_lemmings(surface)
+    return run
+
+
+def _setup_tilemap_draw(path):
+    tilemap = _load_tilemap(path)
+    surface = pygame.Surface(SCREEN_SIZE)
+    max_x = max(0, tilemap.width - SCREEN_SIZE[0])
+    max_y = max(0, tilemap.height - SCREEN_SIZE[1])
+    frame = [0]
+
+    def run():
+        # Pan diagonally so chunk rendering shows up in the tail percentiles
+        frame[0] += 1
+        offset = (frame[0] * 7 % (max_x + 1), frame[0] * 3 % (max_y + 1))
+        surface.fill((0, 0, 0))
+        tilemap.draw(surface, offset)
+    return run
+
+
+def _setup_toolbar_draw(path):
+    level = _make_level(path)
+    toolbar = SkillToolbar()
+    toolbar.selected_skill = "dig"
+    surface = pygame.Surface(SCREEN_SIZE)
+    return lambda: toolbar.draw(surface, level)
+
+
+def _setup_map_load(path):
+    return lambda: _load_tilemap(path)
+
+
+def build_cases(directory, quick=False):
+    """
+    Return a list of (name, params, setup, calls) tuples. Maps are
+    written to directory by the setups that use them.
+    """
+    counts = QUICK_LEMMING_COUNTS if quick else LEMMING_COUNTS
+    sizes = QUICK_MAP_SIZES if quick else MAP_SIZES
+    maps = _LazyMaps(directory)
+
+    def sim_map():
+        return maps.text(200, 100)
+
+    cases = []
+    for count in counts:
+        calls = max(20, min(300, 200000 // count))
+        for engine in ("sprites", "swarm"):
+            cases.append((
+                "level_update", {"lemmings": count, "engine": engine},
+                lambda c=count, e=engine: _setup_level_update(sim_map(), c, e), calls,
+            ))
+        cases.append((
+            "lemming_update", {"lemmings": count},
+            lambda c=count: _setup_lemming_update(sim_map(), c), calls,
+        ))
+        for engine in ("sprites", "swarm"):
+            cases.append((
+                "lemming_draw", {"lemmings": count, "engine": engine},
+                lambda c=count, e=engine: _setup_lemming_draw(sim_map(), c, e), calls,
+            ))
+    for cols, rows in sizes:
+        cases.append((
+            "tilemap_draw", {"cols": cols, "rows": rows},
+            lambda c=cols, r=rows: _setup_tilemap_draw(maps.text(c, r)), 300,
+        ))
+        cases.append((
+            "map_load", {"cols": cols, "rows": rows},
+            lambda c=cols, r=rows: _setup_map_load(maps.text(c, r)),
+            5 if cols * rows > 10**6 else 20,
+        ))
+        cases.append((
+            "map_load_binary", {"cols": cols, "rows": rows},
+            lambda c=cols, r=rows: _setup_map_load(maps.binary(c, r)), 20,
+        ))
+    cases.append(("toolbar_draw", {}, lambda: _setup_toolbar_draw(sim_map()), 500))
+    return cases
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_case(name, params, setup, calls, warmup=3):
+    """
+    Time `calls` invocations of the callable built by setup, then repeat
+    setup plus a few calls under tracemalloc to find peak memory.
+    """
+    run = setup()
+    for _ in range(warmup):
+        run()
+    times = []
+    clock = time.perf_counter
+    for _ in range(calls):
+        start = clock()
+        run()
+        times.append(clock() - start)
+    del run
+
+    tracemalloc.start()
+    run = setup()
+    for _ in range(warmup):
+        run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del run
+
+    times.sort()
+    total = sum(times)
+    return {
+        "name": name,
+        "params": params,
+        "calls": calls,
+        "per_sec": calls / total if total else float("inf"),
+        "mean_ms": total / calls * 1000,
+        "p50_ms": _percentile(times, 50) * 1000,
+        "p95_ms": _percentile(times, 95) * 1000,
+        "p99_ms": _percentile(times, 99) * 1000,
+        "max_ms": times[-1] * 1000,
+        "peak_mem_kib": peak / 1024,
+    }
+
+
+def _case_key(result):
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_params(params):
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+def print_results(results, baseline=None):
+    base = {_case_key(r): r for r in (baseline or [])}
+    header = f"{'case':<16}{'params':<28}{'per sec':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}"
+    if base:
+        header += f"{'speedup':>9}"
+    print(header)
+    for r in results:
+        line = (
+            f"{r['name']:<16}{_format_params(r['params']):<28}"
+            f"{r['per_sec']:>11.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+            f"{r['p99_ms']:>10.3f}{r['peak_mem_kib']:>11.0f}"
+        )
+        old = base.get(_case_key(r))
+        if old is not None:
+            line += f"{old['mean_ms'] / r['mean_ms']:>8.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PixelPioneers benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON file from a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    pygame.font.init()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, params, setup, calls in build_cases(directory, args.quick):
+            if args.only and args.only not in name:
+                continue
+            results.append(run_case(name, params, setup, calls))
+            print(f"  {name} {_format_params(params)} done", file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# chunked_tilemap.py
+"""
+A TileMap streamed from disk, for worlds too big to keep in memory
+(e.g. 100k × 1k tiles).
+
+The level must be a chunked binary level (see level_format), which stores
+the tiles in CHUNK_TILES × CHUNK_TILES blocks. A block is read the first
+time one of its tiles is needed and stays resident until the least
+recently used blocks are evicted to keep at most max_blocks in memory.
+Level also keeps the blocks around the camera and every lemming loaded
+(load_rect/load_points), so walking into a new area rarely waits on disk.
+
+Edited blocks are written back when evicted: by default to a scratch file,
+so the level on disk is never changed by play, or with persist=True into
+the level file itself (to generate or edit a world in place; call flush()
+or close() to write the blocks still resident).
+
+    python level_format.py to-binary huge_map.txt huge.pplv --chunked
+    python main.py huge.pplv
+
+Level picks this class automatically for chunked levels.
+"""
+
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from level_format import (
+    EMPTY, SOLID, EXIT, TILE_CHARS, BINARY_EXTENSION,
+    ChunkFile, LevelFormatError, create_chunked,
+)
+from tilemap import TileMap, TILE_SIZE, CHUNK_SIZE
+
+MAX_RESIDENT_BLOCKS = 1024  # 4 MiB of tiles with 64 × 64 blocks
+MAX_SURFACES = 96  # rendered chunks kept (256 KiB each at 32 bits per pixel)
+
+
+class ChunkedTileMap(TileMap):
+    """
+    TileMap with the same tile queries, edits, snapshots and drawing, over
+    an LRU-bounded set of resident blocks instead of a full grid. There is
+    no ``tiles``/``grid``: use get_tile, codes_at_pixels and update_hash.
+
+    The terrain lookups (solid_row_below etc.) scan the blocks instead of
+    keeping whole-map tables. Rendered chunk surfaces are capped at
+    max_surfaces, dropping the oldest first.
+    """
+
+    streaming = True
+
+    def __init__(self, map_file, max_blocks=MAX_RESIDENT_BLOCKS, persist=False,
+                 max_surfaces=MAX_SURFACES, quiet=False):
+        self.source = ChunkFile(map_file, writable=persist)
+        if self.source.block_size % CHUNK_SIZE:
+            self.source.close()
+            raise LevelFormatError(f"{map_file}: block size is not a multiple of {CHUNK_SIZE}")
+        self.block_size = self.source.block_size
+        self.rows = self.source.rows
+        self.cols = self.source.cols
+        self.spawn_point = self.source.spawn_point
+        self.target_exits = self.source.target_exits
+        self.width = self.cols * TILE_SIZE
+        self.height = self.rows * TILE_SIZE
+        self.persist = persist
+        self.max_blocks = max(1, max_blocks)
+        self.max_surfaces = max(1, max_surfaces)
+
+        # Resident blocks, least recently used first:
+        # (block col, block row) -> (block_size, block_size) uint8 array
+        self._blocks = OrderedDict()
+        # Resident blocks edited since they were loaded or written back
+        self._modified = set()
+        # Without persist, evicted edits go to a scratch ChunkFile (created
+        # on first use) and are read back from there
+        self._scratch = None
+        self._scratch_path = None
+        self._scratched = set()
+        # The most recently used block, flat, for fast single-tile reads
+        self._hot_key = None
+        self._hot_tiles = None
+        self.loads = 0
+        self.write_backs = 0
+        self._init_caches()
+
+        if not quiet:
+            print(f"[TileMap] Streaming map: {self.rows} rows × {self.cols} cols  "
+                  f"(pixels: {self.width}×{self.height}, up to {self.max_blocks} blocks resident)")
+
+    # ------------------------------------------------------------------
+    # Block cache
+    # ------------------------------------------------------------------
+
+    def _read(self, key):
+        source = self._scratch if key in self._scratched else self.source
+        size = self.block_size
+        return np.frombuffer(bytearray(source.read_block(key)), dtype=np.uint8).reshape(size, size)
+
+    def _block(self, key):
+        """The resident array of a block, loading it (and evicting) if needed."""
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+        else:
+            block = self._read(key)
+            self._blocks[key] = block
+            self.loads += 1
+            while len(self._blocks) > self.max_blocks:
+                self._evict()
+        self._hot_key = key
+        self._hot_tiles = block.reshape(-1).data
+        return block
+
+    def _peek(self, key):
+        """A block's tiles, read from disk without making it resident."""
+        block = self._blocks.get(key)
+        return block if block is not None else self._read(key)
+
+    def _evict(self):
+        key, block = self._blocks.popitem(last=False)
+        if key == self._hot_key:
+            self._hot_key = self._hot_tiles = None
+        if key in self._modified:
+            self._write_back(key, block)
+
+    def _write_back(self, key, block):
+        if self.persist:
+            self.source.write_block(key, block.tobytes())
+        else:
+            if self._scratch is None:
+                self._open_scratch()
+            self._scratch.write_block(key, block.tobytes())
+            self._scratched.add(key)
+        self._modified.discard(key)
+        self.write_backs += 1
+
+    def _open_scratch(self):
+        fd, path = tempfile.mkstemp(prefix="pplv_scratch_", suffix=BINARY_EXTENSION)
+        os.close(fd)
+        create_chunked(path, self.rows, self.cols)
+        self._scratch = ChunkFile(path, writable=True)
+        try:
+            os.remove(path)  # the open file stays usable on POSIX
+        except OSError:
+            self._scratch_path = path  # removed in close() instead
+
+    def load_rect(self, rect, margin=0):
+        """
+        Make the blocks under a world-pixel rect, grown by margin pixels on
+        every side, resident and most recently used.
+        """
+        block_px = self.block_size * TILE_SIZE
+        x, y, w, h = rect
+        first_col = max(0, (x - margin) // block_px)
+        first_row = max(0, (y - margin) // block_px)
+        last_col = min(self.source.block_cols - 1, (x + w + margin - 1) // block_px)
+        last_row = min(self.source.block_rows - 1, (y + h + margin - 1) // block_px)
+        for block_row in range(first_row, last_row + 1):
+            for block_col in range(first_col, last_col + 1):
+                self._block((block_col, block_row))
+
+    def load_points(self, xs, ys):
+        """Make the blocks under world pixels (xs[i], ys[i]) resident."""
+        block_px = self.block_size * TILE_SIZE
+        block_cols = self.source.block_cols
+        cols = np.floor_divide(np.asarray(xs), block_px).astype(np.intp)
+        rows = np.floor_divide(np.asarray(ys), block_px).astype(np.intp)
+        inside = (cols >= 0) & (cols < block_cols) & (rows >= 0) & (rows < self.source.block_rows)
+        for key in np.unique(rows[inside] * block_cols + cols[inside]).tolist():
+            self._block((key % block_cols, key // block_cols))
+
+    def flush(self):
+        """Write back every edited resident block."""
+        for key in list(self._modified):
+            self._write_back(key, self._blocks[key])
+        self.source.flush()
+
+    def close(self):
+        """Flush (with persist) and release the level and scratch files."""
+        if self.persist:
+            self.flush()
+        self.source.close()
+        if self._scratch is not None:
+            self._scratch.close()
+            self._scratch = None
+            if self._scratch_path is not None:
+                os.remove(self._scratch_path)
+                self._scratch_path = None
+
+    # ------------------------------------------------------------------
+    # TileMap interface
+    # ------------------------------------------------------------------
+
+    @property
+    def map_data(self):
+        """
+        The map as a list of lists of tile characters. This is a copy of
+        the whole world, so only for maps that fit in memory.
+        """
+        return [[TILE_CHARS.get(code, ".") for code in row]
+                for block_row in range(self.source.block_rows)
+                for row in self._band(block_row).tolist()]
+
+    def _band(self, block_row):
+        """The map rows in one row of blocks, as a (rows, cols) array."""
+        size = self.block_size
+        band = np.empty((size, self.source.block_cols * size), dtype=np.uint8)
+        for block_col in range(self.source.block_cols):
+            band[:, block_col * size:(block_col + 1) * size] = self._peek((block_col, block_row))
+        return band[:min(size, self.rows - block_row * size), :self.cols]
+
+    def update_hash(self, h):
+        for block_row in range(self.source.block_rows):
+            h.update(self._band(block_row).tobytes())
+
+    def get_tile(self, col, row):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            size = self.block_size
+            key = (col // size, row // size)
+            if key != self._hot_key:
+                self._block(key)
+            return self._hot_tiles[(row % size) * size + col % size]
+        return EMPTY
+
+    def _code_at_pixel(self, x, y):
+        return self.get_tile(int(x // TILE_SIZE), int(y // TILE_SIZE))
+
+    def codes_at_pixels(self, xs, ys):
+        cols = np.floor_divide(np.asarray(xs), TILE_SIZE).astype(np.intp)
+        rows = np.floor_divide(np.asarray(ys), TILE_SIZE).astype(np.intp)
+        inside = (cols >= 0) & (cols < self.cols) & (rows >= 0) & (rows < self.rows)
+        codes = np.zeros(cols.shape, dtype=np.uint8)
+        if not inside.any():
+            return codes
+        size = self.block_size
+        block_cols = self.source.block_cols
+        cols = cols[inside]
+        rows = rows[inside]
+        keys = (rows // size) * block_cols + cols // size
+        first = int(keys[0])
+        if (keys == first).all():
+            block = self._block((first % block_cols, first // block_cols))
+            codes[inside] = block[rows % size, cols % size]
+            return codes
+        found = np.empty(len(keys), dtype=np.uint8)
+        for key in np.unique(keys).tolist():
+            picked = keys == key
+            block = self._block((key % block_cols, key // block_cols))
+            found[picked] = block[rows[picked] % size, cols[picked] % size]
+        codes[inside] = found
+        return codes
+
+    def _scan_down(self, col, row, code):
+        """First row at or below row in column col holding code, or self.rows."""
+        size = self.block_size
+        block_col, offset = divmod(col, size)
+        for block_row in range(row // size, self.source.block_rows):
+            start = max(row - block_row * size, 0)
+            hits = np.flatnonzero(self._block((block_col, block_row))[start:, offset] == code)
+            if len(hits):
+                return block_row * size + start + int(hits[0])
+        return self.rows
+
+    def solid_row_below(self, col, row):
+        if not 0 <= col < self.cols or row >= self.rows:
+            return self.rows
+        return self._scan_down(col, max(row, 0), SOLID)
+
+    def exit_row_below(self, col, row):
+        if not 0 <= col < self.cols or row >= self.rows:
+            return self.rows
+        return self._scan_down(col, max(row, 0), EXIT)
+
+    def _store_tile(self, col, row, code):
+        size = self.block_size
+        key = (col // size, row // size)
+        self._block(key)[row % size, col % size] = code
+        self._modified.add(key)
+
+    def _tile_block(self, key):
+        chunk_col, chunk_row = key
+        per_block = self.block_size // CHUNK_SIZE
+        block = self._block((chunk_col // per_block, chunk_row // per_block))
+        top = (chunk_row % per_block) * CHUNK_SIZE
+        left = (chunk_col % per_block) * CHUNK_SIZE
+        return block[top:top + CHUNK_SIZE, left:left + CHUNK_SIZE]
+
+    def _write_chunk(self, key, data):
+        super()._write_chunk(key, data)
+        per_block = self.block_size // CHUNK_SIZE
+        self._modified.add((key[0] // per_block, key[1] // per_block))
+
+    def _render_chunk(self, chunk_col, chunk_row):
+        key = (chunk_col, chunk_row)
+        # Re-rendered chunks move to the back of the eviction order
+        surface = self._chunks.pop(key, None)
+        if surface is not None:
+            self._chunks[key] = surface
+        surface = super()._render_chunk(chunk_col, chunk_row)
+        while len(self._chunks) > self.max_surfaces:
+            oldest = next(iter(self._chunks))
+            del self._chunks[oldest]
+            self._dirty_chunks.discard(oldest)
+        return surface
@@ -0,0 +1,9 @@
+# conftest.py
+"""
+pytest setup: the game modules are imported from the repository root, and
+pygame runs without a display.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
@@ -0,0 +1,34 @@
+# fileio.py
+"""
+File helpers shared by the game and the level creator.
+"""
+
+import os
+import shutil
+import tempfile
+
+
+def atomic_write(path, write):
+    """
+    Call write(f) on a temporary file next to path, flush it to disk and
+    rename it over path. path is left untouched if anything fails.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,84 @@
+# fonts.py
+"""
+Fonts loaded on first use, with system font lookups cached on disk.
+
+pygame.font.SysFont scans every installed font (fc-list on Linux, the
+registry on Windows) before it looks a name up, even for the default
+font, which can take hundreds of milliseconds at startup. A LazyFont
+stands in for a pygame Font and only loads it the first time it is used.
+Named fonts are resolved to a file once, and the answer is kept in
+FONT_CACHE for later runs. The default font (name None) is pygame's
+bundled one and needs no lookup at all.
+"""
+
+import json
+import os
+
+import pygame
+
+from fileio import atomic_write
+
+FONT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "pixelpioneers", "fonts.json")
+
+
+def font_path(name, bold=False, italic=False, cache_file=FONT_CACHE):
+    """
+    The font file pygame.font.SysFont would pick for name, or None for
+    pygame's default font. Lookups are remembered in cache_file (None to
+    skip the cache); a cached file that has since been removed is looked
+    up again.
+    """
+    if not name:
+        return None
+    key = f"{name}|{int(bold)}{int(italic)}"
+    cache = {}
+    if cache_file is not None:
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        path = cache.get(key)
+        if key in cache and (path is None or os.path.exists(path)):
+            return path
+    path = pygame.font.match_font(name, bold, italic)
+    if cache_file is not None:
+        cache[key] = path
+        data = json.dumps(cache, indent=1, sort_keys=True).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            atomic_write(cache_file, lambda f: f.write(data))
+        except OSError:
+            pass  # only a cache
+    return path
+
+
+class LazyFont:
+    """
+    A pygame Font of the given size (and family name, None for the
+    default font) created the first time one of its methods is called.
+    """
+
+    def __init__(self, size, name=None, cache_file=FONT_CACHE):
+        self.size_px = size
+        self.name = name
+        self.cache_file = cache_file
+        self._font = None
+
+    @property
+    def loaded(self):
+        return self._font is not None
+
+    def load(self):
+        """The pygame Font, created now if it wasn't yet."""
+        if self._font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            self._font = pygame.font.Font(font_path(self.name, cache_file=self.cache_file),
+                                          self.size_px)
+        return self._font
+
+    def __getattr__(self, attr):
+        # Only reached for attributes LazyFont doesn't have: render(),
+        # get_linesize(), size(), ...
+        return getattr(self.load(), attr)
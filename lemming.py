@@ -11,6 +11,114 @@ MAX_FALL_SPEED = 4.0
 # Umbrella constants (slower descent)
 UMBRELLA_GRAVITY = 0.05
 UMBRELLA_MAX_FALL_SPEED = 1.5
+UMBRELLA_HEIGHT = 4  # pixels the umbrella is drawn above the lemming
+
+LEMMING_SIZE = TILE_SIZE // 2
+LEMMING_COLOR = (0, 200, 0)
+UMBRELLA_COLOR = (200, 200, 200)
+STATES = ("walking", "falling", "digging", "building", "blocking")
+
+def to_px(value):
+    """
+    Convert a float coordinate the way pygame.Rect does on assignment
+    (round half away from zero).
+    """
+    if value >= 0:
+        return int(value + 0.5)
+    return -int(-value + 0.5)
+
+def draw_bounds(rect):
+    """
+    The area a lemming with this rect can cover when drawn, including an
+    umbrella (which reaches one pixel past the right edge).
+    """
+    return pygame.Rect(rect.x, rect.y - UMBRELLA_HEIGHT,
+                       rect.width + 1, rect.height + UMBRELLA_HEIGHT)
+
+def clip_blits(blits, areas):
+    """
+    Surface.blits() entries (source, dest, area) cut down to the parts
+    inside the given screen rects, so redrawing a lemming that pokes out
+    of a dirty region leaves the pixels outside it alone.
+    """
+    clipped = []
+    for source, (x, y), area in blits:
+        dest = pygame.Rect(x, y, area.width, area.height)
+        for i in dest.collidelistall(areas):
+            part = dest.clip(areas[i])
+            clipped.append((source, part.topleft,
+                            part.move(area.x - x, area.y - y)))
+    return clipped
+
+class SpriteAtlas:
+    """
+    Every lemming frame pre-rendered side by side on one surface: one per
+    state, plus the falling frame with the umbrella open. A lemming is
+    drawn by blitting its frame's area of the atlas, so any number of them
+    can go through a single Surface.blits() call.
+    """
+
+    def __init__(self, size=LEMMING_SIZE):
+        self.size = size
+        top = UMBRELLA_HEIGHT
+        frame_w = size + 1  # the umbrella reaches one pixel past the right edge
+        keys = [(state, False) for state in STATES] + [("falling", True)]
+        self.surface = pygame.Surface((frame_w * len(keys), size + top))
+        self.surface.set_colorkey((0, 0, 0))
+        self._frames = {}
+        for i, (state, umbrella) in enumerate(keys):
+            x = i * frame_w
+            self.surface.fill(LEMMING_COLOR, (x, top, size, size))
+            if umbrella:
+                pygame.draw.polygon(self.surface, UMBRELLA_COLOR,
+                                    [(x, top), (x + size, top), (x + size // 2, 0)])
+                self._frames[(state, True)] = (pygame.Rect(x, 0, frame_w, size + top), (0, -top))
+            else:
+                self._frames[(state, False)] = (pygame.Rect(x, top, size, size), (0, 0))
+        # Plain frame used as Lemming.image (for rect sizes and Group.draw)
+        self.image = self.surface.subsurface(self._frames[("walking", False)][0])
+
+    def frame(self, state, umbrella=False):
+        """
+        (area of the atlas, (dx, dy) offset from the lemming's topleft) for
+        a lemming in this state; the umbrella only shows while falling.
+        """
+        return self._frames[(state, umbrella and state == "falling")]
+
+_atlas = None
+
+def sprite_atlas():
+    """The shared SpriteAtlas, created on first use."""
+    global _atlas
+    if _atlas is None:
+        _atlas = SpriteAtlas()
+    return _atlas
+
+class FallPlan:
+    """
+    The rest of a fall worked out in advance by Lemming.plan_fall(): after
+    `ticks` more updates the lemming has y = end_y, vy = end_vy and state
+    end_state ("walking" if it landed). In between it is only falling;
+    state_after(k) gives its y and vy after k < ticks updates.
+    """
+
+    def __init__(self, ys, vys, end_y, end_vy, end_state):
+        self.ys = ys
+        self.vys = vys
+        self.ticks = len(ys)
+        self.end_y = end_y
+        self.end_vy = end_vy
+        self.end_state = end_state
+        self.end_tick = None  # set by the Level that schedules it
+
+    def state_after(self, k):
+        return self.ys[k], self.vys[k]
+
+def _fall_physics(umbrella):
+    """(gravity, max fall speed) with or without an umbrella."""
+    if umbrella:
+        return UMBRELLA_GRAVITY, UMBRELLA_MAX_FALL_SPEED
+    return GRAVITY, MAX_FALL_SPEED
 
 class Lemming(pygame.sprite.Sprite):
     """
@@ -25,13 +133,29 @@ class Lemming(pygame.sprite.Sprite):
       - "umbrella": slows falling speed while active
     """
 
-    def __init__(self, spawn_pos):
+    def __init__(self, spawn_pos, lemming_id=None):
         super().__init__()
-        # Create a simple green rectangle as the “sprite”
-        size = TILE_SIZE // 2
-        self.image = pygame.Surface((size, size))
-        self.image.fill((0, 200, 0))
-        self.rect = self.image.get_rect(midbottom=spawn_pos)
+        # A small green square, shared from the sprite atlas
+        self.image = sprite_atlas().image
+        self.rect = self.image.get_rect()
+
+        # Index in the LemmingPool's spawn order while in play, else None
+        self.slot = None
+
+        self.reset(spawn_pos, lemming_id)
+
+        # Placeholder for sounds
+        # self.dig_sound = None  # TODO: load dig.wav here
+        # self.build_sound = None  # TODO: load build.wav here
+
+    def reset(self, spawn_pos, lemming_id=None):
+        """
+        Put the lemming back in its just-spawned state at spawn_pos, so a
+        LemmingPool can reuse it for a new spawn.
+        """
+        # Spawn-order number given by the Level (stable for replays/schedules)
+        self.lemming_id = lemming_id
+        self.rect.midbottom = spawn_pos
 
         # Velocity
         self.vx = WALK_SPEED
@@ -45,9 +169,8 @@ class Lemming(pygame.sprite.Sprite):
         self.skill_assigned = None
         self.has_umbrella = False
 
-        # Placeholder for sounds
-        # self.dig_sound = None  # TODO: load dig.wav here
-        # self.build_sound = None  # TODO: load build.wav here
+        # Set while a Level in fast-forward mode skips this lemming's fall
+        self.fall_plan = None
 
     def assign_skill(self, skill_name):
         """
@@ -57,10 +180,11 @@ class Lemming(pygame.sprite.Sprite):
         if self.state in ("walking", "falling"):
             self.skill_assigned = skill_name
 
-    def update(self, tilemap, all_lemmings):
+    def update(self, tilemap, blockers):
         """
         Perform one step of behavior depending on self.state,
         possibly consuming self.skill_assigned.
+        `blockers` is the Level's SpatialGrid of blocking lemmings.
         """
         # Check if a skill was clicked
         if self.skill_assigned == "dig" and self.state == "walking":
@@ -80,7 +204,7 @@ class Lemming(pygame.sprite.Sprite):
 
         # State behavior
         if self.state == "walking":
-            self._walk(tilemap, all_lemmings)
+            self._walk(tilemap, blockers)
         elif self.state == "falling":
             self._fall(tilemap)
         elif self.state == "digging":
@@ -91,7 +215,7 @@ class Lemming(pygame.sprite.Sprite):
             # Just stand; other lemmings will now treat me as an obstacle
             pass
 
-    def _walk(self, tilemap, all_lemmings):
+    def _walk(self, tilemap, blockers):
         """
         Attempt to move horizontally by WALK_SPEED * direction,
         but first check:
@@ -112,7 +236,7 @@ class Lemming(pygame.sprite.Sprite):
         # 2) Check for a blocking lemming in front
         next_rect = self.rect.copy()
         next_rect.x = next_x
-        for other in all_lemmings:
+        for other in blockers.query(next_rect):
             if other is not self and other.state == "blocking":
                 if next_rect.colliderect(other.rect):
                     # We would run into a blocking lemming → turn around
@@ -151,6 +275,39 @@ class Lemming(pygame.sprite.Sprite):
             self.state = "walking"
             self.vy = 0
 
+    def plan_fall(self, tilemap):
+        """
+        Work out the rest of this fall (with no skill assigned and the
+        terrain in this column unchanged) as a FallPlan, using the tilemap's
+        per-column tables instead of probing tiles every tick. The plan
+        ends on the update after which the lemming has landed, is centered
+        on an exit or is off the bottom of the map: the same updates and
+        the same Level checks as _fall() would go through.
+        """
+        g, max_speed = _fall_physics(self.has_umbrella)
+        height = self.rect.height
+        half = height // 2
+        x = self.rect.midbottom[0]
+        y = self.rect.y
+        vy = self.vy
+        col = int(x // TILE_SIZE)
+        rows = tilemap.rows
+        ground = tilemap.solid_row_below(col, (y + height + 1) // TILE_SIZE)
+        exit_row = tilemap.exit_row_below(col, (y + half) // TILE_SIZE)
+        ys = []
+        vys = []
+        while True:
+            ys.append(y)
+            vys.append(vy)
+            vy = min(vy + g, max_speed)
+            y = to_px(y + vy)
+            foot_y = y + height
+            if ground < rows and (foot_y + 1) // TILE_SIZE >= ground:
+                y = (foot_y // TILE_SIZE) * TILE_SIZE - height
+                return FallPlan(ys, vys, y, 0, "walking")
+            if (exit_row < rows and (y + half) // TILE_SIZE >= exit_row) or y > tilemap.height:
+                return FallPlan(ys, vys, y, vy, "falling")
+
     def _dig(self, tilemap):
         """
         Remove the tile directly below, then switch to falling.
@@ -176,15 +333,95 @@ class Lemming(pygame.sprite.Sprite):
 
     def draw(self, surface, camera):
         """
-        Draw the lemming’s green rectangle at (world-coords minus camera).
+        Draw the lemming’s frame (with an umbrella if active and falling)
+        at (world-coords minus camera).
+        """
+        atlas = sprite_atlas()
+        area, (dx, dy) = atlas.frame(self.state, self.has_umbrella)
+        surface.blit(atlas.surface,
+                     (self.rect.x - camera.x + dx, self.rect.y - camera.y + dy), area)
+
+class LemmingPool:
+    """
+    The lemmings in play, in spawn (update) order. Lemmings that leave
+    play go on a free list and are reset and reused by later spawns, so a
+    long session stops allocating sprites once the pool has warmed up.
+
+    Releasing a lemming only marks its entry in the order list dead
+    (lemming.slot no longer points at it), so lemmings can be released
+    while iterating. Dead entries are compacted away by spawn(), once they
+    make up a quarter of the list; don't spawn while iterating.
+    """
+
+    def __init__(self):
+        self._order = []  # lemmings in spawn order, dead entries included
+        self._by_id = {}  # lemming_id -> lemming, for the ones in play
+        self._free = []
+        self._dead = 0    # dead entries in _order
+        self._head = 0    # index of the first live entry, or past it
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        """The lemmings in play, in spawn order."""
+        for i, lemming in enumerate(self._order):
+            if lemming.slot == i:
+                yield lemming
+
+    def get(self, lemming_id):
+        """The lemming in play with this spawn-order id, or None."""
+        return self._by_id.get(lemming_id)
+
+    def first(self):
+        """The earliest spawned lemming still in play, or None."""
+        order = self._order
+        head = self._head
+        while head < len(order) and order[head].slot != head:
+            head += 1
+        self._head = head
+        return order[head] if head < len(order) else None
+
+    def spawn(self, spawn_pos, lemming_id):
+        """
+        Put a lemming into play at spawn_pos (midbottom), reusing a
+        released one when there is one. Returns it.
         """
-        screen_x = self.rect.x - camera.x
-        screen_y = self.rect.y - camera.y
-        surface.blit(self.image, (screen_x, screen_y))
+        if self._dead * 4 > len(self._order):
+            self._compact()
+        if self._free:
+            lemming = self._free.pop()
+            lemming.reset(spawn_pos, lemming_id)
+        else:
+            lemming = Lemming(spawn_pos, lemming_id)
+        lemming.slot = len(self._order)
+        self._order.append(lemming)
+        self._by_id[lemming_id] = lemming
+        return lemming
+
+    def release(self, lemming):
+        """Take a lemming out of play; does nothing if it isn't in play."""
+        if lemming.slot is None:
+            return
+        lemming.slot = None
+        del self._by_id[lemming.lemming_id]
+        self._free.append(lemming)
+        self._dead += 1
+
+    def clear(self):
+        """Release every lemming."""
+        for lemming in self:
+            lemming.slot = None
+            self._free.append(lemming)
+        self._order = []
+        self._by_id = {}
+        self._dead = 0
+        self._head = 0
 
-        # Draw a simple umbrella if active and falling
-        if self.has_umbrella and self.state == "falling":
-            top = (screen_x + self.rect.width // 2, screen_y - 4)
-            left = (screen_x, screen_y)
-            right = (screen_x + self.rect.width, screen_y)
-            pygame.draw.polygon(surface, (200, 200, 200), [left, right, top])
+    def _compact(self):
+        live = list(self)
+        for i, lemming in enumerate(live):
+            lemming.slot = i
+        self._order = live
+        self._dead = 0
+        self._head = 0
@@ -1,50 +1,327 @@
 # level.py
 
+import hashlib
+import math
+import struct
+
+import numpy as np
 import pygame
 from tilemap import TileMap, TILE_SIZE
-from lemming import Lemming
+from chunked_tilemap import ChunkedTileMap
+from level_format import is_chunked_level
+from lemming import LEMMING_SIZE, LemmingPool, clip_blits, draw_bounds, sprite_atlas
+from spatial import CellIndex, SpatialGrid
+from swarm import (
+    LemmingSwarm, FALLING, STATE_NAMES, SKILL_CODES, NO_SKILL, LEMMING_RECORD,
+)
+from profiler import profiler
+from zones import ZoneIndex, EXIT_ZONE, KILL_ZONE
+
+TICK_RATE = 60  # simulation ticks per second in headless mode
+STREAM_EVERY = 15  # ticks between preloading terrain on streamed maps
+HOVER_COLOR = (255, 255, 255)  # outline of the lemming a click would pick
+
+_STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+_SKILL_NAMES = {code: name for name, code in SKILL_CODES.items()}
+
+# Per-lemming record fed to state_hash(): id, x, y, state, direction,
+# umbrella, pending skill, vx, vy
+_HASH_LEMMING = struct.Struct("<qqqBbBBdd")
+_HASH_COUNTERS = struct.Struct("<qqqB")
+
+
+def open_tilemap(map_file, quiet=False):
+    """
+    The map in map_file: a ChunkedTileMap streamed from disk for chunked
+    levels, else a TileMap. quiet=True skips the "[TileMap] ..." line.
+    """
+    if is_chunked_level(map_file):
+        return ChunkedTileMap(map_file, quiet=quiet)
+    return TileMap(map_file, quiet=quiet)
+
+
+def lerp_positions(previous, ids, xs, ys, alpha):
+    """
+    World positions xs, ys of the lemmings with these ids moved back to
+    alpha of the way from their positions in previous, an (ids, xs, ys)
+    of an earlier tick. Lemmings not in previous are left where they are.
+    """
+    prev_ids, prev_xs, prev_ys = previous
+    if not len(prev_ids) or not len(ids):
+        return xs, ys
+    # Ids are in spawn order, so both id arrays are sorted
+    at = np.minimum(np.searchsorted(prev_ids, ids), len(prev_ids) - 1)
+    known = prev_ids[at] == ids
+    px = prev_xs[at]
+    py = prev_ys[at]
+    xs = np.where(known, px + np.rint((xs - px) * alpha).astype(np.int64), xs)
+    ys = np.where(known, py + np.rint((ys - py) * alpha).astype(np.int64), ys)
+    return xs, ys
+
+
+def draw_outline(surface, outline, areas=None):
+    """
+    Draw the hover outline around the screen rect outline; with areas, only
+    the parts inside them.
+    """
+    # Lines rather than draw.rect, which outlines the clipped rect
+    corners = [outline.topleft, (outline.right - 1, outline.top),
+               (outline.right - 1, outline.bottom - 1), (outline.left, outline.bottom - 1)]
+    if areas is None:
+        pygame.draw.lines(surface, HOVER_COLOR, True, corners)
+        return
+    clip = surface.get_clip()
+    for area in areas:
+        if area.colliderect(outline):
+            surface.set_clip(clip.clip(area))
+            pygame.draw.lines(surface, HOVER_COLOR, True, corners)
+    surface.set_clip(clip)
+
+
+class LevelSnapshot:
+    """
+    A Level's simulation state at one tick, made by Level.snapshot() and
+    put back with Level.restore(). Snapshots are never modified, so one
+    can be restored any number of times.
+
+    Tiles are held as copy-on-write chunks (see TileMap.snapshot_tiles)
+    and lemmings as a LEMMING_RECORD array, so taking and restoring a
+    snapshot costs about as much as the data that changed.
+    """
+
+    def __init__(self, level):
+        self.tick = level.tick
+        self.spawned = level.spawned
+        self.spawn_timer = level.spawn_timer
+        self.exit_count = level.exit_count
+        self.score = level.score
+        self.start_time = level.start_time
+        self.end_time = level.end_time
+        self.completed = level.completed
+        self.failed = level.failed
+        self.camera = level.camera.topleft
+        self.tiles = level.tilemap.snapshot_tiles()
+        if level.swarm is not None:
+            self.lemmings = level.swarm.pack_records()
+        else:
+            self.lemmings = np.array([
+                (l.lemming_id, l.rect.x, l.rect.y, l.vx, l.vy, l.direction,
+                 _STATE_CODES[l.state], SKILL_CODES.get(l.skill_assigned, NO_SKILL),
+                 l.has_umbrella)
+                for l in level.lemmings
+            ], dtype=LEMMING_RECORD)
+
 
 class Level:
-    def __init__(self, map_file, screen_width, screen_height, target_exits=10):
-        # Load the tilemap
-        self.tilemap = TileMap(map_file)
+    def __init__(self, map_file, screen_width, screen_height, target_exits=None,
+                 engine="sprites", headless=False, tick_rate=TICK_RATE,
+                 fast_forward=False, fixed_step=False, quiet=False):
+        """
+        engine selects how lemmings are simulated:
+          - "sprites": one Lemming sprite each (default)
+          - "swarm": a LemmingSwarm of NumPy arrays, for very large crowds
+
+        target_exits defaults to the map's own target (from a binary
+        level's header or a text map's sidecar), or 10.
+
+        quiet=True loads the map without printing its size, for tools
+        that build many levels.
+
+        With headless=True the level never reads pygame's clock: time is
+        derived from the number of update() calls at tick_rate ticks per
+        second, so step() can run as fast as the CPU allows without a display.
+        fixed_step=True keeps that timing with a display, for a game loop
+        that calls update() tick_rate times per second of play however
+        fast it renders (see main.py).
+
+        fast_forward (sprites engine only) works out each fall in one go
+        when it starts (Lemming.plan_fall) and skips the lemming until it
+        lands. The outcome is identical tick for tick: a skipped lemming is
+        brought up to date whenever it is looked at, given a skill or the
+        terrain in its column changes.
+        """
+        self.headless = headless
+        self.fixed_step = headless or fixed_step
+        self.tick_rate = tick_rate
+        self.tick = 0  # number of simulation steps taken
+
+        # Load the tilemap; chunked levels are streamed from disk
+        self.tilemap = open_tilemap(map_file, quiet=quiet)
 
         # Camera starts at (0,0), but will follow the first lemming once it spawns
         self.camera = pygame.Rect(0, 0, screen_width, screen_height)
 
-        # Group for all lemmings
-        self.lemmings = pygame.sprite.Group()
+        # Lemmings in play, in spawn order, with released ones kept for reuse
+        self.lemmings = LemmingPool()
+        self.spawned = 0
+        if engine == "swarm":
+            self.swarm = LemmingSwarm()
+        elif engine == "sprites":
+            self.swarm = None
+        else:
+            raise ValueError(f"Unknown engine: {engine!r}")
+        if fast_forward and self.swarm is not None:
+            raise ValueError("fast_forward needs the sprites engine")
+
+        # Fast-forward: lemmings whose fall is planned, by the column they
+        # fall in, and the id of the lemming being updated (None between ticks)
+        self.fast_forward = fast_forward
+        self._sleepers = {}
+        self._updating_id = None
+        if fast_forward:
+            self.tilemap.add_listener(self._wake_column)
+
+        # Exit and kill zones. A sprite is only looked up in them when its
+        # center moves into another tile (see hit_index), or when it is in
+        # _recheck: just spawned, woken, standing where the zone changed,
+        # or falling through the kill zone
+        self.zones = ZoneIndex(self.tilemap)
+        self.zones.add_listener(self._zone_changed)
+        self._recheck = set()
 
-        # Spawn point (tile coordinates)
-        self.spawn_point = (2, 2)
+        # Blocking lemmings bucketed by tile, so walkers only check nearby ones
+        self.blockers = SpatialGrid(TILE_SIZE, "blockers")
+
+        # Lemmings bucketed by the tile their center is in, for clicks and
+        # hovering (sprites engine; lemmings in a fast-forwarded fall are
+        # found through _sleepers instead)
+        self.hit_index = CellIndex(TILE_SIZE)
+        # (lemming id, world rect) under the mouse, set by update_hover()
+        self.hovered = None
+
+        # (camera topleft, ids, xs, ys) kept by remember_positions(), the
+        # state draw() interpolates from
+        self._previous = None
+
+        # Spawn point (tile coordinates), from the map header when it has one
+        self.spawn_point = self.tilemap.spawn_point or (2, 2)
 
         # Timer to control spawning
-        self.spawn_timer = pygame.time.get_ticks()
+        self.spawn_timer = self._now()
         self.spawn_interval = 2000  # spawn every 2000 ms
+        # When set (a set of ticks), lemmings spawn exactly on those ticks
+        # instead of by the timer; used to replay a recorded session
+        self.spawn_ticks = None
+
+        # Optional replay.Recorder told about every spawn and skill assignment
+        self.recorder = None
 
         # Scoring / progression
+        if target_exits is None:
+            target_exits = self.tilemap.target_exits
+            if target_exits is None:
+                target_exits = 10
         self.target_exits = target_exits
         self.exit_count = 0
         self.score = 0
-        self.start_time = pygame.time.get_ticks()
+        self.start_time = self._now()
         self.end_time = None
 
         self.completed = False
         self.failed = False
 
-    def handle_event(self, event, selected_skill):
+    def handle_event(self, event, selected_skill, alpha=1.0):
         """
         If the player clicks on a lemming while a skill is selected,
-        assign that skill to the clicked lemming.
+        assign that skill to the clicked lemming. alpha is the one the
+        screen was last drawn at, so the click lands where it was drawn.
         """
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            mx, my = event.pos
-            world_x = mx + self.camera.x
-            world_y = my + self.camera.y
-            for lemming in self.lemmings:
-                if lemming.rect.collidepoint(world_x, world_y):
-                    lemming.assign_skill(selected_skill)
-                    break
+            world_x, world_y = self.world_pos(event.pos, alpha)
+            lemming_id = self.lemming_at(world_x, world_y, selected_skill)
+            if lemming_id is not None:
+                self.assign_skill_to(lemming_id, selected_skill)
+
+    def lemming_at(self, world_x, world_y, skill=None):
+        """
+        Id of the lemming a click at this world pixel would pick, or None.
+        Where lemmings overlap, prefer one the skill would do something to
+        (walking or falling with nothing pending), then the one whose
+        center is closest, then the earliest spawned.
+        """
+        found = self._pick(world_x, world_y, skill)
+        return found[0] if found is not None else None
+
+    def update_hover(self, pos, skill=None, alpha=1.0):
+        """
+        Note the lemming a click at screen position pos would pick (pos is
+        None when the mouse is away), for draw() to outline. Call once a
+        frame, after update(), with the alpha the frame will be drawn at.
+        """
+        if pos is None:
+            self.hovered = None
+            return
+        world_x, world_y = self.world_pos(pos, alpha)
+        self.hovered = self._pick(world_x, world_y, skill)
+
+    def hover_bounds(self, alpha=1.0):
+        """World rect of the hover outline (as drawn at alpha), or None."""
+        if self.hovered is None:
+            return None
+        lemming_id, rect = self.hovered
+        rect = rect.inflate(4, 4)
+        if self._interpolating(alpha):
+            xs, ys = self._lerp(np.array([lemming_id]), np.array([rect.x + 2]),
+                                np.array([rect.y + 2]), alpha)
+            rect.topleft = (int(xs[0]) - 2, int(ys[0]) - 2)
+        return rect
+
+    def _pick(self, world_x, world_y, skill):
+        """(lemming id, world rect) for lemming_at(), or None."""
+        if self.swarm is not None:
+            slot = self.swarm.hit_test(world_x, world_y, skill)
+            if slot is None:
+                return None
+            return int(self.swarm.ids[slot]), self.swarm.rect(slot)
+
+        reach = LEMMING_SIZE // 2
+        candidates = self.hit_index.near(world_x, world_y, reach)
+        for c in range(int((world_x - reach) // TILE_SIZE), int((world_x + reach) // TILE_SIZE) + 1):
+            for lemming in self._sleepers.get(c, ()):
+                self._sync(lemming)
+                candidates.append(lemming)
+        best = None
+        best_key = None
+        for lemming in candidates:
+            rect = lemming.rect
+            if not rect.collidepoint(world_x, world_y):
+                continue
+            dx = rect.centerx - world_x
+            dy = rect.centery - world_y
+            key = (not self._takes_skill(lemming, skill), dx * dx + dy * dy, lemming.lemming_id)
+            if best_key is None or key < best_key:
+                best, best_key = lemming, key
+        if best is None:
+            return None
+        return best.lemming_id, best.rect.copy()
+
+    @staticmethod
+    def _takes_skill(lemming, skill):
+        """Same rule as LemmingSwarm.takes_skill."""
+        if lemming.state not in ("walking", "falling") or lemming.skill_assigned is not None:
+            return False
+        return not (skill == "umbrella" and lemming.has_umbrella)
+
+    def assign_skill_to(self, lemming_id, skill_name):
+        """
+        Assign a skill to the lemming with this spawn-order id, as a click
+        would. Returns False if that lemming is not in play.
+        """
+        if self.swarm is not None:
+            slot = self.swarm.slot_of(lemming_id)
+            if slot is None:
+                return False
+            self.swarm.assign_skill(slot, skill_name)
+        else:
+            lemming = self.lemmings.get(lemming_id)
+            if lemming is None:
+                return False
+            if lemming.fall_plan is not None:
+                self._wake(lemming, self.tick)
+            lemming.assign_skill(skill_name)
+        if self.recorder is not None:
+            self.recorder.skill_assigned(self.tick, lemming_id, skill_name)
+        return True
 
     def update(self):
         """
@@ -54,37 +331,27 @@ class Level:
         if self.completed or self.failed:
             return
 
-        now = pygame.time.get_ticks()
-        if now - self.spawn_timer >= self.spawn_interval:
+        self.tick += 1
+        now = self._now()
+        if self.spawn_ticks is not None:
+            if self.tick in self.spawn_ticks:
+                self._spawn_lemming()
+        elif now - self.spawn_timer >= self.spawn_interval:
             self.spawn_timer = now
             self._spawn_lemming()
 
-        # Update each lemming (pass the entire group so they can detect blockers)
-        for lemming in list(self.lemmings):
-            lemming.update(self.tilemap, self.lemmings)
-
-            # If they've reached an exit tile, remove (“kill”) them
-            cx, cy = lemming.rect.center
-            if self.tilemap.is_exit_at_pixel(cx, cy):
-                lemming.kill()
-                self.exit_count += 1
-                if (not self.completed and
-                        self.exit_count >= self.target_exits):
-                    self.completed = True
-                    self.end_time = now
-                    self._calculate_score()
-                continue
+        if self.tilemap.streaming and self.tick % STREAM_EVERY == 0:
+            self._stream_terrain()
 
-            # If they fall off the bottom of the map, remove them
-            if lemming.rect.top > self.tilemap.height:
-                lemming.kill()
-                continue
+        if self.swarm is not None:
+            self._update_swarm(now)
+        else:
+            self._update_sprites(now)
 
         # Re‐enable camera‐follow: center on the first spawned lemming
-        if self.lemmings:
-            first = next(iter(self.lemmings))
-            self.camera.centerx = first.rect.centerx
-            self.camera.centery = first.rect.centery
+        first = self._first_lemming_center()
+        if first is not None:
+            self.camera.center = first
 
             # Clamp camera coordinates so we never scroll outside the map bounds
             max_x = self.tilemap.width - self.camera.width
@@ -93,14 +360,317 @@ class Level:
             self.camera.x = max(0, min(self.camera.x, max_x))
             self.camera.y = max(0, min(self.camera.y, max_y))
 
+    def step(self, n_ticks=1):
+        """
+        Advance the simulation by up to n_ticks fixed steps, stopping early
+        once the level is completed or failed. Returns the ticks simulated.
+        """
+        for done in range(n_ticks):
+            if self.completed or self.failed:
+                return done
+            self.update()
+        return n_ticks
+
+    def spawns_until(self, tick):
+        """
+        How many lemmings spawn from the next update up to and including
+        the one that reaches tick (fixed-step and headless timing only).
+        """
+        if self.spawn_ticks is not None:
+            return sum(1 for t in self.spawn_ticks if self.tick < t <= tick)
+        if not math.isfinite(self.spawn_interval):
+            return 0
+        count = 0
+        timer = self.spawn_timer
+        t = self.tick
+        while True:
+            # First tick whose _now() is spawn_interval past the timer
+            t = max(t + 1, math.ceil((timer + self.spawn_interval) * self.tick_rate / 1000))
+            if t > tick:
+                return count
+            count += 1
+            timer = t * 1000 // self.tick_rate
+
+    def snapshot(self):
+        """
+        Capture the simulation state (tiles, lemmings, counters, camera)
+        as a LevelSnapshot.
+        """
+        self._sync_sleepers()
+        return LevelSnapshot(self)
+
+    def restore(self, snap):
+        """
+        Put the level back to the state captured in snap. A
+        DirtyRectRenderer drawing this level needs invalidate() afterwards.
+        """
+        self.tick = snap.tick
+        self.spawned = snap.spawned
+        self.spawn_timer = snap.spawn_timer
+        self.exit_count = snap.exit_count
+        self.score = snap.score
+        self.start_time = snap.start_time
+        self.end_time = snap.end_time
+        self.completed = snap.completed
+        self.failed = snap.failed
+        self.camera.topleft = snap.camera
+        self.tilemap.restore_tiles(snap.tiles)
+
+        self.blockers.clear()
+        self.hit_index.clear()
+        self._recheck.clear()
+        self.hovered = None
+        self._previous = None
+        if self.swarm is not None:
+            self.swarm.load_records(snap.lemmings, snap.spawned)
+            return
+
+        # Pool order is update order, so put them all back in snapshot
+        # (spawn) order; the pool hands back the same sprites
+        self.lemmings.clear()
+        self._sleepers = {}
+        for (lemming_id, x, y, vx, vy, direction, state, skill,
+             umbrella) in snap.lemmings.tolist():
+            lemming = self.lemmings.spawn((0, 0), lemming_id)
+            lemming.rect.topleft = (x, y)
+            lemming.vx = vx
+            lemming.vy = vy
+            lemming.direction = direction
+            lemming.state = STATE_NAMES[state]
+            lemming.skill_assigned = _SKILL_NAMES.get(skill)
+            lemming.has_umbrella = umbrella
+            if lemming.state == "blocking":
+                self.blockers.insert(lemming, lemming.rect)
+            self.hit_index.move(lemming, *lemming.rect.center)
+            # Restored tiles publish no events, so look everyone up again
+            self._recheck.add(lemming)
+
+    def state_hash(self, with_tick=True):
+        """
+        Hex digest of the simulation state: tick, counters, every tile and
+        every lemming. Equal states give equal hashes with either engine;
+        wall-clock time (and so the score) is not included.
+
+        with_tick=False hashes the time since the last spawn instead of
+        the tick, so the same state reached at two ticks hashes the same
+        (see solver.py).
+        """
+        self._sync_sleepers()
+        h = hashlib.blake2b(digest_size=16)
+        clock = self.tick if with_tick else self._now() - self.spawn_timer
+        h.update(_HASH_COUNTERS.pack(clock, self.spawned, self.exit_count, self.completed))
+        self.tilemap.update_hash(h)
+        for record in sorted(self._lemming_hash_records()):
+            h.update(_HASH_LEMMING.pack(*record))
+        return h.hexdigest()
+
+    def _lemming_hash_records(self):
+        if self.swarm is not None:
+            s = self.swarm
+            for i in s.live_slots():
+                yield (int(s.ids[i]), int(s.x[i]), int(s.y[i]), int(s.state[i]),
+                       int(s.direction[i]), bool(s.umbrella[i]), int(s.skill[i]),
+                       float(s.vx[i]), float(s.vy[i]))
+            return
+        for l in self.lemmings:
+            yield (l.lemming_id, l.rect.x, l.rect.y, STATE_NAMES.index(l.state),
+                   l.direction, l.has_umbrella, SKILL_CODES.get(l.skill_assigned, NO_SKILL),
+                   float(l.vx), float(l.vy))
+
+    def _stream_terrain(self):
+        """
+        Keep the terrain blocks under every lemming, and around the camera
+        (one block of margin), resident in a streamed tilemap. Anything
+        else is still loaded on demand; this just does it ahead of time.
+        """
+        if self.swarm is not None:
+            slots = self.swarm.live_slots()
+            xs = self.swarm.x[slots]
+            ys = self.swarm.y[slots]
+        else:
+            centers = [lemming.rect.center for lemming in self.lemmings]
+            xs = [x for x, _ in centers]
+            ys = [y for _, y in centers]
+        tilemap = self.tilemap
+        tilemap.load_points(xs, ys)
+        tilemap.load_rect(self.camera, margin=tilemap.block_size * TILE_SIZE)
+
+    def _now(self):
+        """
+        Current level time in milliseconds: the tick counter in headless
+        and fixed-step mode, pygame's clock otherwise.
+        """
+        if self.fixed_step:
+            return self.tick * 1000 // self.tick_rate
+        return pygame.time.get_ticks()
+
+    def _update_sprites(self, now):
+        # Update each lemming (pass the blocker index so they can detect
+        # blockers); the pool can be iterated while lemmings are removed
+        hit_index = self.hit_index
+        zones = self.zones
+        recheck = self._recheck
+        for lemming in self.lemmings:
+            plan = lemming.fall_plan
+            if plan is not None:
+                if self.tick < plan.end_tick:
+                    continue  # still in a fast-forwarded fall
+                self._finish_fall(lemming)
+                was_falling = False
+            else:
+                was_falling = lemming.state == "falling"
+                was_blocking = lemming.state == "blocking"
+                self._updating_id = lemming.lemming_id
+                lemming.update(self.tilemap, self.blockers)
+                is_blocking = lemming.state == "blocking"
+                if is_blocking and not was_blocking:
+                    self.blockers.insert(lemming, lemming.rect)
+                elif was_blocking and not is_blocking:
+                    self.blockers.remove(lemming)
+
+            # Re-bucket for clicks only when the center crosses a tile, and
+            # only then (or when due a recheck) look up the zone it is in
+            cx, cy = lemming.rect.center
+            if hit_index.move(lemming, cx, cy) or (recheck and lemming in recheck):
+                recheck.discard(lemming)
+                zone = zones.zone_at(cx // TILE_SIZE, cy // TILE_SIZE)
+
+                # If they've reached an exit tile, remove (“kill”) them
+                if zone == EXIT_ZONE:
+                    self._remove_lemming(lemming)
+                    self._record_exits(1, now)
+                    continue
+
+                # Below the map: once they have fallen off the bottom,
+                # remove them; until then, look again every tick
+                if zone == KILL_ZONE:
+                    if lemming.rect.top > self.tilemap.height:
+                        self._remove_lemming(lemming)
+                        continue
+                    recheck.add(lemming)
+
+            # Plan falls that got going (not a walker stepping to a ledge
+            # and back, which starts and ends a "fall" every other tick)
+            if (self.fast_forward and was_falling and lemming.state == "falling"
+                    and lemming.skill_assigned is None):
+                self._plan_fall(lemming)
+        self._updating_id = None
+
+    def _plan_fall(self, lemming):
+        plan = lemming.plan_fall(self.tilemap)
+        if plan.ticks < 2:
+            return  # nothing to skip
+        plan.end_tick = self.tick + plan.ticks
+        lemming.fall_plan = plan
+        col = lemming.rect.centerx // TILE_SIZE
+        self._sleepers.setdefault(col, set()).add(lemming)
+        self.hit_index.remove(lemming)
+
+    def _unplan(self, lemming):
+        col = lemming.rect.centerx // TILE_SIZE
+        self._sleepers[col].discard(lemming)
+        lemming.fall_plan = None
+
+    def _finish_fall(self, lemming):
+        plan = lemming.fall_plan
+        self._unplan(lemming)
+        lemming.rect.y = plan.end_y
+        lemming.vy = plan.end_vy
+        lemming.state = plan.end_state
+
+    def _wake(self, lemming, through_tick):
+        """
+        Drop a lemming's fall plan, leaving it as it would be after the
+        update of through_tick.
+        """
+        plan = lemming.fall_plan
+        self._unplan(lemming)
+        lemming.rect.y, lemming.vy = plan.state_after(through_tick - (plan.end_tick - plan.ticks))
+        self.hit_index.move(lemming, *lemming.rect.center)
+        self._recheck.add(lemming)
+
+    def _wake_column(self, col, row, old_code, new_code):
+        """
+        TileMap listener: the tiles under lemmings falling in this column
+        changed, so their plans no longer hold. Those updated
+        earlier this tick resume after it, the others from before it.
+        """
+        updating = self._updating_id
+        for lemming in list(self._sleepers.get(col, ())):
+            if updating is None or lemming.lemming_id < updating:
+                self._wake(lemming, self.tick)
+            else:
+                self._wake(lemming, self.tick - 1)
+
+    def _zone_changed(self, col, row, old_zone, new_zone):
+        """ZoneIndex listener: look up the lemmings standing in that tile again."""
+        self._recheck.update(self.hit_index.in_cell(col, row))
+
+    def _sync(self, lemming):
+        """Bring a fast-forwarded lemming's rect and vy up to the current tick."""
+        plan = lemming.fall_plan
+        lemming.rect.y, lemming.vy = plan.state_after(self.tick - (plan.end_tick - plan.ticks))
+
+    def _sync_sleepers(self):
+        for sleepers in self._sleepers.values():
+            for lemming in sleepers:
+                self._sync(lemming)
+
+    def _update_swarm(self, now):
+        exited = self.swarm.step(self.tilemap, self.zones)
+        if exited:
+            self._record_exits(exited, now)
+
+    def _record_exits(self, count, now):
+        self.exit_count += count
+        if (not self.completed and
+                self.exit_count >= self.target_exits):
+            self.completed = True
+            self.end_time = now
+            self._calculate_score()
+
+    def _first_lemming_center(self):
+        """
+        World-pixel center of the earliest spawned lemming still in play.
+        """
+        if self.swarm is not None:
+            slots = self.swarm.live_slots()
+            if not len(slots):
+                return None
+            return self.swarm.rect(slots[0]).center
+        first = self.lemmings.first()
+        if first is not None:
+            if first.fall_plan is not None:
+                self._sync(first)
+            return first.rect.center
+        return None
+
     def _spawn_lemming(self):
         """
         Create a new Lemming at the spawn point (tile -> pixel) and add it.
+        Lemmings are numbered in spawn order.
         """
         px = self.spawn_point[0] * TILE_SIZE + (TILE_SIZE // 2)
         py = self.spawn_point[1] * TILE_SIZE
-        lemming = Lemming((px, py))
-        self.lemmings.add(lemming)
+        lemming_id = self.spawned
+        self.spawned += 1
+        if self.recorder is not None:
+            self.recorder.spawned(self.tick, lemming_id)
+        if self.swarm is not None:
+            self.swarm.spawn((px, py))
+            return
+        lemming = self.lemmings.spawn((px, py), lemming_id)
+        self.hit_index.move(lemming, *lemming.rect.center)
+        self._recheck.add(lemming)
+
+    def _remove_lemming(self, lemming):
+        """
+        Take a lemming out of play (exited or fell off the map).
+        """
+        self.lemmings.release(lemming)
+        self.blockers.remove(lemming)
+        self.hit_index.remove(lemming)
+        self._recheck.discard(lemming)
 
     def _calculate_score(self):
         """
@@ -113,7 +683,7 @@ class Level:
         self.score = self.exit_count * 100 + time_bonus
 
     def get_elapsed_time(self):
-        end = self.end_time if self.end_time is not None else pygame.time.get_ticks()
+        end = self.end_time if self.end_time is not None else self._now()
         return (end - self.start_time) / 1000.0
 
     def get_score(self):
@@ -125,13 +695,150 @@ class Level:
         time_bonus = max(0, int(100 - elapsed))
         return self.exit_count * 100 + time_bonus
 
-    def draw(self, surface):
+    def remember_positions(self):
+        """
+        Keep where the camera and lemmings are now, as the state draw()
+        interpolates from. A fixed-step loop calls this before the last
+        update() of a frame, then draws at alpha, the fraction of a tick
+        its clock has run past that update.
+        """
+        ids, xs, ys = self._positions()
+        self._previous = (self.camera.topleft, ids, xs, ys)
+
+    def view(self, alpha=1.0):
+        """The camera rect as drawn at alpha (see remember_positions)."""
+        if not self._interpolating(alpha):
+            return self.camera
+        (px, py), _, _, _ = self._previous
+        x, y = self.camera.topleft
+        return pygame.Rect(px + round((x - px) * alpha), py + round((y - py) * alpha),
+                           self.camera.width, self.camera.height)
+
+    def world_pos(self, pos, alpha=1.0):
+        """The world pixel under screen position pos, as drawn at alpha."""
+        view = self.view(alpha)
+        return pos[0] + view.x, pos[1] + view.y
+
+    def _interpolating(self, alpha):
+        return alpha < 1.0 and self._previous is not None
+
+    def _positions(self):
+        """(ids, xs, ys) arrays of the lemmings in play, in spawn order."""
+        if self.swarm is not None:
+            slots = self.swarm.live_slots()
+            return self.swarm.ids[slots], self.swarm.x[slots], self.swarm.y[slots]
+        self._sync_sleepers()
+        n = len(self.lemmings)
+        ids = np.fromiter((l.lemming_id for l in self.lemmings), np.int64, n)
+        xs = np.fromiter((l.rect.x for l in self.lemmings), np.int64, n)
+        ys = np.fromiter((l.rect.y for l in self.lemmings), np.int64, n)
+        return ids, xs, ys
+
+    def lemming_arrays(self):
         """
-        Draw the tilemap first, then draw each lemming, applying the camera offset.
+        (ids, xs, ys, states, umbrellas) arrays of the lemmings in play, in
+        spawn order: world topleft, state code (index into STATE_NAMES) and
+        whether each has an umbrella. The arrays are copies.
         """
+        if self.swarm is not None:
+            swarm = self.swarm
+            slots = swarm.live_slots()
+            return (swarm.ids[slots], swarm.x[slots], swarm.y[slots],
+                    swarm.state[slots], swarm.umbrella[slots])
+        ids, xs, ys = self._positions()
+        n = len(ids)
+        states = np.fromiter((_STATE_CODES[l.state] for l in self.lemmings), np.uint8, n)
+        umbrellas = np.fromiter((l.has_umbrella for l in self.lemmings), np.bool_, n)
+        return ids, xs, ys, states, umbrellas
+
+    def _lerp(self, ids, xs, ys, alpha):
+        """lerp_positions() from the positions kept by remember_positions()."""
+        return lerp_positions(self._previous[1:], ids, xs, ys, alpha)
+
+    def draw(self, surface, alpha=1.0):
+        """
+        Draw the tilemap first, then draw each lemming, applying the camera
+        offset. With alpha < 1, everything is drawn alpha of the way from
+        the positions kept by remember_positions() to the current ones.
+        """
+        view = self.view(alpha)
         # Draw tiles (ground and exit) offset by the camera
-        self.tilemap.draw(surface, (self.camera.x, self.camera.y))
+        with profiler.scope("draw.tilemap"):
+            self.tilemap.draw(surface, (view.x, view.y))
 
         # Draw each lemming at its world‐position minus camera‐offset
-        for lemming in self.lemmings:
-            lemming.draw(surface, self.camera)
+        with profiler.scope("draw.lemmings"):
+            self.draw_lemmings(surface, alpha=alpha)
+
+    def draw_lemmings(self, surface, areas=None, alpha=1.0):
+        """
+        Draw the lemmings; with areas (a list of screen rects), only their
+        parts inside them (bounds include an umbrella). The hover
+        outline (see update_hover) goes on top. alpha is as for draw().
+        """
+        view = self.view(alpha)
+        if self.swarm is not None:
+            positions = None
+            if self._interpolating(alpha):
+                positions = self._lerp(*self._positions(), alpha)
+            self.swarm.draw(surface, view, areas, positions)
+        else:
+            self._draw_sprites(surface, areas, view, alpha)
+        outline = self.hover_bounds(alpha)
+        if outline is None:
+            return
+        outline.move_ip(-view.x, -view.y)
+        draw_outline(surface, outline, areas)
+
+    def _placed_sprites(self, alpha):
+        """(lemming, x, y) for every sprite in play, as drawn at alpha."""
+        self._sync_sleepers()
+        if not self._interpolating(alpha):
+            return ((lemming, lemming.rect.x, lemming.rect.y) for lemming in self.lemmings)
+        xs, ys = self._lerp(*self._positions(), alpha)
+        return zip(list(self.lemmings), xs.tolist(), ys.tolist())
+
+    def _draw_sprites(self, surface, areas, view, alpha):
+        # Cull against the camera, then draw everything left from the
+        # sprite atlas in one blits() call
+        atlas = sprite_atlas()
+        image = atlas.surface
+        cam_x, cam_y = view.x, view.y
+        blits = []
+        for lemming, x, y in self._placed_sprites(alpha):
+            rect = lemming.rect
+            bounds = draw_bounds(rect)
+            if x != rect.x or y != rect.y:
+                bounds.move_ip(x - rect.x, y - rect.y)
+            if not view.colliderect(bounds):
+                continue
+            if areas is not None and bounds.move(-cam_x, -cam_y).collidelist(areas) == -1:
+                continue
+            area, (dx, dy) = atlas.frame(lemming.state, lemming.has_umbrella)
+            blits.append((image, (x - cam_x + dx, y - cam_y + dy), area))
+        if areas is not None:
+            blits = clip_blits(blits, areas)
+        surface.blits(blits, False)
+
+    def lemming_rects(self, alpha=1.0):
+        """
+        Yield (key, world rect, umbrella shown) for every lemming in play,
+        placed as drawn at alpha. Keys are stable for a lemming's lifetime.
+        """
+        if self.swarm is not None:
+            swarm = self.swarm
+            slots = swarm.live_slots()
+            if self._interpolating(alpha):
+                xs, ys = self._lerp(*self._positions(), alpha)
+            else:
+                xs, ys = swarm.x[slots], swarm.y[slots]
+            for slot, x, y in zip(slots.tolist(), xs.tolist(), ys.tolist()):
+                shown = bool(swarm.umbrella[slot]) and swarm.state[slot] == FALLING
+                yield int(swarm.ids[slot]), pygame.Rect(x, y, swarm.size, swarm.size), shown
+            return
+        for lemming, x, y in self._placed_sprites(alpha):
+            shown = lemming.has_umbrella and lemming.state == "falling"
+            rect = lemming.rect
+            if x != rect.x or y != rect.y:
+                rect = rect.move(x - rect.x, y - rect.y)
+            yield lemming, rect, shown
@@ -1,50 +1,145 @@
 import pygame
 import sys
 import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
 from tilemap import TILE_SIZE
+from level_format import BINARY_EXTENSION, TILE_CODES, level_layout, load_level
+from solver import solve
+from autosave import MapSaver
+from fonts import LazyFont
+from tile_edits import EditHistory, Stroke, fill_rect, flood_fill
 
 # Default map dimensions if creating new maps
 DEFAULT_COLS = 40
 DEFAULT_ROWS = 30
 
+# The window fits the map up to this size; larger maps scroll
+MAX_WINDOW = (1280, 800)
+BAR_HEIGHT = 40  # space for instructions
+
 # Colors for tiles
 COLORS = {
     '#': (100, 100, 100),
     'E': (50, 50, 200),
     '.': (0, 0, 0)
 }
+GRID_COLOR = (40, 40, 40)
 
 # Order in which tiles are cycled/selected
 TILE_TYPES = ['#', 'E', '.']
 
+# Editing tools: click/drag to paint, drag a rectangle to fill, flood fill
+TOOLS = {pygame.K_p: "paint", pygame.K_r: "rect", pygame.K_f: "fill"}
+
 FONT_COLOR = (255, 255, 255)
 BACKGROUND = (0, 0, 0)
 
+# Zoom levels in screen pixels per tile; the tile grid is outlined from
+# GRID_MIN_ZOOM up
+ZOOM_LEVELS = (1, 2, 4, 8, 16, 32)
+GRID_MIN_ZOOM = 8
+PAN_SPEED = 800  # screen pixels per second while an arrow key is held
+
+# The map is drawn from cached surfaces of CHUNK_PIXELS × CHUNK_PIXELS
+# screen pixels, rendered at the current zoom and patched cell by cell on
+# edits. Edits touching more than CELL_REDRAW_LIMIT cells re-render the
+# chunks they touch instead
+CHUNK_PIXELS = 256
+MAX_CACHED_CHUNKS = 160
+CELL_REDRAW_LIMIT = 512
+
+# Tile code -> RGB, as a lookup table for rendering whole chunks at once
+_PALETTE = np.zeros((256, 3), dtype=np.uint8)
+_CODE_COLORS = {}
+for _char, _code in TILE_CODES.items():
+    _PALETTE[_code] = COLORS[_char]
+    _CODE_COLORS[_code] = COLORS[_char]
+
+# Seconds the solver may spend checking a map each time it is saved
+SOLVE_TIME_BUDGET = 5.0
+
+# Seconds between autosaves of a map with unsaved edits
+AUTOSAVE_SECONDS = 30.0
+
+
+def autosave_path(map_file):
+    """Where the creator autosaves map_file: my_map.txt -> my_map.autosave.txt"""
+    root, ext = os.path.splitext(map_file)
+    return f"{root}.autosave{ext}"
+
 class LevelCreator:
-    """Simple GUI tool to create/edit tilemap text files."""
+    """
+    GUI tool to create/edit level files. The map is a NumPy grid of tile
+    codes shown through a scrollable, zoomable viewport; every edit is
+    recorded as a compact TileDiff for undo/redo (see tile_edits).
+
+    Saving (S, and an autosave every AUTOSAVE_SECONDS to autosave_path())
+    happens on a background thread (see autosave.MapSaver), as does the
+    solver check after each save, so the editor never stalls.
+    """
 
     def __init__(self, map_file=None, cols=DEFAULT_COLS, rows=DEFAULT_ROWS):
         self.map_file = map_file
+        self.spawn_point = None
+        self.target_exits = None
+        self.layout = None  # how the loaded map was stored (see level_format.level_layout)
         if map_file and os.path.exists(map_file):
-            self.map_data = self._load_map(map_file)
-            self.rows = len(self.map_data)
-            self.cols = len(self.map_data[0]) if self.rows > 0 else 0
+            self.grid = self._load_map(map_file)
         else:
-            self.cols = cols
-            self.rows = rows
-            self.map_data = [['.' for _ in range(self.cols)] for _ in range(self.rows)]
+            self.grid = np.zeros((rows, cols), dtype=np.uint8)
+        self.rows, self.cols = self.grid.shape
         self.selected_index = 0
         self.selected = TILE_TYPES[self.selected_index]
-        w = self.cols * TILE_SIZE
-        h = self.rows * TILE_SIZE + 40  # space for instructions
+        self.tool = "paint"
+        self.history = EditHistory()
+        self._stroke = None        # Stroke being painted, and its mouse button
+        self._stroke_button = None
+        self._rect_start = None    # (col, row, code, button) of a rectangle drag
+        self._panning = False
+
+        w = min(self.cols * TILE_SIZE, MAX_WINDOW[0])
+        h = min(self.rows * TILE_SIZE, MAX_WINDOW[1] - BAR_HEIGHT) + BAR_HEIGHT
         self.screen = pygame.display.set_mode((w, h))
+        self.view = pygame.Rect(0, 0, w, h - BAR_HEIGHT)
         pygame.display.set_caption("Level Creator")
-        self.font = pygame.font.SysFont(None, 24)
+        self.font = LazyFont(24)
+
+        self.zoom = ZOOM_LEVELS.index(TILE_SIZE)
+        self.camera = [0, 0]  # view offset into the map, in screen pixels
+        # Rendered chunks at the current zoom, least recently drawn first
+        self._chunks = OrderedDict()
+
+        self.saver = MapSaver()
+        self._unsaved = False       # edits since the last save request
+        self._unautosaved = False   # edits since the last autosave request
+        self._last_autosave = time.monotonic()
+        if map_file:
+            backup = autosave_path(map_file)
+            if os.path.exists(backup) and (not os.path.exists(map_file)
+                                           or os.path.getmtime(backup) > os.path.getmtime(map_file)):
+                print(f"Note: {backup} has unsaved edits from an earlier session")
 
     def _load_map(self, filename):
-        with open(filename, 'r') as f:
-            lines = [line.rstrip('\n') for line in f]
-        return [list(line) for line in lines]
+        data = load_level(filename)
+        # Keep header fields of binary levels so saving preserves them
+        self.spawn_point = data.spawn_point
+        self.target_exits = data.target_exits
+        self.layout = level_layout(filename)
+        return np.array(np.frombuffer(data.tiles, dtype=np.uint8)).reshape(data.rows, data.cols)
+
+    @property
+    def tile_px(self):
+        """Screen pixels per tile at the current zoom."""
+        return ZOOM_LEVELS[self.zoom]
+
+    @property
+    def chunk_tiles(self):
+        """Tiles per side of a cached chunk at the current zoom."""
+        return CHUNK_PIXELS // self.tile_px
 
     def run(self):
         clock = pygame.time.Clock()
@@ -54,79 +149,342 @@ class LevelCreator:
                 if event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        running = False
-                    elif event.key == pygame.K_1:
-                        self.selected_index = 0
-                    elif event.key == pygame.K_2:
-                        self.selected_index = 1
-                    elif event.key == pygame.K_3:
-                        self.selected_index = 2
-                    elif event.key == pygame.K_s:
-                        if self.map_file:
-                            self._save_map(self.map_file)
-                            print(f"Saved to {self.map_file}")
-                    self.selected = TILE_TYPES[self.selected_index]
+                    running = self._on_key(event)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        self._place_tile(event.pos, TILE_TYPES[self.selected_index])
-                    elif event.button == 3:
-                        self._place_tile(event.pos, '.')
-                    elif event.button == 4:  # scroll up
-                        self.selected_index = (self.selected_index - 1) % len(TILE_TYPES)
-                        self.selected = TILE_TYPES[self.selected_index]
-                    elif event.button == 5:  # scroll down
-                        self.selected_index = (self.selected_index + 1) % len(TILE_TYPES)
-                        self.selected = TILE_TYPES[self.selected_index]
+                    self._on_mouse_down(event)
+                elif event.type == pygame.MOUSEMOTION:
+                    self._on_mouse_motion(event)
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    self._on_mouse_up(event)
+            self._pan_with_keys(clock.get_time() / 1000)
+            self._autosave_if_due()
+            self._collect_saves()
             self._draw()
             pygame.display.flip()
             clock.tick(60)
+        if self._unsaved:
+            self._autosave_if_due(force=True)  # keep unsaved edits on quit
+        if self.saver.pending:
+            print("Waiting for saves to finish...")
+        self.saver.close()
+        self._collect_saves()
         pygame.quit()
 
-    def _place_tile(self, pos, tile_char):
-        x, y = pos
-        col = x // TILE_SIZE
-        row = y // TILE_SIZE
-        if row < self.rows and col < self.cols:
-            self.map_data[row][col] = tile_char
+    # ------------------------------------------------------------------
+    # Input
+    # ------------------------------------------------------------------
+
+    def _on_key(self, event):
+        """Handle a key press; returns False to quit."""
+        ctrl = event.mod & pygame.KMOD_CTRL
+        if event.key == pygame.K_ESCAPE:
+            return False
+        elif event.key == pygame.K_1:
+            self.selected_index = 0
+        elif event.key == pygame.K_2:
+            self.selected_index = 1
+        elif event.key == pygame.K_3:
+            self.selected_index = 2
+        elif ctrl and event.key == pygame.K_z:
+            if event.mod & pygame.KMOD_SHIFT:
+                self._redo()
+            else:
+                self._undo()
+        elif ctrl and event.key == pygame.K_y:
+            self._redo()
+        elif event.key == pygame.K_s:
+            if self.map_file:
+                self._save_map(self.map_file)
+        elif event.key in TOOLS:
+            self.tool = TOOLS[event.key]
+        elif event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+            self._set_zoom(self.zoom + 1, self.view.center)
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self._set_zoom(self.zoom - 1, self.view.center)
+        self.selected = TILE_TYPES[self.selected_index]
+        return True
+
+    def _on_mouse_down(self, event):
+        if event.button == 2:
+            self._panning = True
+        elif event.button in (1, 3):
+            if not self.view.collidepoint(event.pos):
+                return
+            tile_char = TILE_TYPES[self.selected_index] if event.button == 1 else '.'
+            code = TILE_CODES[tile_char]
+            col, row = self._cell_at(event.pos)
+            if self.tool == "paint":
+                self._stroke = Stroke(self.grid, code)
+                self._stroke_button = event.button
+                self._cells_changed(self._stroke.paint(col, row))
+            elif self.tool == "rect":
+                self._rect_start = (col, row, code, event.button)
+            else:
+                self._record(flood_fill(self.grid, row, col, code))
+        elif event.button in (4, 5):
+            step = -1 if event.button == 4 else 1
+            if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                self._set_zoom(self.zoom - step, event.pos)  # wheel up zooms in
+            else:
+                self.selected_index = (self.selected_index + step) % len(TILE_TYPES)
+                self.selected = TILE_TYPES[self.selected_index]
+
+    def _on_mouse_motion(self, event):
+        if self._panning:
+            self.camera[0] -= event.rel[0]
+            self.camera[1] -= event.rel[1]
+            self._clamp_camera()
+        if self._stroke is not None:
+            self._cells_changed(self._stroke.paint(*self._cell_at(event.pos)))
+
+    def _on_mouse_up(self, event):
+        if event.button == 2:
+            self._panning = False
+        elif self._stroke is not None and event.button == self._stroke_button:
+            self.history.push(self._stroke.finish())
+            self._stroke = None
+        elif self._rect_start is not None and event.button == self._rect_start[3]:
+            col0, row0, code, _ = self._rect_start
+            col1, row1 = self._cell_at(event.pos)
+            self._rect_start = None
+            self._record(fill_rect(self.grid, row0, col0, row1, col1, code))
+
+    def _pan_with_keys(self, seconds):
+        keys = pygame.key.get_pressed()
+        step = int(PAN_SPEED * seconds)
+        dx = (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * step
+        dy = (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * step
+        if dx or dy:
+            self.camera[0] += dx
+            self.camera[1] += dy
+            self._clamp_camera()
+
+    # ------------------------------------------------------------------
+    # Viewport
+    # ------------------------------------------------------------------
+
+    def _cell_at(self, pos):
+        """(col, row) of the tile under a screen position (may be off the map)."""
+        px = self.tile_px
+        return (pos[0] + self.camera[0]) // px, (pos[1] + self.camera[1]) // px
+
+    def _clamp_camera(self):
+        px = self.tile_px
+        self.camera[0] = max(0, min(self.camera[0], self.cols * px - self.view.width))
+        self.camera[1] = max(0, min(self.camera[1], self.rows * px - self.view.height))
+
+    def _set_zoom(self, zoom, pos):
+        """Change the zoom level, keeping the map point under pos in place."""
+        zoom = max(0, min(zoom, len(ZOOM_LEVELS) - 1))
+        if zoom == self.zoom:
+            return
+        old_px = self.tile_px
+        self.zoom = zoom
+        new_px = self.tile_px
+        for axis in (0, 1):
+            self.camera[axis] = (self.camera[axis] + pos[axis]) * new_px // old_px - pos[axis]
+        self._clamp_camera()
+        self._chunks.clear()
+
+    # ------------------------------------------------------------------
+    # Editing
+    # ------------------------------------------------------------------
+
+    def _record(self, diff):
+        """Add an applied edit to the undo history and show it."""
+        self.history.push(diff)
+        if diff:
+            self._tiles_changed(diff.indices())
+
+    def _undo(self):
+        diff = self.history.undo(self.grid)
+        if diff is not None:
+            self._tiles_changed(diff.indices())
+
+    def _redo(self):
+        diff = self.history.redo(self.grid)
+        if diff is not None:
+            self._tiles_changed(diff.indices())
+
+    def _cells_changed(self, cells):
+        """Show edits to the (col, row) cells given."""
+        if cells:
+            cols, rows = np.array(cells).T
+            self._tiles_changed(rows * self.cols + cols)
+
+    def _tiles_changed(self, indices):
+        """
+        Bring the cached chunks up to date after the tiles at these flat
+        indices changed: patch the cells in place or, when there are many,
+        drop the chunks in their bounding box to be re-rendered.
+        """
+        if not len(indices):
+            return
+        rows = indices // self.cols
+        self.saver.mark_rows(int(rows.min()), int(rows.max()))
+        self._unsaved = self._unautosaved = True
+        if not self._chunks:
+            return
+        n = self.chunk_tiles
+        cols = indices % self.cols
+        if len(indices) > CELL_REDRAW_LIMIT:
+            first_col, last_col = cols.min() // n, cols.max() // n
+            first_row, last_row = rows.min() // n, rows.max() // n
+            for key in [key for key in self._chunks
+                        if first_col <= key[0] <= last_col and first_row <= key[1] <= last_row]:
+                del self._chunks[key]
+            return
+        px = self.tile_px
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            chunk = self._chunks.get((col // n, row // n))
+            if chunk is None:
+                continue
+            rect = ((col % n) * px, (row % n) * px, px, px)
+            chunk.fill(_CODE_COLORS.get(int(self.grid[row, col]), BACKGROUND), rect)
+            if px >= GRID_MIN_ZOOM:
+                pygame.draw.rect(chunk, GRID_COLOR, rect, 1)
+
+    # ------------------------------------------------------------------
+    # Drawing
+    # ------------------------------------------------------------------
+
+    def _render_chunk(self, key):
+        """Render one chunk of the map at the current zoom."""
+        n = self.chunk_tiles
+        px = self.tile_px
+        chunk_col, chunk_row = key
+        block = self.grid[chunk_row * n:(chunk_row + 1) * n, chunk_col * n:(chunk_col + 1) * n]
+        pixels = _PALETTE[block.repeat(px, axis=0).repeat(px, axis=1)]
+        if px >= GRID_MIN_ZOOM:
+            # Outline every tile, as one-pixel borders on its own rect
+            edge = np.zeros(px, dtype=bool)
+            edge[[0, -1]] = True
+            pixels[np.tile(edge, block.shape[0]), :] = GRID_COLOR
+            pixels[:, np.tile(edge, block.shape[1])] = GRID_COLOR
+        height, width = pixels.shape[:2]
+        surface = pygame.image.frombuffer(pixels.tobytes(), (width, height), "RGB").convert()
+        self._chunks[key] = surface
+        while len(self._chunks) > MAX_CACHED_CHUNKS:
+            self._chunks.popitem(last=False)
+        return surface
 
     def _draw(self):
         self.screen.fill(BACKGROUND)
-        for r, row in enumerate(self.map_data):
-            for c, tile in enumerate(row):
-                color = COLORS.get(tile, BACKGROUND)
-                rect = pygame.Rect(c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                pygame.draw.rect(self.screen, color, rect)
-                pygame.draw.rect(self.screen, (40, 40, 40), rect, 1)
-
-        # Highlight the tile under the mouse with the selected color
+        self.screen.set_clip(self.view)
+        px = self.tile_px
+        n = self.chunk_tiles
+        size = n * px
+        cam_x, cam_y = self.camera
+        first_col = cam_x // size
+        first_row = cam_y // size
+        last_col = min((self.cols - 1) // n, (cam_x + self.view.width - 1) // size)
+        last_row = min((self.rows - 1) // n, (cam_y + self.view.height - 1) // size)
+        for chunk_row in range(first_row, last_row + 1):
+            for chunk_col in range(first_col, last_col + 1):
+                key = (chunk_col, chunk_row)
+                chunk = self._chunks.get(key)
+                if chunk is None:
+                    chunk = self._render_chunk(key)
+                else:
+                    self._chunks.move_to_end(key)
+                self.screen.blit(chunk, (chunk_col * size - cam_x, chunk_row * size - cam_y))
+
+        # Preview the rectangle being dragged, or the tile under the mouse,
+        # in the color being placed
         mx, my = pygame.mouse.get_pos()
-        col = mx // TILE_SIZE
-        row = my // TILE_SIZE
-        if row < self.rows and col < self.cols:
-            preview_rect = pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        col, row = self._cell_at((mx, my))
+        if self._rect_start is not None:
+            col0, row0, code, _ = self._rect_start
+            left, right = sorted((col0, col))
+            top, bottom = sorted((row0, row))
+            preview_rect = pygame.Rect(left * px - cam_x, top * px - cam_y,
+                                       (right - left + 1) * px, (bottom - top + 1) * px)
+            highlight_color = _CODE_COLORS.get(code, (255, 255, 255))
+            pygame.draw.rect(self.screen, highlight_color, preview_rect, 2)
+        elif self.view.collidepoint(mx, my) and row < self.rows and col < self.cols:
+            preview_rect = pygame.Rect(col * px - cam_x, row * px - cam_y, px, px)
             highlight_color = COLORS.get(self.selected, (255, 255, 255))
             pygame.draw.rect(self.screen, highlight_color, preview_rect, 2)
+        self.screen.set_clip(None)
 
         self._draw_instructions()
 
     def _draw_instructions(self):
-        text = (
-            f"Selected: {self.selected}  [1] Ground  [2] Exit  [3] Empty  "
-            "Left Click: place  Right Click: erase  Wheel: cycle  [S] Save  [Esc] Quit"
+        lines = (
+            f"{'* ' if self._unsaved else ''}"
+            f"Selected: {self.selected}  Tool: {self.tool}  Zoom: {self.tile_px}px  "
+            "[1] Ground  [2] Exit  [3] Empty  [P] Paint  [R] Rectangle  [F] Flood fill",
+            "Left: place  Right: erase  Wheel: cycle  Ctrl+Wheel/+/-: zoom  "
+            "Arrows/Middle drag: scroll  Ctrl+Z/Y: undo/redo  [S] Save  [Esc] Quit",
         )
-        img = self.font.render(text, True, FONT_COLOR)
-        rect = img.get_rect()
-        rect.topleft = (5, self.rows * TILE_SIZE + 5)
-        self.screen.blit(img, rect)
+        for i, text in enumerate(lines):
+            img = self.font.render(text, True, FONT_COLOR)
+            rect = img.get_rect()
+            rect.topleft = (5, self.view.bottom + 3 + i * 18)
+            self.screen.blit(img, rect)
+
+    def _check_solvable(self, filename):
+        """
+        Run the solver on the saved map (on the saver's thread) and return
+        its SolveResult. Maps without a stored target are checked against
+        the one the game plays them with.
+        """
+        return solve(filename, self.target_exits, time_budget=SOLVE_TIME_BUDGET)
 
     def _save_map(self, filename):
-        with open(filename, 'w') as f:
-            for row in self.map_data:
-                f.write(''.join(row) + '\n')
+        """
+        Queue a save of the map to filename, followed by a solver check.
+        Returns at once; _collect_saves() reports the outcome. Binary
+        levels keep the layout they were loaded with; a binary level is
+        never overwritten with text.
+        """
+        if self.layout not in (None, "text") and not filename.endswith(BINARY_EXTENSION):
+            print(f"Not saving: {filename} holds a {self.layout} binary level; "
+                  f"give it a {BINARY_EXTENSION} name to edit it")
+            pygame.display.set_caption(f"Level Creator - not saved: {filename} is a binary level")
+            return
+        snapshot = self.saver.snapshot(self.grid)
+        self.saver.save(snapshot, filename, self.spawn_point, self.target_exits,
+                        self._binary_layout(),
+                        remove=autosave_path(filename),
+                        then=lambda: self._check_solvable(filename))
+        self._unsaved = self._unautosaved = False
+        pygame.display.set_caption(f"Level Creator - saving {filename}...")
+
+    def _binary_layout(self):
+        """The layout to save binary levels in: the one the map was loaded from."""
+        return "raw" if self.layout in (None, "text") else self.layout
+
+    def _autosave_if_due(self, force=False):
+        now = time.monotonic()
+        if not (self.map_file and self._unautosaved
+                and (force or now - self._last_autosave >= AUTOSAVE_SECONDS)):
+            return
+        self._last_autosave = now
+        self._unautosaved = False
+        self.saver.save(self.saver.snapshot(self.grid), autosave_path(self.map_file),
+                        self.spawn_point, self.target_exits, self._binary_layout(), autosave=True)
+
+    def _collect_saves(self):
+        """Report finished background saves (and their solver results)."""
+        for result in self.saver.results():
+            if result.error is not None:
+                print(f"Saving {result.path} failed: {result.error}")
+                pygame.display.set_caption(f"Level Creator - saving {result.path} failed")
+            elif result.autosave:
+                print(f"Autosaved to {result.path} ({result.seconds:.2f}s)")
+            elif result.then_error is not None:
+                print(f"Saved to {result.path}")
+                print(f"Solver failed: {result.then_error}")
+                pygame.display.set_caption(f"Level Creator - saved, solver failed: "
+                                           f"{result.then_error}")
+            else:
+                print(f"Saved to {result.path}")
+                print(f"Solver: {result.value}")
+                pygame.display.set_caption(f"Level Creator - {result.value}")
 
 if __name__ == '__main__':
-    pygame.init()
+    pygame.display.init()  # fonts are loaded when first drawn (see fonts.py)
     file_arg = sys.argv[1] if len(sys.argv) > 1 else 'new_map.txt'
     creator = LevelCreator(file_arg)
     creator.run()
@@ -0,0 +1,432 @@
+# level_format.py
+"""
+Reading and writing level files.
+
+Two formats are supported:
+  - text: one line per row, one character per tile ('#', 'E', '.'). The
+    spawn point and exit target, when set, go in a JSON sidecar next to
+    the map (meta_path(): my_map.txt -> my_map.meta.json)
+  - binary (.pplv): a fixed header followed by the tile grid, either raw
+    (one code byte per tile, row-major), run-length encoded, or chunked
+    (CHUNK_TILES × CHUNK_TILES blocks, each row-major, stored block by
+    block and padded with empty tiles at the right and bottom edges)
+
+Raw binary grids are opened with a copy-on-write mmap, so even a huge map
+opens instantly and its pages are only read when touched. Edits stay in
+memory and never reach the file.
+
+Chunked levels are meant for worlds too big to hold in memory: a
+ChunkFile reads and writes single blocks, which is what
+chunked_tilemap.ChunkedTileMap streams from. load_level() still reads
+them whole, for tools that want the full grid.
+
+Convert between the formats with:
+
+    python level_format.py to-binary level1_map.txt level1.pplv [--rle | --chunked]
+    python level_format.py to-text level1.pplv level1_map.txt
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Integer tile codes stored in the grid
+EMPTY = 0
+SOLID = 1
+EXIT = 2
+
+TILE_CODES = {".": EMPTY, "#": SOLID, "E": EXIT}
+TILE_CHARS = {code: char for char, code in TILE_CODES.items()}
+
+# bytes.translate tables between file characters and tile codes;
+# unknown characters become EMPTY
+_CHAR_TO_CODE = bytearray(256)
+for _char, _code in TILE_CODES.items():
+    _CHAR_TO_CODE[ord(_char)] = _code
+_CHAR_TO_CODE = bytes(_CHAR_TO_CODE)
+_CODE_TO_CHAR = bytearray(b"." * 256)
+for _code, _char in TILE_CHARS.items():
+    _CODE_TO_CHAR[_code] = ord(_char)
+_CODE_TO_CHAR = bytes(_CODE_TO_CHAR)
+
+BINARY_EXTENSION = ".pplv"
+META_SUFFIX = ".meta.json"
+MAGIC = b"PPLV"
+VERSION = 1
+FLAG_RLE = 0x1
+FLAG_CHUNKED = 0x2
+
+CHUNK_TILES = 64  # tiles per side of a chunked level's blocks (4 KiB each)
+
+# magic, version, flags, cols, rows, spawn col, spawn row, target exits,
+# block size in tiles (chunked levels; 0 otherwise)
+_HEADER = struct.Struct("<4sHHIIiiII")
+_NO_SPAWN = -1
+_NO_TARGET = 0xFFFFFFFF  # 0 is a valid target: a level won without any exits
+_RLE_RUN = struct.Struct("<HB")  # run length (1..65535), tile code
+_MAX_RUN = 0xFFFF
+
+
+class LevelFormatError(ValueError):
+    """Raised for files that are not valid level files."""
+
+
+class LevelData:
+    """
+    A loaded level: grid size, tile codes (a row-major bytearray, or a
+    memoryview over a copy-on-write mmap) and the optional spawn point
+    (col, row) and exit target from the header.
+    """
+
+    def __init__(self, rows, cols, tiles, spawn_point=None, target_exits=None):
+        self.rows = rows
+        self.cols = cols
+        self.tiles = tiles
+        self.spawn_point = spawn_point
+        self.target_exits = target_exits
+
+    @classmethod
+    def from_rows(cls, rows, spawn_point=None, target_exits=None):
+        """
+        Build from rows of tile characters (strings or lists of chars).
+        Short rows are padded with empty tiles.
+        """
+        lines = ["".join(row).encode("ascii", "replace") for row in rows]
+        return cls(*_parse_lines(lines), spawn_point, target_exits)
+
+    def to_rows(self):
+        """The grid as a list of strings of tile characters."""
+        text = bytes(self.tiles).translate(_CODE_TO_CHAR).decode("ascii")
+        return [text[r * self.cols:(r + 1) * self.cols] for r in range(self.rows)]
+
+
+def is_binary_level(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def is_chunked_level(path):
+    """True if path is a binary level stored in chunks."""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    return (len(header) == _HEADER.size and header[:len(MAGIC)] == MAGIC
+            and bool(_HEADER.unpack(header)[2] & FLAG_CHUNKED))
+
+
+def level_layout(path):
+    """
+    How the level at path is stored: "text", "raw", "rle" or "chunked".
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if header[:len(MAGIC)] != MAGIC:
+        return "text"
+    if len(header) < _HEADER.size:
+        raise LevelFormatError(f"{path}: truncated header")
+    flags = _HEADER.unpack(header)[2]
+    if flags & FLAG_CHUNKED:
+        return "chunked"
+    return "rle" if flags & FLAG_RLE else "raw"
+
+
+def load_level(path):
+    """
+    Load a level in either format (detected from the file contents).
+    """
+    if is_binary_level(path):
+        return load_binary(path)
+    return load_text(path)
+
+
+def save_level(path, data, rle=False, chunked=False):
+    """
+    Save in binary if path ends with BINARY_EXTENSION, otherwise as text.
+    """
+    if path.endswith(BINARY_EXTENSION):
+        save_binary(path, data, rle=rle, chunked=chunked)
+    else:
+        save_text(path, data)
+
+
+def _parse_lines(lines):
+    """
+    Turn byte lines of tile characters into (rows, cols, tiles). Short
+    lines are padded with empty tiles so the grid is always rectangular.
+    """
+    rows = len(lines)
+    cols = max((len(line) for line in lines), default=0)
+    tiles = bytearray(
+        b"".join(line.ljust(cols, b".") for line in lines).translate(_CHAR_TO_CODE)
+    )
+    return rows, cols, tiles
+
+
+def load_text(path):
+    with open(path, "rb") as f:
+        rows, cols, tiles = _parse_lines(f.read().splitlines())
+    return LevelData(rows, cols, tiles, *_read_meta(path))
+
+
+def save_text(path, data):
+    """
+    Write the map and its sidecar (or remove a stale sidecar if the map
+    has neither a spawn point nor a target).
+    """
+    with open(path, "wb") as f:
+        f.write(encode_text(data.tiles, data.cols))
+    meta = encode_meta(data.spawn_point, data.target_exits)
+    if meta is not None:
+        with open(meta_path(path), "wb") as f:
+            f.write(meta)
+    elif os.path.exists(meta_path(path)):
+        os.remove(meta_path(path))
+
+
+def meta_path(path):
+    """The sidecar of a text map: my_map.txt -> my_map.meta.json"""
+    return os.path.splitext(path)[0] + META_SUFFIX
+
+
+def encode_meta(spawn_point, target_exits):
+    """A text map's sidecar contents, or None if there is nothing to store."""
+    meta = {}
+    if spawn_point is not None:
+        meta["spawn"] = list(spawn_point)
+    if target_exits is not None:
+        meta["target_exits"] = target_exits
+    if not meta:
+        return None
+    return (json.dumps(meta, indent=2) + "\n").encode("ascii")
+
+
+def _read_meta(path):
+    """(spawn_point, target_exits) from a text map's sidecar, None where unset."""
+    try:
+        with open(meta_path(path), "rb") as f:
+            meta = json.loads(f.read())
+    except FileNotFoundError:
+        return None, None
+    except ValueError as exc:
+        raise LevelFormatError(f"{meta_path(path)}: {exc}") from None
+    spawn = meta.get("spawn")
+    return (tuple(spawn) if spawn is not None else None), meta.get("target_exits")
+
+
+def encode_text(tiles, cols):
+    """Row-major tile codes -> the text format's bytes, one line per row."""
+    codes = np.frombuffer(bytes(tiles), dtype=np.uint8).reshape(-1, cols)
+    lines = np.empty((len(codes), cols + 1), dtype=np.uint8)
+    lines[:, :cols] = np.frombuffer(_CODE_TO_CHAR, dtype=np.uint8)[codes]
+    lines[:, cols] = ord("\n")
+    return lines.tobytes()
+
+
+def _read_header(f, path):
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise LevelFormatError(f"{path}: truncated header")
+    magic, version, flags, cols, rows, spawn_col, spawn_row, target, block = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise LevelFormatError(f"{path}: not a level file")
+    if version != VERSION:
+        raise LevelFormatError(f"{path}: unsupported version {version}")
+    if flags & FLAG_CHUNKED and not block:
+        raise LevelFormatError(f"{path}: chunked level without a block size")
+    spawn = None if spawn_col == _NO_SPAWN else (spawn_col, spawn_row)
+    return flags, rows, cols, spawn, None if target == _NO_TARGET else target, block
+
+
+def load_binary(path):
+    with open(path, "rb") as f:
+        flags, rows, cols, spawn, target, block = _read_header(f, path)
+
+        size = rows * cols
+        if flags & FLAG_CHUNKED:
+            tiles = _unchunk(f.read(), rows, cols, block, path)
+        elif flags & FLAG_RLE:
+            tiles = _rle_decode(f.read(), size, path)
+        elif size == 0:
+            tiles = bytearray()
+        else:
+            if os.fstat(f.fileno()).st_size < _HEADER.size + size:
+                raise LevelFormatError(f"{path}: truncated tile data")
+            # mmap offsets must be page aligned, so map from the start and
+            # slice the grid out through a memoryview
+            mapped = mmap.mmap(f.fileno(), _HEADER.size + size, access=mmap.ACCESS_COPY)
+            tiles = memoryview(mapped)[_HEADER.size:]
+
+    return LevelData(rows, cols, tiles, spawn, target)
+
+
+def _pack_header(flags, rows, cols, spawn_point, target_exits, block=0):
+    spawn_col, spawn_row = spawn_point if spawn_point else (_NO_SPAWN, _NO_SPAWN)
+    return _HEADER.pack(MAGIC, VERSION, flags, cols, rows,
+                        spawn_col, spawn_row,
+                        _NO_TARGET if target_exits is None else target_exits, block)
+
+
+def save_binary(path, data, rle=False, chunked=False):
+    if rle and chunked:
+        raise ValueError("a level can be run-length encoded or chunked, not both")
+    with open(path, "wb") as f:
+        write_binary(f, data, rle=rle, chunked=chunked)
+
+
+def write_binary(f, data, rle=False, chunked=False):
+    """save_binary() to an open binary file."""
+    flags = (FLAG_RLE if rle else 0) | (FLAG_CHUNKED if chunked else 0)
+    f.write(_pack_header(flags, data.rows, data.cols, data.spawn_point, data.target_exits,
+                         CHUNK_TILES if chunked else 0))
+    if rle:
+        f.write(_rle_encode(data.tiles))
+    elif chunked:
+        f.write(_chunk(data.tiles, data.rows, data.cols, CHUNK_TILES))
+    else:
+        f.write(data.tiles)
+
+
+def create_chunked(path, rows, cols, spawn_point=None, target_exits=None):
+    """
+    Write an all-empty chunked level of rows × cols tiles without building
+    it in memory (the blocks are left as a sparse hole where the file
+    system supports it). Fill it in through a ChunkFile or a
+    ChunkedTileMap opened with persist=True.
+    """
+    blocks = -(-rows // CHUNK_TILES) * -(-cols // CHUNK_TILES)
+    with open(path, "wb") as f:
+        f.write(_pack_header(FLAG_CHUNKED, rows, cols, spawn_point, target_exits, CHUNK_TILES))
+        f.truncate(_HEADER.size + blocks * CHUNK_TILES * CHUNK_TILES)
+
+
+def _chunk(tiles, rows, cols, block):
+    """Row-major tiles -> block-by-block bytes, padded with EMPTY."""
+    block_rows = -(-rows // block)
+    block_cols = -(-cols // block)
+    grid = np.zeros((block_rows * block, block_cols * block), dtype=np.uint8)
+    grid[:rows, :cols] = np.frombuffer(bytes(tiles), dtype=np.uint8).reshape(rows, cols)
+    blocks = grid.reshape(block_rows, block, block_cols, block).swapaxes(1, 2)
+    return blocks.tobytes()
+
+
+def _unchunk(payload, rows, cols, block, path):
+    """Inverse of _chunk: block-by-block bytes -> row-major bytearray."""
+    block_rows = -(-rows // block)
+    block_cols = -(-cols // block)
+    if len(payload) != block_rows * block_cols * block * block:
+        raise LevelFormatError(f"{path}: chunked data does not match the grid size")
+    blocks = np.frombuffer(payload, dtype=np.uint8).reshape(block_rows, block_cols, block, block)
+    grid = blocks.swapaxes(1, 2).reshape(block_rows * block, block_cols * block)
+    return bytearray(grid[:rows, :cols].tobytes())
+
+
+class ChunkFile:
+    """
+    Block-level access to a chunked level: read_block/write_block move one
+    block_size × block_size tile block, addressed by (block col, block row),
+    as bytes. The header fields are exposed as attributes. Opened
+    read-only unless writable is set.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        try:
+            flags, rows, cols, spawn, target, block = _read_header(self._file, path)
+            if not flags & FLAG_CHUNKED:
+                raise LevelFormatError(f"{path}: not a chunked level")
+        except Exception:
+            self._file.close()
+            raise
+        self.rows = rows
+        self.cols = cols
+        self.spawn_point = spawn
+        self.target_exits = target
+        self.block_size = block
+        self.block_bytes = block * block
+        self.block_cols = -(-cols // block)
+        self.block_rows = -(-rows // block)
+
+    def _offset(self, key):
+        block_col, block_row = key
+        return _HEADER.size + (block_row * self.block_cols + block_col) * self.block_bytes
+
+    def read_block(self, key):
+        self._file.seek(self._offset(key))
+        data = self._file.read(self.block_bytes)
+        if len(data) < self.block_bytes:
+            raise LevelFormatError(f"{self.path}: truncated chunked data")
+        return data
+
+    def write_block(self, key, data):
+        self._file.seek(self._offset(key))
+        self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _rle_encode(tiles):
+    codes = np.frombuffer(bytes(tiles), dtype=np.uint8)
+    if not len(codes):
+        return b""
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.concatenate((starts, [len(codes)])))
+    out = bytearray()
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        code = codes[start]
+        while length > 0:
+            run = min(length, _MAX_RUN)
+            out += _RLE_RUN.pack(run, code)
+            length -= run
+    return bytes(out)
+
+
+def _rle_decode(payload, size, path):
+    if len(payload) % _RLE_RUN.size:
+        raise LevelFormatError(f"{path}: corrupt run-length data")
+    runs = np.frombuffer(payload, dtype=[("run", "<u2"), ("code", "u1")])
+    tiles = bytearray(np.repeat(runs["code"], runs["run"]).tobytes())
+    if len(tiles) != size:
+        raise LevelFormatError(f"{path}: run-length data does not match the grid size")
+    return tiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PixelPioneers level files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_binary = sub.add_parser("to-binary", help="text map -> binary level")
+    to_binary.add_argument("source")
+    to_binary.add_argument("dest")
+    layout = to_binary.add_mutually_exclusive_group()
+    layout.add_argument("--rle", action="store_true", help="run-length encode the grid")
+    layout.add_argument("--chunked", action="store_true",
+                        help="store the grid in blocks, for streaming huge worlds")
+    to_binary.add_argument("--spawn", nargs=2, type=int, metavar=("COL", "ROW"))
+    to_binary.add_argument("--target", type=int, help="exits needed to win")
+    to_text = sub.add_parser("to-text", help="binary level -> text map")
+    to_text.add_argument("source")
+    to_text.add_argument("dest")
+    args = parser.parse_args(argv)
+
+    data = load_level(args.source)
+    if args.command == "to-binary":
+        if args.spawn:
+            data.spawn_point = tuple(args.spawn)
+        if args.target is not None:
+            data.target_exits = args.target
+        save_binary(args.dest, data, rle=args.rle, chunked=args.chunked)
+    else:
+        save_text(args.dest, data)
+    print(f"Wrote {args.dest} ({data.rows} rows × {data.cols} cols)")
+
+
+if __name__ == "__main__":
+    main()
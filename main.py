@@ -1,51 +1,184 @@
 # main.py
 
+import argparse
+import time
+
+_STARTED = time.perf_counter()  # --measure-startup times the imports from here
+
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame
 from pygame.locals import QUIT
 from ui import SkillToolbar
 from level import Level
+from pipeline import FrameView, SimulationThread
+from profiler import StartupTimer, profiler
+from render import DirtyRectRenderer
+from replay import Recorder
 
 # Screen dimensions
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
-FPS = 60
+FPS = 60  # default frame rate cap; the simulation runs at Level.tick_rate
+MAX_CATCH_UP = 5  # most simulation steps run in one frame
+DEFAULT_MAP = "level1_map.txt"
+
+def _load_level(map_file):
+    """The Level to play map_file on, and the seconds it took to load."""
+    start = time.perf_counter()
+    level = Level(map_file, SCREEN_WIDTH, SCREEN_HEIGHT, fixed_step=True)
+    return level, time.perf_counter() - start
 
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption("PixelPioneers (Lemmings-Style)")
-    clock = pygame.time.Clock()
+def main(argv=None):
+    timer = StartupTimer(_STARTED)
+    timer.mark("imports")
+    parser = argparse.ArgumentParser(description="PixelPioneers")
+    parser.add_argument("map_file", nargs="?", default=DEFAULT_MAP,
+                        help=f"level to play (default: {DEFAULT_MAP})")
+    parser.add_argument("--profile", action="store_true",
+                        help="start with the profiler overlay on (toggle with F3)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record a Chrome trace and write it to FILE on exit")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="redraw and update only the screen regions that changed")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record spawns and skill assignments to FILE for replay.py")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help=f"frame rate cap, 0 for none (default: {FPS}); "
+                             "game speed doesn't depend on it")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="simulate on a separate thread while the main thread draws")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="print the time to the first frame, by phase, and exit")
+    args = parser.parse_args(argv)
+    if args.profile or args.trace:
+        profiler.enable(trace=bool(args.trace))
 
-    # Create toolbar and level
-    toolbar = SkillToolbar()
-    # Assume you have a map text file called 'level1_map.txt' in the same folder
-    level = Level("level1_map.txt", SCREEN_WIDTH, SCREEN_HEIGHT, target_exits=5)
+    # The level is parsed on a worker thread while the window opens. Only
+    # the display is initialized up front: fonts load when first drawn
+    map_file = args.map_file
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        loading = loader.submit(_load_level, map_file)
+        pygame.display.init()
+        timer.mark("display init")
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("PixelPioneers (Lemmings-Style)")
+        clock = pygame.time.Clock()
+        timer.mark("window")
+        toolbar = SkillToolbar()
+        timer.mark("toolbar")
+        level, load_seconds = loading.result()
+        timer.background("level load", load_seconds)
+        timer.mark("waiting for level")
+    recorder = Recorder(level, map_file) if args.record else None
+
+    # What gets drawn: the level itself, or in pipelined mode the snapshots
+    # published by the simulation thread, which then owns the level
+    simulation = None
+    scene = level
+    if args.pipelined:
+        simulation = SimulationThread(level, MAX_CATCH_UP)
+        scene = FrameView(simulation, map_file)
+        simulation.start()
+    renderer = DirtyRectRenderer(screen, scene, toolbar) if args.dirty_rects else None
+    timer.mark("setup")
+
+    # Fixed-step loop: real time piles up in the accumulator and is spent
+    # in whole simulation ticks, at most MAX_CATCH_UP a frame (after a
+    # longer stall the game slows down instead of stuttering to catch
+    # up). Frames are drawn between the last two ticks, alpha of the way.
+    # In pipelined mode the simulation thread runs the same loop itself
+    tick_seconds = 1.0 / level.tick_rate
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    alpha = 1.0  # as the last frame was drawn at, for mapping clicks
 
     running = True
     while running:
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                running = False
+        with profiler.scope("events"):
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    if profiler.enabled:
+                        profiler.disable()
+                        if renderer is not None:
+                            renderer.invalidate()  # clear the overlay
+                    else:
+                        profiler.enable(trace=bool(args.trace))
 
-            # Let toolbar handle clicks on skill icons
-            toolbar.handle_event(event)
-            # Pass clicks (and the current skill) to level
-            level.handle_event(event, toolbar.selected_skill)
+                # Let toolbar handle clicks on skill icons
+                toolbar.handle_event(event)
+                # Pass clicks (and the current skill) to level
+                if simulation is None:
+                    level.handle_event(event, toolbar.selected_skill, alpha)
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    world_x, world_y = scene.world_pos(event.pos)
+                    simulation.click(world_x, world_y, toolbar.selected_skill)
+        timer.mark("first events")
 
-        # Update game logic
-        level.update()
+        mouse = pygame.mouse.get_pos() if pygame.mouse.get_focused() else None
+        if simulation is not None:
+            # Draw the newest snapshots; the simulation thread keeps ticking
+            alpha = scene.refresh()
+            simulation.hover(scene.world_pos(mouse) if mouse else None,
+                             toolbar.selected_skill)
+        else:
+            # Update game logic
+            now = time.perf_counter()
+            accumulator += now - last_time
+            last_time = now
+            steps = int(accumulator / tick_seconds)
+            if steps > MAX_CATCH_UP:
+                steps = MAX_CATCH_UP
+                accumulator = tick_seconds * steps
+            accumulator -= tick_seconds * steps
+            with profiler.scope("update"):
+                for step in range(steps):
+                    if step == steps - 1:
+                        level.remember_positions()
+                    level.update()
+            alpha = accumulator / tick_seconds
+            level.update_hover(mouse, toolbar.selected_skill, alpha)
         pygame.display.set_caption(
-            f"PixelPioneers - Exits: {level.exit_count}/{level.target_exits} "
-            f"Score: {int(level.get_score())}")
+            f"PixelPioneers - Exits: {scene.exit_count}/{scene.target_exits} "
+            f"Score: {int(scene.get_score())}")
+        timer.mark("first update")
 
         # Draw everything
-        screen.fill((0, 0, 0))
-        level.draw(screen)
-        toolbar.draw(screen, level)
+        dirty = None
+        if renderer is not None:
+            with profiler.scope("draw"):
+                dirty = renderer.render(full=profiler.enabled, alpha=alpha)
+        else:
+            with profiler.scope("draw"):
+                screen.fill((0, 0, 0))
+                scene.draw(screen, alpha)
+            with profiler.scope("toolbar"):
+                toolbar.draw(screen, scene)
+        toolbar.draw_profiler_overlay(screen, profiler)
+        timer.mark("first draw")
 
-        pygame.display.flip()
-        clock.tick(FPS)
+        with profiler.scope("flip"):
+            if dirty is None:
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(dirty)
+        timer.mark("first flip")
+        if not timer.finished:
+            timer.finish()
+            if args.measure_startup:
+                print(timer.report())
+                running = False
+        clock.tick(args.fps)
+        profiler.end_frame()
 
+    if simulation is not None:
+        simulation.stop()
+    if recorder is not None:
+        recorder.finish(args.record)
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,310 @@
+# pipeline.py
+"""
+Pipelined game loop: the simulation on its own thread, drawing on the main
+thread.
+
+A SimulationThread owns the Level and steps it at its tick rate. After
+every tick it publishes a FrameSnapshot (lemming arrays, camera, hover,
+HUD values and the tiles changed by that tick) and keeps the one before,
+so the two newest snapshots are double-buffered: the simulation builds the
+next while the main thread draws between these two. Snapshots are never
+modified once published, and the Level is only touched by the simulation
+thread (clicks and the mouse position are handed over as commands).
+
+On the main thread a FrameView draws the snapshots. It keeps its own copy
+of the map, brought up to date with the tile changes of every snapshot,
+and offers the drawing interface of a Level, so DirtyRectRenderer and
+SkillToolbar work on it unchanged.
+
+    python main.py --pipelined
+
+pygame blits, display updates and the swarm's NumPy batches release the
+GIL, so the two threads overlap on multi-core machines. The sprites engine
+is plain Python and mostly holds it.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pygame
+
+from lemming import LEMMING_SIZE
+from level import lerp_positions, draw_outline, open_tilemap
+from level_format import TILE_CHARS
+from profiler import profiler
+from swarm import FALLING, draw_lemming_arrays
+
+MAX_CATCH_UP = 5  # most ticks simulated back to back after a stall
+
+
+def _frozen(array):
+    array.flags.writeable = False
+    return array
+
+
+class FrameSnapshot:
+    """
+    What the main thread needs to draw one tick, published by
+    SimulationThread and never modified: the lemming arrays (see
+    Level.lemming_arrays, made read-only), the camera as (x, y, width,
+    height), hovered as (lemming id, (x, y, width, height)) or None, the
+    HUD values, and tiles, ((col, row), code) pairs for the tiles changed
+    since the previous snapshot. published is its time.perf_counter().
+    """
+
+    def __init__(self, level, tiles, published):
+        self.tick = level.tick
+        self.published = published
+        self.camera = tuple(level.camera)
+        arrays = level.lemming_arrays()
+        self.ids, self.xs, self.ys, self.states, self.umbrellas = map(_frozen, arrays)
+        hovered = level.hovered
+        self.hovered = (hovered[0], tuple(hovered[1])) if hovered is not None else None
+        self.tiles = tiles
+        self.exit_count = level.exit_count
+        self.target_exits = level.target_exits
+        self.score = level.get_score()
+        self.elapsed = level.get_elapsed_time()
+        self.completed = level.completed
+        self.failed = level.failed
+
+
+class SimulationThread:
+    """
+    Steps a Level tick_rate times a second on a background thread. The
+    level must have been made with fixed_step=True, and not be touched by
+    other threads between start() and stop().
+
+    click() and hover() queue player input for the next tick; take()
+    returns the newest snapshots.
+    """
+
+    def __init__(self, level, max_catch_up=MAX_CATCH_UP):
+        self.level = level
+        self.max_catch_up = max_catch_up
+        level.tilemap.record_changes = True
+        self._cond = threading.Condition()
+        self._clicks = []  # (world x, world y, skill) not applied yet
+        self._hover = (None, None)  # (world position or None, skill)
+        self._stopping = False
+        self._thread = None
+        # Double buffer: the newest snapshot and the one before it, plus
+        # the tile changes published since the last take()
+        self._front = self._publish()
+        self._back = None
+        self._unread_tiles = dict(self._front.tiles)
+        self._fresh = True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="simulation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the tick in progress and wait for the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def click(self, world_x, world_y, skill):
+        """Click at a world pixel with skill selected, on the next tick."""
+        with self._cond:
+            self._clicks.append((world_x, world_y, skill))
+
+    def hover(self, world_pos, skill):
+        """Hover at a world pixel (None when the mouse is away)."""
+        with self._cond:
+            self._hover = (world_pos, skill)
+
+    def take(self):
+        """
+        (previous, newest, tiles): the two newest snapshots (previous is
+        None at first), and the ((col, row), code) of every tile changed
+        since the last call, or None if nothing was published since.
+        """
+        with self._cond:
+            if not self._fresh:
+                return None
+            tiles = self._unread_tiles
+            self._unread_tiles = {}
+            self._fresh = False
+            return self._back, self._front, tiles
+
+    def _run(self):
+        tick_seconds = 1.0 / self.level.tick_rate
+        next_tick = time.perf_counter()
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    wait = next_tick - time.perf_counter()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+                clicks = self._clicks
+                self._clicks = []
+                hover, skill = self._hover
+
+            level = self.level
+            with profiler.scope("sim.update"):
+                for world_x, world_y, click_skill in clicks:
+                    lemming_id = level.lemming_at(world_x, world_y, click_skill)
+                    if lemming_id is not None:
+                        level.assign_skill_to(lemming_id, click_skill)
+                level.update()
+                if hover is not None:
+                    hover = (hover[0] - level.camera.x, hover[1] - level.camera.y)
+                level.update_hover(hover, skill)
+            with profiler.scope("sim.publish"):
+                snapshot = self._publish()
+            with self._cond:
+                self._back, self._front = self._front, snapshot
+                self._unread_tiles.update(snapshot.tiles)
+                self._fresh = True
+
+            # After a stall of more than max_catch_up ticks the game slows
+            # down instead of racing to catch up
+            next_tick += tick_seconds
+            now = time.perf_counter()
+            if now - next_tick > self.max_catch_up * tick_seconds:
+                next_tick = now
+
+    def _publish(self):
+        tilemap = self.level.tilemap
+        tiles = tuple({(col, row): tilemap.get_tile(col, row)
+                       for col, row in tilemap.pop_changed_tiles()}.items())
+        return FrameSnapshot(self.level, tiles, time.perf_counter())
+
+
+class FrameView:
+    """
+    The snapshots of a SimulationThread as the main thread draws them, with
+    the drawing interface of a Level (view, lemming_rects, hover_bounds,
+    draw, draw_lemmings, tilemap and the HUD values).
+
+    Call refresh() once a frame: it picks up the newest snapshots and
+    returns alpha, how far to draw between them.
+    """
+
+    def __init__(self, simulation, map_file):
+        self.simulation = simulation
+        self.tick_seconds = 1.0 / simulation.level.tick_rate
+        self.tilemap = open_tilemap(map_file, quiet=True)
+        self.previous = None
+        self.current = None
+        self.alpha = 1.0
+        self.refresh()
+
+    def refresh(self):
+        """Apply the newest snapshots and tile changes; returns alpha."""
+        taken = self.simulation.take()
+        if taken is not None:
+            self.previous, self.current, tiles = taken
+            for (col, row), code in tiles.items():
+                self.tilemap.add_tile(col, row, TILE_CHARS.get(code, "."))
+        # The previous snapshot is drawn as the current one is published,
+        # and the current one a tick later, when the next is due
+        if self.previous is None:
+            self.alpha = 1.0
+        else:
+            since = time.perf_counter() - self.current.published
+            self.alpha = min(max(since / self.tick_seconds, 0.0), 1.0)
+        return self.alpha
+
+    # -- HUD values (read by SkillToolbar) --------------------------------
+
+    @property
+    def exit_count(self):
+        return self.current.exit_count
+
+    @property
+    def target_exits(self):
+        return self.current.target_exits
+
+    @property
+    def completed(self):
+        return self.current.completed
+
+    @property
+    def failed(self):
+        return self.current.failed
+
+    def get_score(self):
+        return self.current.score
+
+    def get_elapsed_time(self):
+        return self.current.elapsed
+
+    # -- drawing ------------------------------------------------------------
+
+    def world_pos(self, pos):
+        """The world pixel under screen position pos, as last drawn."""
+        view = self.view(self.alpha)
+        return pos[0] + view.x, pos[1] + view.y
+
+    def _interpolating(self, alpha):
+        return alpha < 1.0 and self.previous is not None
+
+    def view(self, alpha=1.0):
+        """The camera rect as drawn at alpha."""
+        camera = pygame.Rect(self.current.camera)
+        if not self._interpolating(alpha):
+            return camera
+        px, py = self.previous.camera[:2]
+        camera.topleft = (px + round((camera.x - px) * alpha),
+                          py + round((camera.y - py) * alpha))
+        return camera
+
+    def _positions(self, alpha):
+        current = self.current
+        if not self._interpolating(alpha):
+            return current.xs, current.ys
+        previous = self.previous
+        return lerp_positions((previous.ids, previous.xs, previous.ys),
+                              current.ids, current.xs, current.ys, alpha)
+
+    def hover_bounds(self, alpha=1.0):
+        """World rect of the hover outline (as drawn at alpha), or None."""
+        if self.current.hovered is None:
+            return None
+        lemming_id, rect = self.current.hovered
+        rect = pygame.Rect(rect).inflate(4, 4)
+        if self._interpolating(alpha):
+            previous = self.previous
+            xs, ys = lerp_positions((previous.ids, previous.xs, previous.ys),
+                                    np.array([lemming_id]), np.array([rect.x + 2]),
+                                    np.array([rect.y + 2]), alpha)
+            rect.topleft = (int(xs[0]) - 2, int(ys[0]) - 2)
+        return rect
+
+    def lemming_rects(self, alpha=1.0):
+        """As Level.lemming_rects, keyed by lemming id."""
+        current = self.current
+        xs, ys = self._positions(alpha)
+        shown = current.umbrellas & (current.states == FALLING)
+        size = LEMMING_SIZE
+        for lemming_id, x, y, umbrella in zip(current.ids.tolist(), xs.tolist(),
+                                              ys.tolist(), shown.tolist()):
+            yield lemming_id, pygame.Rect(x, y, size, size), umbrella
+
+    def draw(self, surface, alpha=1.0):
+        """As Level.draw."""
+        view = self.view(alpha)
+        with profiler.scope("draw.tilemap"):
+            self.tilemap.draw(surface, (view.x, view.y))
+        with profiler.scope("draw.lemmings"):
+            self.draw_lemmings(surface, alpha=alpha)
+
+    def draw_lemmings(self, surface, areas=None, alpha=1.0):
+        """As Level.draw_lemmings."""
+        view = self.view(alpha)
+        current = self.current
+        xs, ys = self._positions(alpha)
+        draw_lemming_arrays(surface, view, xs, ys, current.states, current.umbrellas, areas)
+        outline = self.hover_bounds(alpha)
+        if outline is not None:
+            outline.move_ip(-view.x, -view.y)
+            draw_outline(surface, outline, areas)
@@ -0,0 +1,300 @@
+# profiler.py
+"""
+Per-frame timing scopes and counters for finding hot paths.
+
+Phases are timed with explicit scopes:
+
+    with profiler.scope("update"):
+        level.update()
+    ...
+    profiler.end_frame()
+
+Per-lemming state handlers and tile/grid queries are far too hot for even
+an `if enabled:` check, so they are not instrumented in the source.
+enable() wraps those methods with timing/counting versions and disable()
+puts the originals back, leaving the disabled cost at zero.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from lemming import Lemming
+from spatial import SpatialGrid
+from swarm import LemmingSwarm
+from tilemap import TileMap
+
+# Methods timed as aggregated scopes while enabled: (class, method)
+TIMED_METHODS = (
+    (Lemming, "_walk"),
+    (Lemming, "_fall"),
+    (Lemming, "_dig"),
+    (Lemming, "_build"),
+    (LemmingSwarm, "_walk_batch"),
+    (LemmingSwarm, "_fall_batch"),
+    (LemmingSwarm, "_step_one"),
+)
+
+MAX_TRACE_EVENTS = 500000
+
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.add_time(self.name, end - self.start, self.start)
+        return False
+
+
+class Profiler:
+    """
+    Collects scope times and counters for the current frame. After
+    end_frame(), `last_frame` holds {scope: (seconds, calls)},
+    `last_counters` holds {counter: value} and `last_frame_time` the
+    seconds since the previous end_frame().
+
+    With trace=True, phase scopes are also kept as Chrome trace events
+    (load the file written by write_chrome_trace in chrome://tracing or
+    Perfetto); aggregated method scopes and counters appear as per-frame
+    counter tracks.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self._times = {}
+        self._counters = collections.Counter()
+        self._originals = []
+        self._events = collections.deque(maxlen=MAX_TRACE_EVENTS)
+        self._epoch = time.perf_counter()
+        self._frame_start = self._epoch
+        self.last_frame = {}
+        self.last_counters = {}
+        self.last_frame_time = 0.0
+
+    # -- switching ------------------------------------------------------
+
+    def enable(self, trace=False):
+        self.tracing = trace
+        if self.enabled:
+            return
+        self.enabled = True
+        self._frame_start = time.perf_counter()
+        self._install()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.tracing = False
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals.clear()
+        self._times.clear()
+        self._counters.clear()
+
+    def _patch(self, owner, name, wrapper):
+        self._originals.append((owner, name, owner.__dict__[name]))
+        setattr(owner, name, wrapper)
+
+    def _patch_overrides(self, base, name, make_wrapper):
+        """
+        Patch base.name and every override of it in base's subclasses
+        (e.g. ChunkedTileMap's), each with make_wrapper(its own method).
+        """
+        classes = [base]
+        for cls in classes:
+            classes.extend(cls.__subclasses__())
+        for cls in classes:
+            if name in cls.__dict__:
+                self._patch(cls, name, make_wrapper(cls.__dict__[name]))
+
+    def _install(self):
+        for owner, name in TIMED_METHODS:
+            self._patch(owner, name, self._timed(getattr(owner, name), name))
+
+        count = self.count
+
+        def counting_tile_query(method):
+            def tile_query(tilemap, x, y):
+                count("tile queries")
+                return method(tilemap, x, y)
+            return tile_query
+
+        def counting_codes_at_pixels(method):
+            def codes_at_pixels(tilemap, xs, ys):
+                result = method(tilemap, xs, ys)
+                count("tile queries", result.size)
+                return result
+            return codes_at_pixels
+
+        def counting_set_tile(method):
+            def _set_tile(tilemap, col, row, code):
+                before = tilemap.get_tile(col, row)
+                method(tilemap, col, row, code)
+                if tilemap.get_tile(col, row) != before:
+                    count("tiles modified")
+            return _set_tile
+
+        def counting_query(method):
+            def query(grid, rect):
+                found = method(grid, rect)
+                count(f"{grid.name} checked", len(found))
+                return found
+            return query
+
+        self._patch_overrides(TileMap, "is_solid_at_pixel", counting_tile_query)
+        self._patch_overrides(TileMap, "is_exit_at_pixel", counting_tile_query)
+        self._patch_overrides(TileMap, "codes_at_pixels", counting_codes_at_pixels)
+        self._patch_overrides(TileMap, "_set_tile", counting_set_tile)
+        self._patch_overrides(SpatialGrid, "query", counting_query)
+
+    def _timed(self, method, name):
+        times = self._times
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                entry = times.get(name)
+                if entry is None:
+                    times[name] = [clock() - start, 1]
+                else:
+                    entry[0] += clock() - start
+                    entry[1] += 1
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    # -- recording ------------------------------------------------------
+
+    def scope(self, name):
+        """
+        Context manager timing a named phase; a shared no-op when disabled.
+        """
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def add_time(self, name, seconds, start=None):
+        entry = self._times.get(name)
+        if entry is None:
+            self._times[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+        if self.tracing and start is not None:
+            self._events.append({
+                "name": name, "ph": "X", "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "ts": (start - self._epoch) * 1e6, "dur": seconds * 1e6,
+            })
+
+    def count(self, name, n=1):
+        """Add n to a counter of the current frame (ignored when disabled)."""
+        if self.enabled:
+            self._counters[name] += n
+
+    def end_frame(self):
+        """
+        Close the current frame: publish its totals and start a new one.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.last_frame_time = now - self._frame_start
+        # Copied through list(): a simulation thread (see pipeline.py) may
+        # add scopes and counters meanwhile
+        self.last_frame = {name: (entry[0], entry[1]) for name, entry in list(self._times.items())}
+        self.last_counters = dict(list(self._counters.items()))
+        if self.tracing:
+            ts = (now - self._epoch) * 1e6
+            pid = os.getpid()
+            if self.last_frame:
+                self._events.append({
+                    "name": "scope ms", "ph": "C", "pid": pid, "ts": ts,
+                    "args": {name: secs * 1000 for name, (secs, _) in self.last_frame.items()},
+                })
+            if self.last_counters:
+                self._events.append({
+                    "name": "counters", "ph": "C", "pid": pid, "ts": ts,
+                    "args": self.last_counters,
+                })
+        # Cleared in place: the installed wrappers hold references to both
+        self._times.clear()
+        self._counters.clear()
+        self._frame_start = now
+
+    def write_chrome_trace(self, path):
+        """
+        Write the recorded events as Chrome trace JSON.
+        """
+        with open(path, "w") as f:
+            json.dump({"traceEvents": list(self._events), "displayTimeUnit": "ms"}, f)
+
+
+class StartupTimer:
+    """
+    Time-to-first-frame broken down by phase, for main.py --measure-startup.
+
+    mark(name) ends the phase running since the previous mark (or since
+    start, a time.perf_counter() value); background(name, seconds) notes
+    work done on another thread meanwhile. Marks after finish() are
+    ignored, so the game loop can mark its phases unconditionally.
+    """
+
+    def __init__(self, start):
+        self.start = self.last = start
+        self.phases = []
+        self.background_phases = []
+        self.finished = False
+
+    def mark(self, name):
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def background(self, name, seconds):
+        self.background_phases.append((name, seconds))
+
+    def finish(self):
+        self.finished = True
+
+    def report(self):
+        lines = ["startup phase                  ms"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<24}{seconds * 1000:8.1f}")
+        for name, seconds in self.background_phases:
+            lines.append(f"  {name + ' (background)':<24}{seconds * 1000:8.1f}")
+        lines.append(f"time to first frame       {(self.last - self.start) * 1000:8.1f}")
+        return "\n".join(lines)
+
+
+# Shared instance used by the game loop and the HUD overlay
+profiler = Profiler()
@@ -0,0 +1,114 @@
+# render.py
+
+import pygame
+
+from lemming import draw_bounds
+from tilemap import TILE_SIZE
+
+BACKGROUND = (0, 0, 0)
+
+# Fall back to a full redraw when this many rects are dirty, or when they
+# cover more than this fraction of the screen
+MAX_DIRTY_RECTS = 256
+MAX_DIRTY_FRACTION = 0.5
+
+
+class DirtyRectRenderer:
+    """
+    Redraws only the parts of the screen that changed since the last frame:
+    where lemmings moved (or gained/lost an umbrella), the hover outline,
+    edited tiles and the toolbar when its HUD text or selection changes.
+
+    render() returns the list of rects to pass to pygame.display.update(),
+    or None after a full redraw (first frame, camera scroll, too many dirty
+    rects, or when asked with full=True), in which case the caller flips.
+    """
+
+    def __init__(self, screen, level, toolbar):
+        self.screen = screen
+        self.level = level
+        self.toolbar = toolbar
+        self.level.tilemap.record_changes = True
+        self._last_camera = None
+        self._last_lemmings = {}
+        self._last_hover = None
+        self._last_toolbar = None
+        self._force_full = True
+
+    def invalidate(self):
+        """Force a full redraw on the next frame."""
+        self._force_full = True
+
+    def render(self, full=False, alpha=1.0):
+        """
+        Bring the screen up to date. Pass full=True while something the
+        renderer doesn't track (e.g. a debug overlay) is drawn on top.
+        alpha is passed on to Level.draw.
+        """
+        level = self.level
+        screen = self.screen
+        camera = level.view(alpha)
+        cam = (camera.x, camera.y)
+
+        lemmings = {}
+        for key, rect, umbrella in level.lemming_rects(alpha):
+            bounds = draw_bounds(rect)
+            bounds.move_ip(-cam[0], -cam[1])
+            lemmings[key] = (bounds, umbrella)
+        hover = level.hover_bounds(alpha)
+        if hover is not None:
+            hover.move_ip(-cam[0], -cam[1])
+        changed_tiles = level.tilemap.pop_changed_tiles()
+        toolbar_key = self.toolbar.state_key(screen, level)
+
+        full = full or self._force_full or cam != self._last_camera
+        dirty = []
+        if not full:
+            last = self._last_lemmings
+            for key, now in lemmings.items():
+                before = last.get(key)
+                if before != now:
+                    dirty.append(now[0])
+                    if before is not None:
+                        dirty.append(before[0])
+            for key, before in last.items():
+                if key not in lemmings:
+                    dirty.append(before[0])
+            if hover != self._last_hover:
+                dirty.extend(r for r in (hover, self._last_hover) if r is not None)
+            for col, row in changed_tiles:
+                dirty.append(pygame.Rect(col * TILE_SIZE - cam[0], row * TILE_SIZE - cam[1],
+                                         TILE_SIZE, TILE_SIZE))
+
+            screen_rect = screen.get_rect()
+            dirty = [r.clip(screen_rect) for r in dirty]
+            dirty = [r for r in dirty if r.width and r.height]
+            area = sum(r.width * r.height for r in dirty)
+            if (len(dirty) > MAX_DIRTY_RECTS
+                    or area > MAX_DIRTY_FRACTION * screen_rect.width * screen_rect.height):
+                full = True
+
+        self._last_camera = cam
+        self._last_lemmings = lemmings
+        self._last_hover = hover
+        self._force_full = False
+
+        if full:
+            self._last_toolbar = toolbar_key
+            screen.fill(BACKGROUND)
+            level.draw(screen, alpha)
+            self.toolbar.draw(screen, level)
+            return None
+
+        for rect in dirty:
+            screen.fill(BACKGROUND, rect)
+            level.tilemap.draw(screen, cam, area=rect)
+        if dirty:
+            level.draw_lemmings(screen, dirty, alpha)
+
+        bar = pygame.Rect(0, 0, screen.get_width(), self.toolbar.bar_height)
+        if toolbar_key != self._last_toolbar or bar.collidelist(dirty) != -1:
+            self._last_toolbar = toolbar_key
+            self.toolbar.draw(screen, level)
+            dirty.append(bar)
+        return dirty
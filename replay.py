@@ -0,0 +1,235 @@
+# replay.py
+"""
+Record a play session and replay it headless.
+
+A Recorder attached to a Level logs every spawn and every skill
+assignment with the tick it happened on. Replaying forces spawns onto the
+recorded ticks and re-applies the assignments, so the session runs the
+same way at full speed, with no window and no wall clock, and the final
+Level.state_hash() must match the one recorded.
+
+    python main.py --record session.pprl       # play and record
+    python replay.py session.pprl              # replay and verify the hash
+    python replay.py session.pprl --seek 1800  # state at tick 1800
+
+Log format (.pprl), little-endian: a fixed header, the map path, then one
+10-byte record per event.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import bisect
+import hashlib
+import struct
+import sys
+
+from level import Level
+from swarm import SKILL_CODES, NO_SKILL
+
+MAGIC = b"PPRL"
+VERSION = 1
+
+# magic, version, target exits, tick rate, final tick, map digest,
+# final state hash, map path length
+_HEADER = struct.Struct("<4sHIIQ16s16sH")
+# tick, kind, lemming id, skill code
+_RECORD = struct.Struct("<IBIB")
+
+SPAWN = 0
+SKILL = 1
+
+SNAPSHOT_EVERY = 600  # ticks between the snapshots kept for seeking
+
+_SKILL_NAMES = {code: name for name, code in SKILL_CODES.items()}
+
+
+class ReplayError(ValueError):
+    """Raised for invalid logs, or logs that don't match the map."""
+
+
+def map_digest(tilemap):
+    """Digest of a tilemap's tiles, to check a replay starts from the same map."""
+    h = hashlib.blake2b(digest_size=16)
+    tilemap.update_hash(h)
+    return h.digest()
+
+
+class ReplayLog:
+    """
+    A recorded session: the map it was played on, its exit target and
+    tick rate, the events as (tick, kind, lemming id, skill name) and the
+    final tick and state hash (None until the recording is finished).
+    """
+
+    def __init__(self, map_file, target_exits, tick_rate, map_digest,
+                 events=(), final_tick=None, final_hash=None):
+        self.map_file = map_file
+        self.target_exits = target_exits
+        self.tick_rate = tick_rate
+        self.map_digest = map_digest
+        self.events = list(events)
+        self.final_tick = final_tick
+        self.final_hash = final_hash
+
+    def spawn_ticks(self):
+        return {tick for tick, kind, _, _ in self.events if kind == SPAWN}
+
+    def skills(self):
+        """Skill assignments as (tick, lemming id, skill), in order."""
+        return [(tick, lemming_id, skill)
+                for tick, kind, lemming_id, skill in self.events if kind == SKILL]
+
+    def save(self, path):
+        map_path = self.map_file.encode("utf-8")
+        final_hash = bytes.fromhex(self.final_hash) if self.final_hash else bytes(16)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, self.target_exits, self.tick_rate,
+                                 self.final_tick or 0, self.map_digest, final_hash,
+                                 len(map_path)))
+            f.write(map_path)
+            for tick, kind, lemming_id, skill in self.events:
+                f.write(_RECORD.pack(tick, kind, lemming_id,
+                                     SKILL_CODES.get(skill, NO_SKILL)))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ReplayError(f"{path}: truncated header")
+        (magic, version, target, tick_rate, final_tick, digest,
+         final_hash, path_len) = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ReplayError(f"{path}: not a replay log")
+        if version != VERSION:
+            raise ReplayError(f"{path}: unsupported version {version}")
+        start = _HEADER.size + path_len
+        body = data[start:]
+        if len(data) < start or len(body) % _RECORD.size:
+            raise ReplayError(f"{path}: truncated log")
+        map_file = data[_HEADER.size:start].decode("utf-8")
+        events = [(tick, kind, lemming_id, _SKILL_NAMES.get(code))
+                  for tick, kind, lemming_id, code in _RECORD.iter_unpack(body)]
+        finished = final_hash != bytes(16)
+        return cls(map_file, target, tick_rate, digest, events,
+                   final_tick if finished else None,
+                   final_hash.hex() if finished else None)
+
+
+class Recorder:
+    """
+    Logs a Level's spawns and skill assignments. Attach it before the
+    first update, and call finish() when the session ends.
+    """
+
+    def __init__(self, level, map_file):
+        self.level = level
+        self.log = ReplayLog(map_file, level.target_exits, level.tick_rate,
+                             map_digest(level.tilemap))
+        level.recorder = self
+
+    def spawned(self, tick, lemming_id):
+        self.log.events.append((tick, SPAWN, lemming_id, None))
+
+    def skill_assigned(self, tick, lemming_id, skill_name):
+        self.log.events.append((tick, SKILL, lemming_id, skill_name))
+
+    def finish(self, path=None):
+        """
+        Stop recording and stamp the final tick and state hash; with a
+        path, also save the log there. Returns the log.
+        """
+        self.level.recorder = None
+        self.log.final_tick = self.level.tick
+        self.log.final_hash = self.level.state_hash()
+        if path is not None:
+            self.log.save(path)
+        return self.log
+
+
+class Replayer:
+    """
+    Plays a ReplayLog headless. seek() can move to any tick, forwards or
+    backwards: it restores the nearest earlier snapshot (kept every
+    snapshot_every ticks while playing) and simulates from there.
+    """
+
+    def __init__(self, log, map_file=None, engine="sprites", snapshot_every=SNAPSHOT_EVERY):
+        self.log = log
+        self.level = Level(map_file or log.map_file, 800, 600,
+                           target_exits=log.target_exits, engine=engine,
+                           headless=True, tick_rate=log.tick_rate,
+                           fast_forward=engine == "sprites", quiet=True)
+        if map_digest(self.level.tilemap) != log.map_digest:
+            raise ReplayError(f"{map_file or log.map_file}: not the map this session was recorded on")
+        self.level.spawn_ticks = log.spawn_ticks()
+        self.skills = log.skills()
+        self._skill_ticks = [tick for tick, _, _ in self.skills]
+        self.snapshot_every = snapshot_every
+        self._snapshots = {0: self.level.snapshot()}
+
+    @property
+    def tick(self):
+        return self.level.tick
+
+    def seek(self, tick):
+        """
+        Bring the level to the given tick (or the tick it ended on, if
+        earlier). Returns the level.
+        """
+        level = self.level
+        start = max(t for t in self._snapshots if t <= tick)
+        if tick < level.tick or start > level.tick:
+            level.restore(self._snapshots[start])
+
+        next_skill = bisect.bisect_left(self._skill_ticks, level.tick)
+        while level.tick < tick and not (level.completed or level.failed):
+            if level.tick % self.snapshot_every == 0 and level.tick not in self._snapshots:
+                self._snapshots[level.tick] = level.snapshot()
+            while next_skill < len(self.skills) and self._skill_ticks[next_skill] == level.tick:
+                _, lemming_id, skill = self.skills[next_skill]
+                level.assign_skill_to(lemming_id, skill)
+                next_skill += 1
+            level.update()
+        return level
+
+    def run(self):
+        """
+        Replay to the end of the recording and check the final state hash.
+        Returns True if it matches (or the log has no final hash).
+        """
+        end = self.log.final_tick
+        self.seek(end if end is not None else sys.maxsize)
+        return self.log.final_hash is None or self.level.state_hash() == self.log.final_hash
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded PixelPioneers session")
+    parser.add_argument("log", help="a .pprl file written by main.py --record")
+    parser.add_argument("--map", help="level file to use instead of the recorded path")
+    parser.add_argument("--engine", choices=("sprites", "swarm"), default="sprites")
+    parser.add_argument("--seek", type=int, metavar="TICK",
+                        help="stop at TICK and print the state there")
+    args = parser.parse_args(argv)
+
+    log = ReplayLog.load(args.log)
+    replayer = Replayer(log, args.map, args.engine)
+    if args.seek is not None:
+        level = replayer.seek(args.seek)
+        lemmings = sum(1 for _ in level.lemming_rects())
+        print(f"tick {level.tick}: {lemmings} lemmings, "
+              f"{level.exit_count} exits, hash {level.state_hash()}")
+        return
+    ok = replayer.run()
+    level = replayer.level
+    print(f"Replayed {level.tick} ticks: {level.exit_count} exits, hash {level.state_hash()}")
+    if not ok:
+        print(f"State hash mismatch: recorded {log.final_hash}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# solver.py
+"""
+Search for the fewest skill assignments that beat a level.
+
+The level is simulated headless. Every `interval` ticks the search may
+give one skill to one lemming, and a branch may also just wait. The
+search deepens iteratively on the number of skills: a depth-first pass
+tries every schedule of at most 0, then 1, 2, ... skills, so the first
+winning schedule found is a minimal one. A node is a Level.snapshot(), so
+branching costs only what changed.
+
+Three things keep a pass small:
+  - lookahead: a branch is dropped once `lookahead` ticks pass without a
+    skill assignment or a new exit, so no branch plays out to max_ticks
+    unless lemmings keep exiting
+  - a bound: a branch is dropped once the exits so far, plus the
+    lemmings still able to move, plus those yet to spawn before
+    max_ticks, fall short of the target
+  - states are keyed by Level.state_hash(with_tick=False): a state
+    already expanded at an earlier tick, with as many skills and as much
+    lookahead left, is not expanded again. Lemmings in identical states
+    count as one choice.
+
+    python solver.py level1_map.txt --target 5 --time 10
+
+A solution is a schedule of (tick, lemming id, skill), as used by
+batch.py: the skill is assigned once the level has taken `tick` steps.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import itertools
+import time
+
+from level import Level
+from swarm import BLOCKING, WALKING, FALLING, NO_SKILL
+
+MAX_TICKS = 60 * 60  # one minute of game time
+INTERVAL = 30  # ticks between decision points
+LOOKAHEAD = 60 * 5  # ticks a branch may go without a skill or an exit
+TIME_BUDGET = 5.0  # seconds
+NODE_BUDGET = 20000
+
+UNSOLVABLE = "unsolvable"
+OUT_OF_BUDGET = "undecided within budget"
+
+# Skills worth trying on a lemming in each state: anything else would be
+# ignored (or left pending) by Lemming.update
+_SKILLS_FOR_STATE = {
+    WALKING: ("dig", "build", "block", "umbrella"),
+    FALLING: ("block", "umbrella"),
+}
+
+
+class SolveResult:
+    """
+    Outcome of solve(): solved, the schedule (None unless solved), the
+    reason when not solved (UNSOLVABLE: every branch fails within
+    max_ticks and its lookahead, however many skills it gets;
+    OUT_OF_BUDGET: the search was cut short, so the level may or may not
+    be beatable), the most exits any branch reached out of target_exits,
+    and the nodes expanded and seconds taken.
+    """
+
+    def __init__(self, solved, solution, reason, nodes, seconds, best_exits=0,
+                 target_exits=None):
+        self.solved = solved
+        self.solution = solution
+        self.reason = reason
+        self.nodes = nodes
+        self.seconds = seconds
+        self.best_exits = best_exits
+        self.target_exits = target_exits
+
+    def __str__(self):
+        stats = f"{self.nodes} nodes, {self.seconds:.2f}s"
+        if not self.solved:
+            return (f"{self.reason}, at best {self.best_exits}/{self.target_exits} exits "
+                    f"({stats})")
+        steps = ", ".join(f"{skill} #{lemming_id} @{tick}"
+                          for tick, lemming_id, skill in self.solution) or "no skills needed"
+        return f"solved with {len(self.solution)} skill(s): {steps} ({stats})"
+
+
+def _choices(snap):
+    """
+    (lemming id, skill) pairs worth trying from a snapshot, with one
+    lemming per group of lemmings in the same state.
+    """
+    seen = set()
+    for record in snap.lemmings.tolist():
+        lemming_id, x, y, vx, vy, direction, state, skill, umbrella = record
+        skills = _SKILLS_FOR_STATE.get(state)
+        if skills is None or skill != NO_SKILL:
+            continue
+        key = (x, y, vx, vy, direction, state, umbrella)
+        if key in seen:
+            continue
+        seen.add(key)
+        for name in skills:
+            if name == "umbrella" and umbrella:
+                continue
+            yield lemming_id, name
+
+
+def solve(map_file, target_exits=None, max_ticks=MAX_TICKS, interval=INTERVAL,
+          time_budget=TIME_BUDGET, node_budget=NODE_BUDGET, engine="sprites",
+          lookahead=LOOKAHEAD):
+    """
+    Search for a minimal skill schedule that reaches target_exits within
+    max_ticks. Returns a SolveResult. target_exits defaults to the map's
+    own (see Level).
+    """
+    start = time.perf_counter()
+    level = Level(map_file, 800, 600, target_exits=target_exits, engine=engine,
+                  headless=True, fast_forward=engine == "sprites", quiet=True)
+    root = level.snapshot()
+    nodes = 0
+    best_exits = 0
+
+    def result(solved, solution, reason):
+        return SolveResult(solved, solution, reason, nodes, time.perf_counter() - start,
+                           best_exits, level.target_exits)
+
+    for skills in itertools.count():
+        # Stack entries are unexplored branches: a parent snapshot, the
+        # assignment to make there (or None to wait), the schedule so far
+        # and the tick the branch is dropped at unless it makes progress.
+        # Assignments are popped before waiting, earliest first
+        stack = [(root, None, (), lookahead)]
+        seen = {}  # state_hash(with_tick=False) -> (tick, skills left, ticks left)
+        capped = False  # whether a branch could have used another skill
+        while stack:
+            if nodes >= node_budget or time.perf_counter() - start > time_budget:
+                return result(False, None, OUT_OF_BUDGET)
+            snap, action, schedule, deadline = stack.pop()
+            nodes += 1
+            level.restore(snap)
+            if action is not None:
+                level.assign_skill_to(action[1], action[2])
+            level.step(min(interval, max_ticks - snap.tick))
+            best_exits = max(best_exits, level.exit_count)
+
+            if level.completed:
+                return result(True, list(schedule), None)
+            if level.exit_count > snap.exit_count:
+                deadline = level.tick + lookahead
+            if level.failed or level.tick >= min(max_ticks, deadline):
+                continue
+            child = level.snapshot()
+            if _out_of_reach(level, child, max_ticks):
+                continue
+            left = skills - len(schedule)
+            key = level.state_hash(with_tick=False)
+            known = seen.get(key)
+            if (known is not None and known[0] <= level.tick and known[1] >= left
+                    and known[2] >= deadline - level.tick):
+                continue
+            seen[key] = (level.tick, left, deadline - level.tick)
+
+            stack.append((child, None, schedule, deadline))
+            choices = list(_choices(child))
+            if choices and not left:
+                capped = True
+                continue
+            for lemming_id, skill in reversed(choices):
+                action = (child.tick, lemming_id, skill)
+                stack.append((child, action, schedule + (action,), child.tick + lookahead))
+
+        if not capped:
+            return result(False, None, UNSOLVABLE)
+
+
+def _out_of_reach(level, snap, max_ticks):
+    """
+    True if the target can't be met even if every lemming that can still
+    move, and every one yet to spawn, reached an exit.
+    """
+    movers = int((snap.lemmings["state"] != BLOCKING).sum())
+    return level.exit_count + movers + level.spawns_until(max_ticks) < level.target_exits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check whether a PixelPioneers level can be beaten")
+    parser.add_argument("map_file")
+    parser.add_argument("--target", type=int,
+                        help="exits needed (default: the map's own)")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--interval", type=int, default=INTERVAL,
+                        help="ticks between decision points")
+    parser.add_argument("--time", type=float, default=TIME_BUDGET, help="time budget in seconds")
+    parser.add_argument("--nodes", type=int, default=NODE_BUDGET, help="node budget")
+    parser.add_argument("--engine", choices=("sprites", "swarm"), default="sprites")
+    parser.add_argument("--lookahead", type=int, default=LOOKAHEAD,
+                        help="ticks a branch may go without a skill or an exit")
+    args = parser.parse_args(argv)
+
+    result = solve(args.map_file, args.target, args.max_ticks, args.interval,
+                   args.time, args.nodes, args.engine, args.lookahead)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
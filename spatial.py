@@ -0,0 +1,161 @@
+# spatial.py
+
+from tilemap import TILE_SIZE
+
+class SpatialGrid:
+    """
+    A uniform grid that buckets items by the cells their rect overlaps.
+    Cells are cell_size pixels square (one tile by default), so a query
+    only touches the handful of buckets around the queried rect instead
+    of every item.
+    """
+
+    def __init__(self, cell_size=TILE_SIZE, name="grid"):
+        self.cell_size = cell_size
+        self.name = name  # label used by the profiler counters
+        self._buckets = {}   # (cell_col, cell_row) -> list of items
+        self._cells_of = {}  # item -> tuple of cells it occupies
+
+    def __len__(self):
+        return len(self._cells_of)
+
+    def __contains__(self, item):
+        return item in self._cells_of
+
+    def _cells(self, rect):
+        size = self.cell_size
+        x, y, w, h = rect
+        first_col = int(x // size)
+        first_row = int(y // size)
+        last_col = int((x + max(w, 1) - 1) // size)
+        last_row = int((y + max(h, 1) - 1) // size)
+        return tuple(
+            (col, row)
+            for row in range(first_row, last_row + 1)
+            for col in range(first_col, last_col + 1)
+        )
+
+    def insert(self, item, rect):
+        """
+        Add item (or move it, if already present) to the cells covered by rect.
+        """
+        cells = self._cells(rect)
+        old_cells = self._cells_of.get(item)
+        if old_cells == cells:
+            return
+        if old_cells is not None:
+            self._unlink(item, old_cells)
+        self._cells_of[item] = cells
+        for cell in cells:
+            self._buckets.setdefault(cell, []).append(item)
+
+    def remove(self, item):
+        """
+        Drop item from the grid; does nothing if it isn't present.
+        """
+        cells = self._cells_of.pop(item, None)
+        if cells is not None:
+            self._unlink(item, cells)
+
+    def _unlink(self, item, cells):
+        for cell in cells:
+            bucket = self._buckets[cell]
+            bucket.remove(item)
+            if not bucket:
+                del self._buckets[cell]
+
+    def clear(self):
+        self._buckets.clear()
+        self._cells_of.clear()
+
+    def query(self, rect):
+        """
+        Return the items whose cells overlap rect. Candidates only: callers
+        still do their own exact collision test.
+        """
+        buckets = self._buckets
+        cells = self._cells(rect)
+        if len(cells) == 1:
+            return list(buckets.get(cells[0], ()))
+        found = {}
+        for cell in cells:
+            bucket = buckets.get(cell)
+            if bucket:
+                found.update(dict.fromkeys(bucket))
+        return list(found)
+
+class CellIndex:
+    """
+    Buckets items by the one cell their center is in. Keeping it current
+    is cheap: moving an item costs a comparison until its center crosses
+    into another cell. An item covering a point has its center within
+    half its size of that point, so near() only has to look at the one
+    to four cells that can hold such centers.
+    """
+
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self._buckets = {}  # (cell_col, cell_row) -> {item: None}, in insertion order
+        self._cell_of = {}  # item -> its cell
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def __contains__(self, item):
+        return item in self._cell_of
+
+    def move(self, item, x, y):
+        """
+        Add item with its center at (x, y), or move it there. Returns True
+        if it went into another cell (or was added), False if it stayed.
+        """
+        size = self.cell_size
+        cell = (x // size, y // size)
+        old = self._cell_of.get(item)
+        if old == cell:
+            return False
+        if old is not None:
+            self._unlink(item, old)
+        self._cell_of[item] = cell
+        bucket = self._buckets.get(cell)
+        if bucket is None:
+            bucket = self._buckets[cell] = {}
+        bucket[item] = None
+        return True
+
+    def in_cell(self, col, row):
+        """The items whose center is in cell (col, row)."""
+        return list(self._buckets.get((col, row), ()))
+
+    def remove(self, item):
+        """Drop item from the index; does nothing if it isn't present."""
+        cell = self._cell_of.pop(item, None)
+        if cell is not None:
+            self._unlink(item, cell)
+
+    def _unlink(self, item, cell):
+        bucket = self._buckets[cell]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[cell]
+
+    def clear(self):
+        self._buckets.clear()
+        self._cell_of.clear()
+
+    def near(self, x, y, reach):
+        """
+        Items in the cells holding centers within reach pixels of (x, y)
+        (on each axis): every item no more than 2 * reach across covering
+        that point, among a few more. Callers do their own exact test.
+        """
+        size = self.cell_size
+        cols = range(int((x - reach) // size), int((x + reach) // size) + 1)
+        buckets = self._buckets
+        found = []
+        for row in range(int((y - reach) // size), int((y + reach) // size) + 1):
+            for col in cols:
+                bucket = buckets.get((col, row))
+                if bucket:
+                    found.extend(bucket)
+        return found
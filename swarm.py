@@ -0,0 +1,502 @@
+# swarm.py
+
+import numpy as np
+import pygame
+
+from tilemap import TILE_SIZE
+from zones import EXIT_ZONE, KILL_ZONE
+from lemming import (
+    WALK_SPEED, GRAVITY, MAX_FALL_SPEED,
+    UMBRELLA_GRAVITY, UMBRELLA_MAX_FALL_SPEED, UMBRELLA_HEIGHT,
+    LEMMING_SIZE, STATES, clip_blits, to_px, sprite_atlas,
+)
+
+# State codes (index into STATE_NAMES for the Lemming.state strings)
+WALKING = 0
+FALLING = 1
+DIGGING = 2
+BUILDING = 3
+BLOCKING = 4
+STATE_NAMES = STATES
+
+# Pending skill codes (0 = nothing assigned)
+NO_SKILL = 0
+SKILL_CODES = {"dig": 1, "build": 2, "block": 3, "umbrella": 4}
+
+# One lemming's simulation state packed into a fixed-size record, shared by
+# both engines for snapshots and state hashes
+LEMMING_RECORD = np.dtype([
+    ("id", "<i8"), ("x", "<i4"), ("y", "<i4"),
+    ("vx", "<f8"), ("vy", "<f8"),
+    ("direction", "i1"), ("state", "u1"), ("skill", "u1"), ("umbrella", "?"),
+])
+
+
+def _to_px_array(values):
+    """Vectorized to_px."""
+    return np.trunc(values + np.copysign(0.5, values)).astype(np.int64)
+
+
+class LemmingSwarm:
+    """
+    All lemmings of a level stored as parallel NumPy arrays (structure of
+    arrays) instead of one Sprite each.
+
+    Walking and falling lemmings are stepped in vectorized batches with the
+    same rules as Lemming._walk/_fall. Anything that can change the world
+    for the lemmings after it (a pending skill, digging, building, or a
+    blocker about to be removed) is an "event" handled with scalar code.
+    Events split each tick into segments processed in slot order, so the
+    outcome matches updating the sprites one after another.
+
+    Slots are kept in spawn order; dead slots are compacted away (stably)
+    once they make up more than half of the arrays.
+    """
+
+    _FIELDS = (
+        ("x", np.int64), ("y", np.int64),
+        ("vx", np.float64), ("vy", np.float64),
+        ("direction", np.int64), ("state", np.uint8),
+        ("umbrella", np.bool_), ("skill", np.uint8),
+        ("alive", np.bool_), ("ids", np.int64),
+    )
+
+    def __init__(self, capacity=256):
+        self.size = LEMMING_SIZE
+        self.count = 0      # high-water mark of used slots
+        self.live = 0       # number of alive slots
+        self._next_id = 0
+        for name, dtype in self._FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self._blockers = []  # slots of blocking lemmings, in slot order
+        self._blocker_xy = None  # cached (xs, ys) arrays of blocker rects
+
+    def __len__(self):
+        return self.live
+
+    def _grow(self):
+        capacity = len(self.x) * 2
+        for name, _ in self._FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive[:self.count])
+        for name, _ in self._FIELDS:
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.alive[len(keep):self.count] = False
+        self.count = len(keep)
+        remap = {int(old): new for new, old in enumerate(keep)}
+        self._blockers = [remap[slot] for slot in self._blockers]
+        self._blocker_xy = None
+
+    def pack_records(self):
+        """The alive lemmings as a LEMMING_RECORD array, in slot order."""
+        slots = self.live_slots()
+        records = np.empty(len(slots), dtype=LEMMING_RECORD)
+        records["id"] = self.ids[slots]
+        records["x"] = self.x[slots]
+        records["y"] = self.y[slots]
+        records["vx"] = self.vx[slots]
+        records["vy"] = self.vy[slots]
+        records["direction"] = self.direction[slots]
+        records["state"] = self.state[slots]
+        records["skill"] = self.skill[slots]
+        records["umbrella"] = self.umbrella[slots]
+        return records
+
+    def load_records(self, records, next_id):
+        """
+        Replace every lemming with those in a LEMMING_RECORD array; the
+        next spawn gets id next_id.
+        """
+        n = len(records)
+        while len(self.x) < n:
+            self._grow()
+        self.alive[:self.count] = False
+        self.ids[:n] = records["id"]
+        self.x[:n] = records["x"]
+        self.y[:n] = records["y"]
+        self.vx[:n] = records["vx"]
+        self.vy[:n] = records["vy"]
+        self.direction[:n] = records["direction"]
+        self.state[:n] = records["state"]
+        self.skill[:n] = records["skill"]
+        self.umbrella[:n] = records["umbrella"]
+        self.alive[:n] = True
+        self.count = self.live = n
+        self._next_id = next_id
+        self._blockers = np.flatnonzero(self.state[:n] == BLOCKING).tolist()
+        self._blocker_xy = None
+
+    def live_slots(self):
+        """Slots of the alive lemmings in update (spawn) order."""
+        return np.flatnonzero(self.alive[:self.count])
+
+    def spawn(self, spawn_pos):
+        """
+        Add a lemming whose midbottom is at spawn_pos; returns its slot.
+        """
+        if self.count == len(self.x):
+            self._grow()
+        i = self.count
+        self.count += 1
+        self.live += 1
+        self.x[i] = spawn_pos[0] - self.size // 2
+        self.y[i] = spawn_pos[1] - self.size
+        self.vx[i] = WALK_SPEED
+        self.vy[i] = 0
+        self.direction[i] = 1
+        self.state[i] = WALKING
+        self.umbrella[i] = False
+        self.skill[i] = NO_SKILL
+        self.alive[i] = True
+        self.ids[i] = self._next_id
+        self._next_id += 1
+        return i
+
+    def assign_skill(self, slot, skill_name):
+        """Same rule as Lemming.assign_skill."""
+        if self.state[slot] in (WALKING, FALLING):
+            self.skill[slot] = SKILL_CODES.get(skill_name, NO_SKILL)
+
+    def slot_of(self, lemming_id):
+        """Slot of the alive lemming with this id, or None."""
+        n = self.count
+        found = np.flatnonzero((self.ids[:n] == lemming_id) & self.alive[:n])
+        return int(found[0]) if len(found) else None
+
+    def state_name(self, slot):
+        return STATE_NAMES[self.state[slot]]
+
+    def rect(self, slot):
+        return pygame.Rect(int(self.x[slot]), int(self.y[slot]), self.size, self.size)
+
+    def hit_test(self, world_x, world_y, skill=None):
+        """
+        Return the alive slot whose rect contains the point, or None.
+        Where several overlap, pick as Level.lemming_at does: one that
+        would take skill, then the closest center, then the earliest.
+        """
+        n = self.count
+        x = self.x[:n]
+        y = self.y[:n]
+        hits = np.flatnonzero(
+            self.alive[:n]
+            & (x <= world_x) & (world_x < x + self.size)
+            & (y <= world_y) & (world_y < y + self.size)
+        )
+        if len(hits) <= 1:
+            return int(hits[0]) if len(hits) else None
+        half = self.size // 2
+        dx = self.x[hits] + half - world_x
+        dy = self.y[hits] + half - world_y
+        busy = ~self.takes_skill(hits, skill)
+        # lexsort's last key is the primary one; hits are in spawn order
+        return int(hits[np.lexsort((hits, dx * dx + dy * dy, busy))[0]])
+
+    def takes_skill(self, slots, skill=None):
+        """
+        Mask of the slots a click with skill would do something to: walking
+        or falling with no skill pending (and no umbrella yet, for one).
+        """
+        state = self.state[slots]
+        free = ((state == WALKING) | (state == FALLING)) & (self.skill[slots] == NO_SKILL)
+        if skill == "umbrella":
+            free &= ~self.umbrella[slots]
+        return free
+
+    def kill(self, slot):
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.live -= 1
+            if self.state[slot] == BLOCKING:
+                self._blockers.remove(slot)
+                self._blocker_xy = None
+
+    # ------------------------------------------------------------------
+    # Stepping
+    # ------------------------------------------------------------------
+
+    def step(self, tilemap, zones):
+        """
+        Advance every alive lemming by one tick. Lemmings that reach an
+        exit or fall off the bottom of the map (see zones.ZoneIndex, for
+        tilemap) are removed. Returns the number of lemmings that exited
+        this tick.
+        """
+        if self.count > 64 and self.live * 2 < self.count:
+            self._compact()
+
+        slots = self.live_slots()
+        if not len(slots):
+            return 0
+
+        half = self.size // 2
+        state = self.state[slots]
+        events = (self.skill[slots] != NO_SKILL) | (state == DIGGING) | (state == BUILDING)
+        blocking = state == BLOCKING
+        if blocking.any():
+            # A blocker standing on an exit is removed during its own update
+            events |= blocking & (zones.zones_at_pixels(self.x[slots] + half,
+                                                         self.y[slots] + half) == EXIT_ZONE)
+
+        exited = 0
+        start = 0
+        for pos in np.flatnonzero(events):
+            exited += self._step_batch(slots[start:pos], tilemap, zones)
+            exited += self._step_one(int(slots[pos]), tilemap, zones)
+            start = pos + 1
+        exited += self._step_batch(slots[start:], tilemap, zones)
+        return exited
+
+    def _step_batch(self, seg, tilemap, zones):
+        if not len(seg):
+            return 0
+        state = self.state[seg]
+        walkers = seg[state == WALKING]
+        fallers = seg[state == FALLING]
+        if len(walkers):
+            self._walk_batch(walkers, tilemap)
+        if len(fallers):
+            self._fall_batch(fallers, tilemap)
+        return self._retire(seg, tilemap, zones)
+
+    def _retire(self, seg, tilemap, zones):
+        """Remove lemmings in seg that exited or fell off; return exits."""
+        half = self.size // 2
+        x = self.x[seg]
+        y = self.y[seg]
+        zone = zones.zones_at_pixels(x + half, y + half)
+        at_exit = zone == EXIT_ZONE
+        fell = (zone == KILL_ZONE) & (y > tilemap.height)
+        gone = seg[at_exit | fell]
+        if len(gone):
+            for slot in gone[self.state[gone] == BLOCKING]:
+                self._blockers.remove(int(slot))
+                self._blocker_xy = None
+            self.alive[gone] = False
+            self.live -= len(gone)
+        return int(at_exit.sum())
+
+    def _blocker_arrays(self):
+        if self._blocker_xy is None:
+            slots = np.array(self._blockers, dtype=np.intp)
+            self._blocker_xy = (self.x[slots], self.y[slots])
+        return self._blocker_xy
+
+    def _walk_batch(self, walkers, tilemap):
+        size = self.size
+        half = size // 2
+        x = self.x[walkers]
+        y = self.y[walkers]
+        direction = self.direction[walkers]
+        next_x = x + self.vx[walkers] * direction
+
+        # 1) Solid tile in front at foot height → turn around
+        check_x = next_x + np.where(direction == 1, size, 0)
+        wall = tilemap.solid_mask(check_x, y + size - 1)
+
+        # 2) Blocking lemming in front → turn around
+        next_px = _to_px_array(next_x)
+        blocked = np.zeros(len(walkers), dtype=bool)
+        if self._blockers:
+            bx, by = self._blocker_arrays()
+            for ox, oy in zip(bx, by):
+                blocked |= ((next_px < ox + size) & (next_px + size > ox)
+                            & (y < oy + size) & (y + size > oy))
+        turn = wall | (~wall & blocked)
+        self.direction[walkers[turn]] = -direction[turn]
+
+        # 3) No ground ahead → start falling
+        moving = ~turn
+        ahead_px = x + half + half * direction
+        no_ground = moving & ~tilemap.solid_mask(ahead_px, y + size + 1)
+        falling = walkers[no_ground]
+        self.state[falling] = FALLING
+        self.vy[falling] = 0
+
+        # 4) All clear → move horizontally
+        step = moving & ~no_ground
+        self.x[walkers[step]] = next_px[step]
+
+    def _fall_batch(self, fallers, tilemap):
+        size = self.size
+        umbrella = self.umbrella[fallers]
+        g = np.where(umbrella, UMBRELLA_GRAVITY, GRAVITY)
+        max_speed = np.where(umbrella, UMBRELLA_MAX_FALL_SPEED, MAX_FALL_SPEED)
+        vy = np.minimum(self.vy[fallers] + g, max_speed)
+        y = _to_px_array(self.y[fallers] + vy)
+
+        foot_y = y + size
+        landed = tilemap.solid_mask(self.x[fallers] + size // 2, foot_y + 1)
+        y[landed] = (foot_y[landed] // TILE_SIZE) * TILE_SIZE - size
+        vy[landed] = 0
+        self.y[fallers] = y
+        self.vy[fallers] = vy
+        self.state[fallers[landed]] = WALKING
+
+    def _step_one(self, i, tilemap, zones):
+        """
+        Scalar path mirroring Lemming.update for one slot, followed by the
+        Level's exit/fall-off checks. Returns 1 if the lemming exited.
+        """
+        skill = self.skill[i]
+        state = self.state[i]
+        if skill == SKILL_CODES["dig"] and state == WALKING:
+            self.state[i] = DIGGING
+            self.skill[i] = NO_SKILL
+        elif skill == SKILL_CODES["build"] and state == WALKING:
+            self.state[i] = BUILDING
+            self.skill[i] = NO_SKILL
+        elif skill == SKILL_CODES["block"] and state in (WALKING, FALLING):
+            self.state[i] = BLOCKING
+            self.vx[i] = 0
+            self.vy[i] = 0
+            self.skill[i] = NO_SKILL
+            self._blockers.append(i)
+            self._blockers.sort()
+            self._blocker_xy = None
+        elif skill == SKILL_CODES["umbrella"] and state in (WALKING, FALLING):
+            self.umbrella[i] = True
+            self.skill[i] = NO_SKILL
+
+        state = self.state[i]
+        if state == WALKING:
+            self._walk_one(i, tilemap)
+        elif state == FALLING:
+            self._fall_one(i, tilemap)
+        elif state == DIGGING:
+            col = int((self.x[i] + self.size // 2) // TILE_SIZE)
+            row = int((self.y[i] + self.size) // TILE_SIZE)
+            tilemap.remove_tile(col, row)
+            self.state[i] = FALLING
+            self.vy[i] = 0
+        elif state == BUILDING:
+            col = int((self.x[i] + self.size // 2) // TILE_SIZE)
+            row = int((self.y[i] + self.size) // TILE_SIZE)
+            tilemap.add_tile(col + int(self.direction[i]), row - 1, "#")
+            self.state[i] = WALKING
+
+        return self._retire(np.array([i]), tilemap, zones)
+
+    def _walk_one(self, i, tilemap):
+        size = self.size
+        x = int(self.x[i])
+        y = int(self.y[i])
+        direction = int(self.direction[i])
+        next_x = x + float(self.vx[i]) * direction
+
+        check_x = next_x + (size if direction == 1 else 0)
+        if tilemap.is_solid_at_pixel(check_x, y + size - 1):
+            self.direction[i] = -direction
+            return
+
+        next_px = to_px(next_x)
+        for other in self._blockers:
+            if other != i:
+                ox = self.x[other]
+                oy = self.y[other]
+                if (next_px < ox + size and next_px + size > ox
+                        and y < oy + size and y + size > oy):
+                    self.direction[i] = -direction
+                    return
+
+        ahead_px = x + size // 2 + (size // 2) * direction
+        if not tilemap.is_solid_at_pixel(ahead_px, y + size + 1):
+            self.state[i] = FALLING
+            self.vy[i] = 0
+            return
+
+        self.x[i] = next_px
+
+    def _fall_one(self, i, tilemap):
+        size = self.size
+        if self.umbrella[i]:
+            g = UMBRELLA_GRAVITY
+            max_speed = UMBRELLA_MAX_FALL_SPEED
+        else:
+            g = GRAVITY
+            max_speed = MAX_FALL_SPEED
+        vy = min(float(self.vy[i]) + g, max_speed)
+        y = to_px(int(self.y[i]) + vy)
+        self.vy[i] = vy
+
+        foot_y = y + size
+        if tilemap.is_solid_at_pixel(int(self.x[i]) + size // 2, foot_y + 1):
+            y = (foot_y // TILE_SIZE) * TILE_SIZE - size
+            self.state[i] = WALKING
+            self.vy[i] = 0
+        self.y[i] = y
+
+    # ------------------------------------------------------------------
+    # Drawing
+    # ------------------------------------------------------------------
+
+    def draw(self, surface, camera, areas=None, positions=None):
+        """
+        Blit every alive lemming inside the camera (see
+        draw_lemming_arrays). positions, (xs, ys) arrays in live_slots()
+        order, overrides where they are.
+        """
+        slots = self.live_slots()
+        if positions is None:
+            positions = (self.x[slots], self.y[slots])
+        draw_lemming_arrays(surface, camera, positions[0], positions[1],
+                            self.state[slots], self.umbrella[slots], areas)
+
+
+_frames = None
+
+
+def _draw_frames():
+    """
+    (area, dx, dy) in the sprite atlas for each draw code: the state
+    code, plus len(STATE_NAMES) when the umbrella is shown.
+    """
+    global _frames
+    if _frames is None:
+        atlas = sprite_atlas()
+        _frames = []
+        for umbrella in (False, True):
+            for name in STATE_NAMES:
+                area, (dx, dy) = atlas.frame(name, umbrella)
+                _frames.append((area, dx, dy))
+    return _frames
+
+
+def draw_lemming_arrays(surface, camera, xs, ys, states, umbrellas, areas=None):
+    """
+    Blit the lemmings at world positions xs, ys (with state codes and
+    umbrella flags) that are inside the camera, at (world-coords minus
+    camera), with an umbrella over those falling with one, in a single
+    Surface.blits() call from the sprite atlas. With areas (screen
+    rects), only the parts of lemmings inside them are drawn.
+    """
+    size = LEMMING_SIZE
+    xs = xs - camera.x
+    ys = ys - camera.y
+    visible = ((xs < camera.width) & (xs + size + 1 > 0)
+               & (ys - UMBRELLA_HEIGHT < camera.height) & (ys + size > 0))
+    if areas is not None:
+        touching = np.zeros(len(xs), dtype=bool)
+        for ax, ay, aw, ah in areas:
+            touching |= ((xs < ax + aw) & (xs + size + 1 > ax)
+                         & (ys - UMBRELLA_HEIGHT < ay + ah) & (ys + size > ay))
+        visible &= touching
+    states = states[visible]
+    codes = states + len(STATE_NAMES) * ((states == FALLING) & umbrellas[visible])
+
+    atlas = sprite_atlas().surface
+    frames = _draw_frames()
+    blits = []
+    for x, y, code in zip(xs[visible].tolist(), ys[visible].tolist(), codes.tolist()):
+        area, dx, dy = frames[code]
+        blits.append((atlas, (x + dx, y + dy), area))
+    if areas is not None:
+        blits = clip_blits(blits, areas)
+    surface.blits(blits, False)
+
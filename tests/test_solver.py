@@ -0,0 +1,35 @@
+# tests/test_solver.py
+"""
+The solver must find a minimal schedule on a map that needs more than one
+skill, within its default budget, and the schedule must beat the level.
+"""
+
+from batch import play
+from level import Level
+from solver import solve
+
+# Lemmings spawn on the top floor, above two closed corridors; the exits
+# are under the bottom one. A dig through each floor opens the way.
+TWO_FLOORS = [
+    "..........",
+    "#........#",
+    "##########",
+    "#........#",
+    "##########",
+    "#EEEEEEEE#",
+    "##########",
+]
+
+
+def test_two_digs(tmp_path):
+    map_file = tmp_path / "two_floors.txt"
+    map_file.write_text("\n".join(TWO_FLOORS) + "\n")
+
+    result = solve(str(map_file), target_exits=2)
+    assert result.solved, str(result)
+    assert len(result.solution) == 2
+    assert all(skill == "dig" for _, _, skill in result.solution)
+
+    level = Level(str(map_file), 800, 600, target_exits=2, headless=True, quiet=True)
+    assert play(level, result.solution, 3600) == 0
+    assert level.completed
@@ -0,0 +1,57 @@
+# tests/test_swarm_parity.py
+"""
+The swarm engine must simulate exactly what the sprite engine does: the
+same spawns and skill assignments give the same state hash after every
+tick, on level1 and on random maps.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from level import Level
+from swarm import SKILL_CODES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEVEL1 = os.path.join(ROOT, "level1_map.txt")
+
+
+def random_map(path, seed, rows=40, cols=80):
+    """A text map of random terrain and exits, open around the spawn point."""
+    rng = np.random.RandomState(seed)
+    grid = rng.choice(list(".#E"), size=(rows, cols), p=[0.72, 0.25, 0.03])
+    grid[:6, :8] = "."
+    grid[-1] = "#"
+    path.write_text("\n".join("".join(row) for row in grid) + "\n")
+    return str(path)
+
+
+def assert_parity(map_file, ticks, spawn_every=6, skill_every=37):
+    skills = list(SKILL_CODES)
+    levels = [Level(map_file, 800, 600, target_exits=10**9, engine=engine, headless=True)
+              for engine in ("sprites", "swarm")]
+    for level in levels:
+        level.spawn_interval = spawn_every * 1000 / level.tick_rate
+
+    for tick in range(ticks):
+        if tick % skill_every == 0:
+            lemming_id = (tick // skill_every) * 7 % max(levels[0].spawned, 1)
+            skill = skills[(tick // skill_every) % len(skills)]
+            assigned = [level.assign_skill_to(lemming_id, skill) for level in levels]
+            assert assigned[0] == assigned[1], f"tick {tick}"
+        for level in levels:
+            level.update()
+        sprites, swarm = levels
+        assert sprites.exit_count == swarm.exit_count, f"tick {tick}"
+        assert sprites.state_hash() == swarm.state_hash(), f"tick {tick}"
+    assert levels[0].spawned > 0
+
+
+def test_level1():
+    assert_parity(LEVEL1, 3000)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_random_map(tmp_path, seed):
+    assert_parity(random_map(tmp_path / f"random{seed}.txt", seed), 1500)
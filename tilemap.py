@@ -1,8 +1,17 @@
 # tilemap.py
 
+import numpy as np
 import pygame
 
+from level_format import EMPTY, SOLID, EXIT, TILE_CODES, TILE_CHARS, load_level
+
 TILE_SIZE = 16  # pixels per tile
+CHUNK_SIZE = 16  # tiles per side of a cached terrain chunk
+
+TILE_COLORS = {
+    SOLID: (100, 100, 100),
+    EXIT: (50, 50, 200),
+}
 
 class TileMap:
     """
@@ -10,82 +19,341 @@ class TileMap:
       - '#' = solid ground (drawn as a filled gray rectangle)
       - '.' = empty (nothing drawn)
       - 'E' = exit (drawn as a filled blue rectangle)
+
+    Tiles are stored as integer codes (EMPTY/SOLID/EXIT) in a flat,
+    row-major bytearray (or a copy-on-write mmap for raw binary levels).
+    ``grid`` is a (rows, cols) uint8 NumPy view of the same memory, used by
+    the batched pixel queries.
+
+    Binary levels may also carry a spawn point and exit target, exposed as
+    ``spawn_point`` and ``target_exits`` (None when not given).
+
+    Terrain is pre-rendered into CHUNK_SIZE × CHUNK_SIZE tile surfaces.
+    Only chunks overlapping the camera are blitted, and a chunk is
+    re-rendered only after one of its tiles changes.
+
+    The whole grid is held in memory; see chunked_tilemap.ChunkedTileMap
+    for worlds streamed from disk.
     """
 
-    def __init__(self, map_file):
-        # Load from a text file (e.g., 'level1_map.txt')
-        self.map_data = self._load_map_data(map_file)
-        self.rows = len(self.map_data)
-        self.cols = len(self.map_data[0]) if self.rows > 0 else 0
+    streaming = False  # True for maps that load their tiles on demand
+
+    def __init__(self, map_file, quiet=False):
+        # Load from a text or binary level file (e.g., 'level1_map.txt')
+        self.rows, self.cols, self.tiles = self._load_map_data(map_file)
+        self.grid = np.frombuffer(self.tiles, dtype=np.uint8).reshape(self.rows, self.cols)
         self.width = self.cols * TILE_SIZE
         self.height = self.rows * TILE_SIZE
+        self._init_caches()
+
         # tilemap.py, at the end of __init__:
-        print(f"[TileMap] Loaded map: {self.rows} rows × {self.cols} cols  (pixels: {self.width}×{self.height})")
+        if not quiet:
+            print(f"[TileMap] Loaded map: {self.rows} rows × {self.cols} cols  (pixels: {self.width}×{self.height})")
+
+    def _init_caches(self):
+        """Set up the render, snapshot and table state for a freshly loaded map."""
+        # Rendered chunk surfaces keyed by (chunk_col, chunk_row)
+        self._chunks = {}
+        self._dirty_chunks = set()
+        # When record_changes is set, (col, row) of every tile edit is kept
+        # until drained by pop_changed_tiles()
+        self.record_changes = False
+        self._changed_tiles = []
+
+        # Copy-on-write snapshots (see snapshot_tiles): the as-loaded bytes
+        # of every chunk ever edited, the chunk bytes as of the last
+        # snapshot/restore (shared with that snapshot), and the chunks
+        # edited since then
+        self._pristine = {}
+        self._captured = {}
+        self._edited_since = set()
 
+        # Called as listener(col, row, old_code, new_code) after every tile
+        # edit (see add_listener)
+        self._listeners = []
+
+        # Terrain lookup tables, built on first use (see _build_tables)
+        self._solid_below = None
+        self._exit_below = None
 
     def _load_map_data(self, map_file):
-        with open(map_file, "r") as f:
-            lines = [line.rstrip("\n") for line in f]
-        return [list(line) for line in lines]
+        """
+        Load a level file into (rows, cols, tiles), keeping the optional
+        spawn point and exit target from its header.
+        """
+        data = load_level(map_file)
+        self.spawn_point = data.spawn_point
+        self.target_exits = data.target_exits
+        return data.rows, data.cols, data.tiles
 
-    def is_solid_at_pixel(self, x, y):
+    @property
+    def map_data(self):
         """
-        Return True if the tile at world-pixel (x, y) is '#'.
+        The map as a list of lists of tile characters. This is a copy;
+        edit tiles through add_tile/remove_tile.
         """
+        return [
+            [TILE_CHARS.get(code, ".") for code in self.tiles[r * self.cols:(r + 1) * self.cols]]
+            for r in range(self.rows)
+        ]
+
+    def get_tile(self, col, row):
+        """
+        Return the tile code at (col, row), or EMPTY outside the map.
+        """
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.tiles[row * self.cols + col]
+        return EMPTY
+
+    def _code_at_pixel(self, x, y):
         col = int(x // TILE_SIZE)
         row = int(y // TILE_SIZE)
-        if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
-            return False
-        return self.map_data[row][col] == "#"
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.tiles[row * self.cols + col]
+        return EMPTY
+
+    def is_solid_at_pixel(self, x, y):
+        """
+        Return True if the tile at world-pixel (x, y) is '#'.
+        """
+        return self._code_at_pixel(x, y) == SOLID
 
     def is_exit_at_pixel(self, x, y):
         """
         Return True if the tile at world-pixel (x, y) is 'E'.
         """
-        col = int(x // TILE_SIZE)
-        row = int(y // TILE_SIZE)
-        if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
-            return False
-        return self.map_data[row][col] == "E"
+        return self._code_at_pixel(x, y) == EXIT
+
+    def codes_at_pixels(self, xs, ys):
+        """
+        Batched lookup: return a uint8 array with the tile code under each
+        world-pixel (xs[i], ys[i]). Pixels outside the map read as EMPTY.
+        """
+        cols = np.floor_divide(np.asarray(xs), TILE_SIZE).astype(np.intp)
+        rows = np.floor_divide(np.asarray(ys), TILE_SIZE).astype(np.intp)
+        inside = (cols >= 0) & (cols < self.cols) & (rows >= 0) & (rows < self.rows)
+        codes = np.zeros(cols.shape, dtype=np.uint8)
+        codes[inside] = self.grid[rows[inside], cols[inside]]
+        return codes
+
+    def solid_mask(self, xs, ys):
+        """
+        Batched is_solid_at_pixel: boolean mask over arrays of pixel coordinates.
+        """
+        return self.codes_at_pixels(xs, ys) == SOLID
+
+    def exit_mask(self, xs, ys):
+        """
+        Batched is_exit_at_pixel: boolean mask over arrays of pixel coordinates.
+        """
+        return self.codes_at_pixels(xs, ys) == EXIT
+
+    # ------------------------------------------------------------------
+    # Terrain tables
+    #
+    # _solid_below[r, c] / _exit_below[r, c]: first row >= r in column c
+    #     holding a solid / exit tile, or self.rows if there is none
+    #
+    # An edit only recomputes the column it touched.
+    # ------------------------------------------------------------------
+
+    def _build_tables(self):
+        dtype = np.int16 if max(self.rows, self.cols) < 2**15 - 1 else np.int32
+        self._solid_below = np.empty((self.rows, self.cols), dtype=dtype)
+        self._exit_below = np.empty((self.rows, self.cols), dtype=dtype)
+        self._update_columns(slice(None))
+
+    def _update_columns(self, cols):
+        row_index = np.arange(self.rows)[:, None]
+        for code, table in ((SOLID, self._solid_below), (EXIT, self._exit_below)):
+            found = np.where(self.grid[:, cols] == code, row_index, self.rows)
+            table[:, cols] = np.minimum.accumulate(found[::-1], axis=0)[::-1]
+
+    def _update_tables(self, cols):
+        if self._solid_below is not None:
+            self._update_columns(cols)
+
+    def solid_row_below(self, col, row):
+        """
+        First row at or below row in column col that is solid, or
+        self.rows if the column is open all the way down.
+        """
+        if not 0 <= col < self.cols or row >= self.rows:
+            return self.rows
+        if self._solid_below is None:
+            self._build_tables()
+        return int(self._solid_below[max(row, 0), col])
+
+    def exit_row_below(self, col, row):
+        """First row at or below row in column col holding an exit, or self.rows."""
+        if not 0 <= col < self.cols or row >= self.rows:
+            return self.rows
+        if self._exit_below is None:
+            self._build_tables()
+        return int(self._exit_below[max(row, 0), col])
 
     def remove_tile(self, col, row):
         """
         Replace the tile at (col, row) with '.' (digging).
         """
-        if 0 <= row < self.rows and 0 <= col < self.cols:
-            self.map_data[row][col] = "."
+        self._set_tile(col, row, EMPTY)
 
     def add_tile(self, col, row, tile_char="#"):
         """
         Place a tile (by default '#') at (col, row).
         """
+        self._set_tile(col, row, TILE_CODES.get(tile_char, EMPTY))
+
+    def add_listener(self, listener):
+        """
+        Publish tile changes to listener: it is called as listener(col,
+        row, old_code, new_code) after add_tile/remove_tile changes a tile,
+        in the order listeners were added. Restoring a snapshot
+        (restore_tiles) doesn't publish changes.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _set_tile(self, col, row, code):
         if 0 <= row < self.rows and 0 <= col < self.cols:
-            self.map_data[row][col] = tile_char
+            old = self.get_tile(col, row)
+            if old != code:
+                key = (col // CHUNK_SIZE, row // CHUNK_SIZE)
+                if key not in self._pristine:
+                    self._pristine[key] = self._chunk_bytes(key)
+                self._edited_since.add(key)
+                self._store_tile(col, row, code)
+                self._mark_dirty(col, row)
+                if self.record_changes:
+                    self._changed_tiles.append((col, row))
+                for listener in self._listeners:
+                    listener(col, row, old, code)
+
+    def _store_tile(self, col, row, code):
+        self.tiles[row * self.cols + col] = code
+        self._update_tables(slice(col, col + 1))
+
+    def _tile_block(self, key):
+        """Writable (rows, cols) array of the tile codes in one chunk."""
+        chunk_col, chunk_row = key
+        return self.grid[chunk_row * CHUNK_SIZE:(chunk_row + 1) * CHUNK_SIZE,
+                         chunk_col * CHUNK_SIZE:(chunk_col + 1) * CHUNK_SIZE]
+
+    def _chunk_bytes(self, key):
+        return self._tile_block(key).tobytes()
+
+    def _write_chunk(self, key, data):
+        chunk_col, chunk_row = key
+        block = self._tile_block(key)
+        block[...] = np.frombuffer(data, dtype=np.uint8).reshape(block.shape)
+        self._update_tables(slice(chunk_col * CHUNK_SIZE, (chunk_col + 1) * CHUNK_SIZE))
+        self._mark_dirty(chunk_col * CHUNK_SIZE, chunk_row * CHUNK_SIZE)
 
-    def draw(self, surface, camera_offset=(0, 0)):
+    def snapshot_tiles(self):
         """
-        Draw each tile as a filled rect:
+        Capture the tiles for restore_tiles(). The snapshot only holds the
+        chunks ever edited, and shares the bytes of every chunk not edited
+        since the previous snapshot with it, so the cost is proportional to
+        the edits, not the map size.
+        """
+        if self._edited_since:
+            chunks = dict(self._captured)
+            for key in self._edited_since:
+                chunks[key] = self._chunk_bytes(key)
+            self._captured = chunks
+            self._edited_since = set()
+        return self._captured
+
+    def restore_tiles(self, saved):
+        """
+        Put the tiles back to a snapshot_tiles() capture. Only chunks that
+        differ are written (and re-rendered on the next draw).
+        """
+        current = self._captured
+        stale = set(self._edited_since)
+        for key in current.keys() | saved.keys():
+            if current.get(key) is not saved.get(key):
+                stale.add(key)
+        for key in stale:
+            data = saved.get(key)
+            self._write_chunk(key, data if data is not None else self._pristine[key])
+        self._captured = saved
+        self._edited_since = set()
+
+    def update_hash(self, h):
+        """Feed every tile code, row-major, into the hashlib object h."""
+        h.update(self.tiles)
+
+    def pop_changed_tiles(self):
+        """
+        Return the (col, row) of tiles edited since the last call, and forget them.
+        """
+        changed = self._changed_tiles
+        self._changed_tiles = []
+        return changed
+
+    def _mark_dirty(self, col, row):
+        """Flag the chunk containing (col, row) for re-rendering."""
+        key = (col // CHUNK_SIZE, row // CHUNK_SIZE)
+        if key in self._chunks:
+            self._dirty_chunks.add(key)
+
+    def _render_chunk(self, chunk_col, chunk_row):
+        """
+        Render (or re-render) one chunk onto its cached surface.
+        Empty tiles are left transparent via a black colorkey.
+        """
+        key = (chunk_col, chunk_row)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            size = CHUNK_SIZE * TILE_SIZE
+            chunk = pygame.Surface((size, size))
+            chunk.set_colorkey((0, 0, 0))
+            self._chunks[key] = chunk
+        chunk.fill((0, 0, 0))
+
+        block = self._tile_block(key)
+        for code, color in TILE_COLORS.items():
+            for r, c in zip(*np.nonzero(block == code)):
+                chunk.fill(color, (int(c) * TILE_SIZE, int(r) * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+        self._dirty_chunks.discard(key)
+        return chunk
+
+    def draw(self, surface, camera_offset=(0, 0), area=None):
+        """
+        Blit every cached chunk that overlaps the visible area:
          - '#' = dark gray
          - 'E' = blue
          - '.' = skip
+        If area (a screen-space rect) is given, only that part of the
+        surface is drawn.
         """
         cam_x, cam_y = camera_offset
-        for row_idx, row in enumerate(self.map_data):
-            for col_idx, tile_char in enumerate(row):
-                if tile_char == "#":
-                    rect = pygame.Rect(
-                        col_idx * TILE_SIZE - cam_x,
-                        row_idx * TILE_SIZE - cam_y,
-                        TILE_SIZE,
-                        TILE_SIZE
-                    )
-                    pygame.draw.rect(surface, (100, 100, 100), rect)
-                elif tile_char == "E":
-                    rect = pygame.Rect(
-                        col_idx * TILE_SIZE - cam_x,
-                        row_idx * TILE_SIZE - cam_y,
-                        TILE_SIZE,
-                        TILE_SIZE
-                    )
-                    pygame.draw.rect(surface, (50, 50, 200), rect)
-                # if '.', do nothing
+        chunk_px = CHUNK_SIZE * TILE_SIZE
+        if area is None:
+            view_x, view_y = 0, 0
+            view_w, view_h = surface.get_size()
+        else:
+            view_x, view_y, view_w, view_h = area
+            old_clip = surface.get_clip()
+            surface.set_clip(old_clip.clip(area))
+
+        left = cam_x + view_x
+        top = cam_y + view_y
+        first_col = max(0, int(left // chunk_px))
+        first_row = max(0, int(top // chunk_px))
+        last_col = min((self.cols - 1) // CHUNK_SIZE, int((left + view_w - 1) // chunk_px))
+        last_row = min((self.rows - 1) // CHUNK_SIZE, int((top + view_h - 1) // chunk_px))
+
+        for chunk_row in range(first_row, last_row + 1):
+            for chunk_col in range(first_col, last_col + 1):
+                key = (chunk_col, chunk_row)
+                chunk = self._chunks.get(key)
+                if chunk is None or key in self._dirty_chunks:
+                    chunk = self._render_chunk(chunk_col, chunk_row)
+                surface.blit(chunk, (chunk_col * chunk_px - cam_x, chunk_row * chunk_px - cam_y))
+
+        if area is not None:
+            surface.set_clip(old_clip)
@@ -2,8 +2,17 @@
 
 import pygame
 
+from fonts import LazyFont
+
 SKILLS = ["dig", "build", "block", "umbrella"]
 
+SKILL_COLORS = {
+    "dig": (220, 70, 70),
+    "build": (70, 70, 220),
+    "block": (220, 220, 70),
+    "umbrella": (150, 150, 220),
+}
+
 
 def _draw_gradient_rect(surface, rect, color1, color2):
     """Draw a simple vertical gradient"""
@@ -22,6 +31,10 @@ class SkillToolbar:
       - build = blue
       - block = yellow
     Click to select/deselect a skill.
+
+    The bar background (gradient, icons, selection ring) is pre-rendered and
+    only rebuilt when the width or selection changes; the HUD text surface
+    is re-rendered only when the values it shows change.
     """
 
     def __init__(self):
@@ -30,9 +43,8 @@ class SkillToolbar:
         self.bar_height = self.icon_size + 2 * self.icon_padding
         self.selected_skill = None
 
-        # Font for HUD information
-        pygame.font.init()
-        self.font = pygame.font.SysFont(None, 20)
+        # Font for HUD information, loaded when the HUD is first drawn
+        self.font = LazyFont(20)
 
         # Precompute rectangles for each skill
         self.icon_rects = []
@@ -43,6 +55,10 @@ class SkillToolbar:
             self.icon_rects.append(rect)
             x += self.icon_size + self.icon_padding
 
+        # Cached renders: (key, surface)
+        self._background = (None, None)
+        self._hud_text = (None, None)
+
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             mx, my = event.pos
@@ -55,37 +71,86 @@ class SkillToolbar:
                         self.selected_skill = skill
                     return  # only one can be toggled per click
 
-    def draw(self, surface, level=None):
-        # Draw background bar with a subtle gradient
-        bar_rect = pygame.Rect(0, 0, surface.get_width(), self.bar_height)
-        _draw_gradient_rect(surface, bar_rect, (40, 40, 40), (25, 25, 25))
-
-        # Draw each skill as a colored circle
-        color_map = {
-            "dig": (220, 70, 70),
-            "build": (70, 70, 220),
-            "block": (220, 220, 70),
-            "umbrella": (150, 150, 220),
-        }
+    def hud_values(self, level):
+        """The numbers shown in the HUD: exits, target, score, seconds."""
+        return (level.exit_count, level.target_exits,
+                int(level.get_score()), int(level.get_elapsed_time()))
+
+    def hud_info(self, level):
+        """The HUD text shown on the right of the bar."""
+        exits, target, score, seconds = self.hud_values(level)
+        return f"Exits: {exits}/{target} | Score: {score} | Time: {seconds}s"
+
+    def state_key(self, surface, level=None):
+        """
+        A value that changes whenever draw() would produce different pixels.
+        """
+        values = self.hud_values(level) if level is not None else None
+        return (surface.get_width(), self.selected_skill, values)
+
+    def _get_background(self, width):
+        key = (width, self.selected_skill)
+        cached_key, background = self._background
+        if cached_key == key:
+            return background
+
+        background = pygame.Surface((width, self.bar_height))
+        # Background bar with a subtle gradient
+        _draw_gradient_rect(background, background.get_rect(), (40, 40, 40), (25, 25, 25))
+
+        # Each skill as a colored circle
         for idx, rect in enumerate(self.icon_rects):
-            color = color_map.get(SKILLS[idx], (200, 200, 200))
+            color = SKILL_COLORS.get(SKILLS[idx], (200, 200, 200))
             center = rect.center
             radius = rect.width // 2 - 2
-            pygame.draw.circle(surface, color, center, radius)
+            pygame.draw.circle(background, color, center, radius)
 
             # If selected, draw a white border around the circle
             if SKILLS[idx] == self.selected_skill:
-                pygame.draw.circle(surface, (255, 255, 255), center, radius + 2, 2)
+                pygame.draw.circle(background, (255, 255, 255), center, radius + 2, 2)
+
+        self._background = (key, background)
+        return background
+
+    def _get_hud_text(self, level):
+        values = self.hud_values(level)
+        cached_values, text_surf = self._hud_text
+        if cached_values != values:
+            text_surf = self.font.render(self.hud_info(level), True, (240, 240, 240))
+            self._hud_text = (values, text_surf)
+        return text_surf
+
+    def draw(self, surface, level=None):
+        surface.blit(self._get_background(surface.get_width()), (0, 0))
 
         # Draw HUD info on the right
         if level is not None:
-            info = (
-                f"Exits: {level.exit_count}/{level.target_exits} | "
-                f"Score: {int(level.get_score())} | "
-                f"Time: {int(level.get_elapsed_time())}s"
-            )
-            text_surf = self.font.render(info, True, (240, 240, 240))
+            text_surf = self._get_hud_text(level)
             text_rect = text_surf.get_rect()
             text_rect.top = self.icon_padding
             text_rect.right = surface.get_width() - self.icon_padding
             surface.blit(text_surf, text_rect)
+
+    def draw_profiler_overlay(self, surface, profiler):
+        """
+        Draw the profiler's last frame below the toolbar: frame time, the
+        slowest scopes and the counters.
+        """
+        if not profiler.enabled:
+            return
+        lines = [f"frame {profiler.last_frame_time * 1000:6.2f} ms"]
+        scopes = sorted(profiler.last_frame.items(), key=lambda item: -item[1][0])
+        for name, (seconds, calls) in scopes[:12]:
+            lines.append(f"{name:<16}{seconds * 1000:7.2f} ms  x{calls}")
+        for name, value in sorted(profiler.last_counters.items()):
+            lines.append(f"{name:<16}{value:>10}")
+
+        pad = self.icon_padding // 2
+        line_height = self.font.get_linesize()
+        panel = pygame.Surface((260, line_height * len(lines) + 2 * pad), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        y = pad
+        for line in lines:
+            panel.blit(self.font.render(line, True, (200, 240, 200)), (pad, y))
+            y += line_height
+        surface.blit(panel, (0, self.bar_height))
@@ -0,0 +1,64 @@
+# zones.py
+"""
+Trigger zones: parts of the map that act on a lemming whose center is
+in them. Exit tiles are EXIT_ZONE (the lemming is saved) and everything
+below the map is KILL_ZONE (the lemming is lost once it has fallen fully
+out of the map).
+
+Tile zones come from the tile codes (ZONE_TILES), so a new kind of zone
+is a new tile code plus an entry there. A ZoneIndex looks zones up and
+listens to its tilemap's tile-change events: whenever an edit changes the
+zone of a tile, its listeners are told, so Level only has to look a
+lemming up when its center moves into another tile or its tile's zone
+changes, instead of every tick.
+"""
+
+import numpy as np
+
+from level_format import EXIT
+
+NO_ZONE = 0
+EXIT_ZONE = 1
+KILL_ZONE = 2
+
+# Tile code -> zone of the tiles with that code
+ZONE_TILES = {EXIT: EXIT_ZONE}
+
+_ZONE_OF_CODE = np.zeros(256, dtype=np.uint8)
+for _code, _zone in ZONE_TILES.items():
+    _ZONE_OF_CODE[_code] = _zone
+
+
+class ZoneIndex:
+    """
+    The zone of every tile of a tilemap, kept current from its tile-change
+    events. add_listener(listener) has listener(col, row, old_zone,
+    new_zone) called whenever an edit changes a tile's zone.
+    """
+
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self._listeners = []
+        tilemap.add_listener(self._tile_changed)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def zone_at(self, col, row):
+        """The zone of tile (col, row); rows below the map are KILL_ZONE."""
+        if row >= self.tilemap.rows:
+            return KILL_ZONE
+        return int(_ZONE_OF_CODE[self.tilemap.get_tile(col, row)])
+
+    def zones_at_pixels(self, xs, ys):
+        """Batched zone_at for the tiles under world pixels xs, ys."""
+        zones = _ZONE_OF_CODE[self.tilemap.codes_at_pixels(xs, ys)]
+        zones[np.asarray(ys) >= self.tilemap.height] = KILL_ZONE
+        return zones
+
+    def _tile_changed(self, col, row, old_code, new_code):
+        old_zone = int(_ZONE_OF_CODE[old_code])
+        new_zone = int(_ZONE_OF_CODE[new_code])
+        if old_zone != new_zone:
+            for listener in self._listeners:
+                listener(col, row, old_zone, new_zone)